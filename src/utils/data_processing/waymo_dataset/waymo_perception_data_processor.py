@@ -12,22 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import abc
+import concurrent.futures
+import contextlib
+import dataclasses
 import enum
-import math
+import json
 import os
 import subprocess
-import threading
-from typing import List
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 from io import BytesIO
 from datasets import Dataset, Features, Value, Image as ImageFeature
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 import click
 
 from PIL import Image
 import glob
-from collections import defaultdict
 import logging
 
 logging.basicConfig(
@@ -122,158 +126,625 @@ WAYMO_LABEL_ID_TO_NAME = {member.value: member.name for member in LabelType}
 WAYMO_DATA_ROOT = "gs://waymo_open_dataset_v_2_0_1/training"
 LOCAL_DATA_ROOT = "./waymo_data"
 THREAD_COUNTS = 4
+DEFAULT_DOWNLOAD_WORKERS = 8
+EXECUTOR_PROCESS = "process"
+EXECUTOR_THREAD = "thread"
 CAMERA_IMAGE_DIR = os.path.join(LOCAL_DATA_ROOT, "camera_image")
 CAMERA_BOX_DIR = os.path.join(LOCAL_DATA_ROOT, "camera_box")
 
+# --- Parquet columns ---
+FRAME_TIMESTAMP_COLUMN = "key.frame_timestamp_micros"
+CAMERA_NAME_COLUMN = "key.camera_name"
+IMAGE_COLUMN = "[CameraImageComponent].image"
+BOX_TYPE_COLUMN = "[CameraBoxComponent].type"
+BOX_CENTER_X_COLUMN = "[CameraBoxComponent].box.center.x"
+BOX_SIZE_X_COLUMN = "[CameraBoxComponent].box.size.x"
+BOX_SIZE_Y_COLUMN = "[CameraBoxComponent].box.size.y"
+GROUP_KEY_COLUMNS = [FRAME_TIMESTAMP_COLUMN, CAMERA_NAME_COLUMN]
+# Only these columns are read from the input segments, plus the box_columns of
+# the selected QA generators.
+IMAGE_READ_COLUMNS = [FRAME_TIMESTAMP_COLUMN, CAMERA_NAME_COLUMN, IMAGE_COLUMN]
+BOX_READ_COLUMNS = [FRAME_TIMESTAMP_COLUMN, CAMERA_NAME_COLUMN, BOX_TYPE_COLUMN]
+# Number of camera images decoded from the Parquet file at once.
+READ_BATCH_SIZE = 64
+
+# --- Question/answer generation ---
+DEFAULT_QA_GENERATORS = ("objects",)
+# Width in pixels of the images of every Waymo camera.
+CAMERA_IMAGE_WIDTH = 1920
+# Upper bounds of the box area buckets in camera image pixels, the COCO
+# small/medium thresholds (32^2, 96^2 at 640 pixels) scaled to 1920 pixels.
+BOX_AREA_BUCKETS = {"small": 96**2, "medium": 288**2, "large": float("inf")}
+# Horizontal position of a box center, as a fraction of the image width.
+POSITION_BUCKETS = {"left": 1 / 3, "center": 2 / 3, "right": float("inf")}
+
+# --- Output ---
+# "dataset" builds a Hugging Face Dataset from PIL images, the other formats
+# store the resized images as encoded bytes streamed to Parquet.
+IMAGE_FORMAT_DATASET = "dataset"
+ENCODED_IMAGE_FORMATS = {"jpeg": "JPEG", "webp": "WEBP"}
+DEFAULT_IMAGE_QUALITY = 90
+OUTPUT_IMAGE_SIZE = (250, 200)
+RESAMPLING_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+SHARD_DIRNAME = "shards"
+SHARD_INDEX_FILENAME = "index.json"
+DEFAULT_ROW_GROUP_SIZE_MB = 64
+DATASET_FEATURES = Features(
+    {
+        "image": ImageFeature(),
+        "question": Value("string"),
+        "multiple_choice_answer": Value("string"),
+    }
+)
+
+
+def _run_gcloud(args: List[str]) -> str:
+    """Runs a gcloud storage command and returns its stdout."""
+    command = ["gcloud", "storage"] + args
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(
+            f"Command {' '.join(command)} failed with return code {e.returncode}: {e.stderr}"
+        ) from e
+    return result.stdout
+
+
+def list_remote_segments(remote_dir: str) -> dict:
+    """
+    Lists the Parquet objects of a GCS directory keyed by segment ID, with
+    their URL, size and CRC32C checksum.
+    """
+    objects = json.loads(
+        _run_gcloud(["objects", "list", f"{remote_dir}/*.parquet", "--format=json"])
+        or "[]"
+    )
+    remote_objects = {}
+    for obj in objects:
+        url = obj.get("storage_url") or f"gs://{obj['bucket']}/{obj['name']}"
+        remote_objects[segment_id_of(url)] = {
+            "url": url,
+            "size": int(obj["size"]),
+            "crc32c": obj.get("crc32c_hash"),
+        }
+    return remote_objects
+
+
+def select_segments(
+    segment_ids: List[str],
+    num_segments: Optional[int] = None,
+    selected_ids: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Returns the segments to process: the selected IDs that exist, or the first
+    num_segments segment IDs in sorted order, or all of them.
+    """
+    available = set(segment_ids)
+    if selected_ids:
+        missing = [
+            segment_id for segment_id in selected_ids if segment_id not in available
+        ]
+        if missing:
+            logger.warning(
+                f"[Dataloader] {len(missing)} selected segments were not found: {missing}"
+            )
+        return [segment_id for segment_id in selected_ids if segment_id in available]
+    return sorted(available)[:num_segments]
 
-def _download_dataset_locally(input_dir: str):
+
+def _local_crc32c(path: str) -> Optional[str]:
+    """Returns the base64 CRC32C checksum of a local file, as GCS reports it."""
+    output = json.loads(
+        _run_gcloud(["hash", path, "--skip-md5", "--format=json"]) or "null"
+    )
+    if isinstance(output, list):
+        output = output[0] if output else None
+    return (output or {}).get("crc32c_hash")
+
+
+def _is_present(local_path: str, remote_object: dict) -> bool:
+    if not os.path.exists(local_path):
+        return False
+    if os.path.getsize(local_path) != remote_object["size"]:
+        return False
+    return (
+        remote_object["crc32c"] is None
+        or _local_crc32c(local_path) == remote_object["crc32c"]
+    )
+
+
+def download_object(remote_object: dict, local_path: str) -> bool:
     """
-    Downloads dataset segments from GCS to local storage.
+    Downloads a GCS object to local_path, unless a file with the same size and
+    checksum is already present. The object is downloaded under a temporary
+    name, its checksum verified and then renamed.
+    Returns whether the object was downloaded.
     """
-    # Construct remote paths
-    remote_camera_image_path = os.path.join(WAYMO_DATA_ROOT, "camera_image")
-    remote_camera_box_path = os.path.join(WAYMO_DATA_ROOT, "camera_box")
+    if _is_present(local_path, remote_object):
+        return False
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with _atomic_output(local_path) as temp_path:
+        _run_gcloud(["cp", remote_object["url"], temp_path])
+        checksum = _local_crc32c(temp_path)
+        expected = remote_object["crc32c"]
+        if expected is not None and checksum != expected:
+            raise RuntimeError(
+                f"Checksum mismatch for {remote_object['url']}: {checksum} != {expected}"
+            )
+    return True
 
-    local_camera_image_target = os.path.join(input_dir, "camera_image")
-    local_camera_box_target = os.path.join(input_dir, "camera_box")
 
-    paths_to_download = [
-        (local_camera_image_target, remote_camera_image_path),
-        (local_camera_box_target, remote_camera_box_path),
+def download_segment(
+    input_dir: str, image_object: dict, box_object: Optional[dict]
+) -> Tuple[str, Optional[str]]:
+    """Downloads the image and box files of a segment, returns its work unit."""
+    work_unit = []
+    for kind, remote_object in (
+        ("camera_image", image_object),
+        ("camera_box", box_object),
+    ):
+        if remote_object is None:
+            work_unit.append(None)
+            continue
+        local_path = os.path.join(
+            input_dir, kind, os.path.basename(remote_object["url"])
+        )
+        if download_object(remote_object, local_path):
+            logger.info(f"[DATALOADER] Downloaded {remote_object['url']}.")
+        else:
+            logger.info(f"[DATALOADER] {local_path} is up to date, skipping download.")
+        work_unit.append(local_path)
+    return tuple(work_unit)
+
+
+def iter_downloaded_segments(
+    input_dir: str,
+    num_segments: Optional[int] = None,
+    segment_ids: Optional[List[str]] = None,
+    num_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+):
+    """
+    Downloads the selected segments from GCS and yields their (image file,
+    box file) work units as soon as both files of a segment are available,
+    so processing can start while later segments are still downloading.
+
+    Segments are downloaded by num_workers concurrent per-object transfers.
+    Files already present locally with the same size and checksum are not
+    downloaded again. Segments that fail to download are logged and skipped.
+    """
+    image_objects = list_remote_segments(f"{WAYMO_DATA_ROOT}/camera_image")
+    box_objects = list_remote_segments(f"{WAYMO_DATA_ROOT}/camera_box")
+    selected = select_segments(list(image_objects), num_segments, segment_ids)
+    missing_boxes = [
+        segment_id for segment_id in selected if segment_id not in box_objects
     ]
+    if missing_boxes:
+        logger.warning(
+            f"[DATALOADER] {len(missing_boxes)} segments have no box file: {missing_boxes}"
+        )
+    logger.info(
+        f"[DATALOADER] Downloading {len(selected)} of {len(image_objects)} segments with {num_workers} workers."
+    )
 
-    for local_path_dir, remote_path_item in paths_to_download:
-        os.makedirs(local_path_dir, exist_ok=True)
-        # The gsutil command needs to handle both file and directory copy.
-        # If remote_path_item ends with '.parquet', it's a file.
-        # Otherwise, it's a directory, so we append '/*' to copy its contents.
-        # The local_path_dir is always the target directory.
-        source_for_gsutil = remote_path_item
-        if not remote_path_item.endswith(".parquet"):
-            # If PARQUET_ID is empty, download all parquets in the directory
-            source_for_gsutil = os.path.join(remote_path_item, "*.parquet")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as pool:
+        futures = {
+            pool.submit(
+                download_segment,
+                input_dir,
+                image_objects[segment_id],
+                box_objects.get(segment_id),
+            ): segment_id
+            for segment_id in selected
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                logger.error(
+                    f"[Fatal][DATALOADER] Failed to download segment {futures[future]}: {e}"
+                )
 
-        gsutil_command = ["gcloud", "storage", "cp", "--recursive", source_for_gsutil, local_path_dir]
 
-        logger.info(
-            f"[DATALOADER] Downloading dataset. Command: {' '.join(gsutil_command)}"
+def read_image_batches(image_file: str, batch_size: int = READ_BATCH_SIZE):
+    """
+    Yields DataFrames of at most batch_size camera images of a segment file,
+    reading only IMAGE_READ_COLUMNS. Only one batch of encoded images is held
+    in memory at a time instead of the whole segment.
+    """
+    parquet_file = pq.ParquetFile(image_file)
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, columns=IMAGE_READ_COLUMNS
+    ):
+        yield batch.to_pandas()
+
+
+def read_box_file(box_file: str, columns: List[str] = BOX_READ_COLUMNS):
+    """Reads the given columns, by default BOX_READ_COLUMNS, of a camera box segment file."""
+    return pd.read_parquet(box_file, engine="pyarrow", columns=columns)
+
+
+def _label_names(box_types):
+    return box_types.map(WAYMO_LABEL_ID_TO_NAME).fillna("Unknown")
+
+
+class QAGenerator(abc.ABC):
+    """
+    Generates question/answer rows for camera images from their boxes.
+
+    group_boxes is called once per segment with the boxes of the segment and
+    returns one row per (frame timestamp, camera) group, keyed by
+    GROUP_KEY_COLUMNS. generate is called for each batch of images with the
+    image keys, an "image_name" column ("FRONT image at timestamp 123") and
+    the groups left-joined on the keys. It returns the "question" and "answer"
+    of zero or more rows per image, indexed by the row of the image in frames.
+    Both run vectorized over pandas columns, so generators share a single
+    pass over the data and every image is decoded once.
+
+    Attributes:
+        box_columns: Box columns read in addition to BOX_READ_COLUMNS.
+    """
+
+    box_columns: Tuple[str, ...] = ()
+
+    @abc.abstractmethod
+    def group_boxes(self, camera_box_df):
+        """Returns the rows of the groups of the boxes of a segment."""
+
+    @abc.abstractmethod
+    def generate(self, frames):
+        """Returns the question and answer rows of a batch of images."""
+
+
+class ObjectTypesQA(QAGenerator):
+    """Asks which object types are visible, for every image."""
+
+    def group_boxes(self, camera_box_df):
+        labels = camera_box_df[GROUP_KEY_COLUMNS + [BOX_TYPE_COLUMN]].drop_duplicates()
+        labels["label_name"] = _label_names(labels[BOX_TYPE_COLUMN])
+        # Sorting once up front keeps the names of every group in sorted order.
+        labels = labels.drop_duplicates(GROUP_KEY_COLUMNS + ["label_name"]).sort_values(
+            "label_name"
         )
-        try:
-            result = subprocess.run(
-                gsutil_command, capture_output=True, text=True, check=True
-            )
-            logger.info(f"[DATALOADER] Successfully downloaded to {local_path_dir}.")
-            if result.stdout:
-                logger.info(f"[DATALOADER] gcloud stdout: {result.stdout}")
-            if result.stderr:  # gsutil often prints status to stderr even on success
-                logger.info(f"[DATALOADER] gcloud stderr: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logger.error(
-                f"[Fatal][DATALOADER] Failed to download from {source_for_gsutil} to {local_path_dir}. "
-                f"Return code: {e.returncode}\n"
-                f"Stdout: {e.stdout}\n"
-                f"Stderr: {e.stderr}"
-            )
-            raise Exception(
-                f"Failed to download dataset from {source_for_gsutil}: {e.stderr}"
-            )
-        except Exception as e:
-            logger.error(
-                f"[Fatal][DATALOADER] An unexpected error occurred during download: {e}"
+        grouped = (
+            labels.groupby(GROUP_KEY_COLUMNS, sort=False)["label_name"]
+            .agg(", ".join)
+            .reset_index()
+        )
+        grouped["answer"] = "Objects: " + grouped["label_name"] + "."
+        return grouped.drop(columns="label_name")
+
+    def generate(self, frames):
+        has_objects = frames["answer"].notna()
+        questions = (
+            "What objects are visible in the " + frames["image_name"] + "?"
+        ).where(
+            has_objects,
+            "Are there any common objects visible in the " + frames["image_name"] + "?",
+        )
+        answers = frames["answer"].fillna("No common objects detected.")
+        return pd.DataFrame({"question": questions, "answer": answers})
+
+
+class ObjectCountsQA(QAGenerator):
+    """Asks how many objects of each type are visible, for images with boxes."""
+
+    def group_boxes(self, camera_box_df):
+        counts = (
+            camera_box_df.assign(
+                label_name=_label_names(camera_box_df[BOX_TYPE_COLUMN])
             )
-            raise
+            .groupby(GROUP_KEY_COLUMNS + ["label_name"])
+            .size()
+            .reset_index(name="count")
+            .sort_values(["count", "label_name"], ascending=[False, True])
+        )
+        counts["item"] = counts["count"].astype(str) + " " + counts["label_name"]
+        grouped = (
+            counts.groupby(GROUP_KEY_COLUMNS, sort=False)["item"]
+            .agg(", ".join)
+            .reset_index(name="counts")
+        )
+        return grouped
+
+    def generate(self, frames):
+        frames = frames[frames["counts"].notna()]
+        return pd.DataFrame(
+            {
+                "question": "How many objects of each type are visible in the "
+                + frames["image_name"]
+                + "?",
+                "answer": "Counts: " + frames["counts"] + ".",
+            }
+        )
+
+
+def _bucket(values, buckets: dict):
+    """Assigns each value to the first bucket whose upper bound is above it."""
+    return pd.cut(
+        values,
+        bins=[-float("inf")] + list(buckets.values()),
+        labels=list(buckets),
+        right=False,
+    )
+
+
+class BoxAreaQA(QAGenerator):
+    """Asks how many small, medium and large objects are visible, see BOX_AREA_BUCKETS."""
 
+    box_columns = (BOX_SIZE_X_COLUMN, BOX_SIZE_Y_COLUMN)
 
-def process_waymo_data(camera_image_df, camera_box_df):
+    def group_boxes(self, camera_box_df):
+        areas = camera_box_df[BOX_SIZE_X_COLUMN] * camera_box_df[BOX_SIZE_Y_COLUMN]
+        counts = (
+            camera_box_df[GROUP_KEY_COLUMNS]
+            .assign(bucket=_bucket(areas, BOX_AREA_BUCKETS))
+            .groupby(GROUP_KEY_COLUMNS + ["bucket"], observed=False)
+            .size()
+            .unstack("bucket", fill_value=0)
+            .reindex(columns=list(BOX_AREA_BUCKETS), fill_value=0)
+        )
+        counts = counts[counts.sum(axis=1) > 0]
+        answers = pd.Series("", index=counts.index)
+        for i, bucket in enumerate(BOX_AREA_BUCKETS):
+            separator = "" if i == 0 else ", "
+            answers += separator + bucket + ": " + counts[bucket].astype(str)
+        return answers.str.capitalize().rename("box_areas").reset_index()
+
+    def generate(self, frames):
+        frames = frames[frames["box_areas"].notna()]
+        return pd.DataFrame(
+            {
+                "question": "How many small, medium and large objects are visible in the "
+                + frames["image_name"]
+                + "?",
+                "answer": frames["box_areas"] + ".",
+            }
+        )
+
+
+class PositionQA(QAGenerator):
     """
-    Processes data for a single Waymo segment to extract images,
-    and generate questions/answers based on camera boxes.
-    Returns a list of dictionaries, each containing an image, question, and answer.
+    Asks where the object types are in the image, from left to right, see
+    POSITION_BUCKETS.
     """
-    segment_data = []
 
-    # Group camera boxes by frame timestamp and camera name for easier lookup
-    boxes_by_frame_camera = defaultdict(list)
-    if camera_box_df is not None:
-        for _, row in camera_box_df.iterrows():
-            frame_ts = row["key.frame_timestamp_micros"]
-            camera_name_int = row["key.camera_name"]
-            camera_name_str = CAMERA_NAME_MAP.get(camera_name_int, "UNKNOWN_CAMERA")
-            boxes_by_frame_camera[(frame_ts, camera_name_str)].append(row)
+    box_columns = (BOX_CENTER_X_COLUMN,)
 
-    if camera_box_df is not None:  # Only log if box_df was provided
+    def group_boxes(self, camera_box_df):
+        positions = camera_box_df[GROUP_KEY_COLUMNS].assign(
+            position=_bucket(
+                camera_box_df[BOX_CENTER_X_COLUMN] / CAMERA_IMAGE_WIDTH,
+                POSITION_BUCKETS,
+            ),
+            label_name=_label_names(camera_box_df[BOX_TYPE_COLUMN]),
+        )
+        positions = positions.drop_duplicates().sort_values(
+            GROUP_KEY_COLUMNS + ["position", "label_name"]
+        )
+        names = (
+            positions.groupby(
+                GROUP_KEY_COLUMNS + ["position"], observed=True, sort=False
+            )["label_name"]
+            .agg(", ".join)
+            .reset_index()
+        )
+        names["item"] = (
+            names["position"].astype(str).str.capitalize()
+            + ": "
+            + names["label_name"]
+            + "."
+        )
+        return (
+            names.groupby(GROUP_KEY_COLUMNS, sort=False)["item"]
+            .agg(" ".join)
+            .reset_index(name="positions")
+        )
+
+    def generate(self, frames):
+        frames = frames[frames["positions"].notna()]
+        return pd.DataFrame(
+            {
+                "question": "Where are the objects in the "
+                + frames["image_name"]
+                + ", from left to right?",
+                "answer": frames["positions"],
+            }
+        )
+
+
+# Generators selectable with --qa_generators. A new task is added by
+# subclassing QAGenerator and registering it here.
+QA_GENERATORS = {
+    "objects": ObjectTypesQA,
+    "counts": ObjectCountsQA,
+    "box_area": BoxAreaQA,
+    "position": PositionQA,
+}
+
+
+def get_qa_generators(names: Tuple[str, ...]) -> List[QAGenerator]:
+    """Returns an instance of the QA_GENERATORS of each name."""
+    unknown = [name for name in names if name not in QA_GENERATORS]
+    if unknown:
+        raise ValueError(
+            f"Unknown QA generators {unknown}, choose from {list(QA_GENERATORS)}"
+        )
+    return [QA_GENERATORS[name]() for name in names]
+
+
+def box_read_columns(qa_generators: List[QAGenerator]) -> List[str]:
+    """Returns the box columns read for the given generators."""
+    columns = list(BOX_READ_COLUMNS)
+    for generator in qa_generators:
+        columns += [c for c in generator.box_columns if c not in columns]
+    return columns
+
+
+def group_boxes(camera_box_df, qa_generators: List[QAGenerator]) -> List:
+    """
+    Groups the boxes of a segment once per generator, so the groups can be
+    joined to every batch of image rows. Returns one DataFrame per generator.
+    """
+    if camera_box_df is None or camera_box_df.empty:
+        camera_box_df = pd.DataFrame(
+            columns=box_read_columns(qa_generators), dtype="float64"
+        )
+    box_groups = [generator.group_boxes(camera_box_df) for generator in qa_generators]
+    if len(camera_box_df):  # Only log if box data was provided
         logger.info(
-            f"[DataLoader][Process Waymo data] Grouped {sum(len(v) for v in boxes_by_frame_camera.values())} boxes from {len(boxes_by_frame_camera)} unique (frame_ts, camera) pairs."
+            f"[DataLoader][Process Waymo data] Grouped {len(camera_box_df)} boxes from {len(box_groups[0]) if box_groups else 0} unique (frame_ts, camera) pairs."
         )
+    return box_groups
 
-    for _, row in camera_image_df.iterrows():
-        image_bytes = row["[CameraImageComponent].image"]
-        camera_name_int = row["key.camera_name"]
-        frame_ts = row["key.frame_timestamp_micros"]
 
-        camera_name_str = CAMERA_NAME_MAP.get(camera_name_int, "UNKNOWN_CAMERA")
+@dataclasses.dataclass(frozen=True)
+class ImageOptions:
+    """
+    How camera images are decoded, resized and stored.
+
+    Attributes:
+        image_format: IMAGE_FORMAT_DATASET to keep PIL images, or one of
+            ENCODED_IMAGE_FORMATS to store encoded bytes.
+        image_quality: Encoding quality of ENCODED_IMAGE_FORMATS.
+        draft_decode: Let libjpeg decode JPEGs at a reduced scale (1/2, 1/4 or
+            1/8) that is still larger than the output size, before resizing.
+        resample: Name of the RESAMPLING_FILTERS filter used to resize.
+    """
 
-        try:
-            pil_image = (
-                Image.open(BytesIO(image_bytes)).convert("RGB").resize((250, 200))
-            )
-        except Exception as e:
-            logger.warning(
-                f"Could not process image for frame_ts {frame_ts}, camera {camera_name_str}. Error: {e}"
-            )
-            continue  # Skip this image if it's corrupted or unreadable
+    image_format: str = IMAGE_FORMAT_DATASET
+    image_quality: int = DEFAULT_IMAGE_QUALITY
+    draft_decode: bool = False
+    resample: str = "bicubic"
 
-        # Get labels for this specific frame and camera
-        current_frame_boxes = boxes_by_frame_camera.get((frame_ts, camera_name_str), [])
 
-        detected_objects = set()
-        for box_row in current_frame_boxes:
-            label_id = box_row["[CameraBoxComponent].type"]
-            detected_objects.add(WAYMO_LABEL_ID_TO_NAME.get(label_id, "Unknown"))
+def _decode_image(image_bytes: bytes, image_options: ImageOptions):
+    """Decodes a camera image and resizes it to OUTPUT_IMAGE_SIZE."""
+    pil_image = Image.open(BytesIO(image_bytes))
+    if image_options.draft_decode:
+        # Only has an effect on JPEG images, other formats decode at full size.
+        pil_image.draft("RGB", OUTPUT_IMAGE_SIZE)
+    return pil_image.convert("RGB").resize(
+        OUTPUT_IMAGE_SIZE, resample=RESAMPLING_FILTERS[image_options.resample]
+    )
 
-        if detected_objects:
-            question = f"What objects are visible in the {camera_name_str} image at timestamp {frame_ts}?"
-            label = "Objects: " + ", ".join(sorted(list(detected_objects))) + "."
-        else:
-            question = f"Are there any common objects visible in the {camera_name_str} image at timestamp {frame_ts}?"
-            label = "No common objects detected."
+
+def _encode_image(pil_image, image_options: ImageOptions) -> dict:
+    """Encodes a PIL image into the {"bytes", "path"} struct of an Image feature."""
+    buffer = BytesIO()
+    pil_image.save(
+        buffer,
+        format=ENCODED_IMAGE_FORMATS[image_options.image_format],
+        quality=image_options.image_quality,
+    )
+    return {"bytes": buffer.getvalue(), "path": None}
+
+
+def process_waymo_data(
+    camera_image_df,
+    camera_box_df,
+    box_groups=None,
+    image_options: ImageOptions = ImageOptions(),
+    qa_generators: Tuple[str, ...] = DEFAULT_QA_GENERATORS,
+):
+    """
+    Processes data for a single Waymo segment to extract images,
+    and generate questions/answers based on camera boxes.
+    Every QA_GENERATORS generator named in qa_generators emits zero or more
+    rows per image; each image is decoded once and shared by its rows.
+    box_groups, the result of group_boxes, can be passed instead of
+    camera_box_df when the segment images are processed in batches.
+    Images are PIL images, or encoded bytes when image_options.image_format is
+    one of ENCODED_IMAGE_FORMATS.
+    Returns a list of dictionaries, each containing an image, question, and answer.
+    """
+    segment_data = []
+    generators = get_qa_generators(qa_generators)
+
+    # Join the box groups of each (frame_ts, camera) pair to the image rows so
+    # the question/answer strings are built per group.
+    if box_groups is None:
+        box_groups = group_boxes(camera_box_df, generators)
+
+    frames = camera_image_df[
+        [IMAGE_COLUMN, CAMERA_NAME_COLUMN, FRAME_TIMESTAMP_COLUMN]
+    ].reset_index(drop=True)
+    camera_names = (
+        frames[CAMERA_NAME_COLUMN].map(CAMERA_NAME_MAP).fillna("UNKNOWN_CAMERA")
+    )
+    keys = frames[GROUP_KEY_COLUMNS].assign(
+        image_name=camera_names
+        + " image at timestamp "
+        + frames[FRAME_TIMESTAMP_COLUMN].astype(str)
+    )
+    qa_rows = pd.concat(
+        [
+            generator.generate(
+                keys.merge(groups, on=GROUP_KEY_COLUMNS, how="left")
+            ).assign(frame=lambda df: df.index, order=i)
+            for i, (generator, groups) in enumerate(zip(generators, box_groups))
+        ],
+        ignore_index=True,
+    ).sort_values(["frame", "order"], kind="stable")
+
+    current_frame, pil_image = None, None
+    for frame, question, label in zip(
+        qa_rows["frame"], qa_rows["question"], qa_rows["answer"]
+    ):
+        if frame != current_frame:
+            current_frame = frame
+            frame_ts = frames[FRAME_TIMESTAMP_COLUMN].iat[frame]
+            try:
+                pil_image = _decode_image(
+                    frames[IMAGE_COLUMN].iat[frame], image_options
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Could not process image for frame_ts {frame_ts}, camera {camera_names.iat[frame]}. Error: {e}"
+                )
+                pil_image = None  # Skip this image if it's corrupted or unreadable
+            if (
+                pil_image is not None
+                and image_options.image_format in ENCODED_IMAGE_FORMATS
+            ):
+                pil_image = _encode_image(pil_image, image_options)
+        if pil_image is None:
+            continue
 
         segment_data.append(
             {"image": pil_image, "question": question, "multiple_choice_answer": label}
         )
 
-    logger.info(
-        f"[DataLoader][Process Waymo data] Processed {len(segment_data)} images for the current segment."
+    logger.debug(
+        f"[DataLoader][Process Waymo data] Processed {len(segment_data)} rows."
     )
     return segment_data
 
 
-def load_waymo_data_to_dataset(
-    image_parquet_files: List[str],
-    box_parquet_files: List[str],
-    output_dir: str,
-    output_filename_base: str,  # = "waymo_processed_dataset.parquet"
-):
-    """
-    Loads Waymo camera images and annotations from local Parquet files,
-    processes them, creates a Hugging Face Dataset, and saves it to a Parquet file locally.
-    """
+def segment_id_of(parquet_file: str) -> str:
+    """Returns the segment ID of a camera image or box file."""
+    # Extract segment name, assuming format like 'segment_id_string.parquet'
+    return os.path.basename(parquet_file).replace(".parquet", "")
 
-    all_images = []
-    all_questions = []
-    all_answers = []
 
+def _load_box_dfs_by_segment(
+    box_parquet_files: List[str], columns: List[str] = BOX_READ_COLUMNS
+) -> dict:
+    """Loads the box dataframes of the given files keyed by segment name."""
     box_dfs_by_segment = {}
     for box_file in box_parquet_files:
-        # Extract segment name, assuming format like 'segment_id_string.parquet'
-        segment_name = os.path.basename(box_file).replace(".parquet", "")
+        segment_name = segment_id_of(box_file)
         logger.info(
             f"[Dataloader] Loading box data from {box_file} for segment {segment_name}."
         )
         try:
-            box_dfs_by_segment[segment_name] = pd.read_parquet(
-                box_file, engine="pyarrow"
-            )
+            box_dfs_by_segment[segment_name] = read_box_file(box_file, columns)
         except Exception as e:
             # Log as error but continue, to allow processing of segments with valid image data
             # if box data is optional or partially available.
@@ -281,48 +752,108 @@ def load_waymo_data_to_dataset(
                 f"[Dataloader] Could not load or read box file {box_file}: {e}. This segment's boxes will be unavailable."
             )
     logger.info(f"[Dataloader] Loaded {len(box_dfs_by_segment)} box dataframes.")
+    return box_dfs_by_segment
 
+
+def _iter_processed_batches(
+    image_parquet_files: List[str],
+    box_dfs_by_segment: dict,
+    image_options: ImageOptions = ImageOptions(),
+    skip_failed_segments: bool = True,
+    qa_generators: Tuple[str, ...] = DEFAULT_QA_GENERATORS,
+):
+    """
+    Yields the processed rows of the image files one read batch at a time.
+    A segment that fails to load or process is logged and skipped, or the
+    error is raised when skip_failed_segments is False. When skipping, the
+    batches of a segment are held until the whole segment is processed, so a
+    segment failing mid-file yields no rows.
+    """
     loaded_segments_count = 0
     for image_file in image_parquet_files:
-        segment_name = os.path.basename(image_file).replace(".parquet", "")
+        segment_name = segment_id_of(image_file)
         logger.info(
             f"[Dataloader] Processing segment: {segment_name} from file {image_file}"
         )
 
         try:
-            current_camera_image_df = pd.read_parquet(image_file, engine="pyarrow")
             # Retrieve the corresponding box dataframe; it's okay if it's None (handled in process_waymo_data)
             current_camera_box_df = box_dfs_by_segment.get(segment_name)
             if current_camera_box_df is None:
                 logger.warning(
                     f"[Dataloader] No box data found for segment: {segment_name}. Processing with images only."
                 )
-
-            segment_processed_data = process_waymo_data(
-                current_camera_image_df, current_camera_box_df
+            box_groups = group_boxes(
+                current_camera_box_df, get_qa_generators(qa_generators)
             )
 
-            for item in segment_processed_data:
-                all_images.append(item["image"])
-                all_questions.append(item["question"])
-                all_answers.append(item["multiple_choice_answer"])
-
-            if segment_processed_data:  # only increment if data was actually processed
+            segment_rows = 0
+            segment_batches = []
+            for camera_image_df in read_image_batches(image_file):
+                batch_processed_data = process_waymo_data(
+                    camera_image_df,
+                    None,
+                    box_groups=box_groups,
+                    image_options=image_options,
+                    qa_generators=qa_generators,
+                )
+                segment_rows += len(batch_processed_data)
+                if skip_failed_segments:
+                    segment_batches.append(batch_processed_data)
+                else:
+                    yield batch_processed_data
+
+            logger.info(
+                f"[DataLoader][Process Waymo data] Processed {segment_rows} rows for segment {segment_name}."
+            )
+            if segment_rows:  # only increment if data was actually processed
                 loaded_segments_count += 1
 
         except Exception as e:
+            if not skip_failed_segments:
+                raise
             logger.error(
                 f"[Fatal][Dataloader] Error loading or processing image file {image_file}: {e}. Skipping this segment."
             )
             # Continue to next segment to make it more robust
             # If one file is corrupted, we might still process others.
-            # Consider if a fatal error should stop all processing.
-            # raise if any single file error should be fatal
+            continue
+        yield from segment_batches
 
     logger.info(
         f"[Dataloader] Successfully processed data for {loaded_segments_count} segments."
     )
 
+
+@contextlib.contextmanager
+def _atomic_output(output_path: str):
+    """
+    Yields a temporary path next to output_path, renamed to output_path once
+    the block succeeds. An interrupted write never leaves a partial output file.
+    """
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _save_as_dataset(processed_batches, output_parquet_path: str) -> int:
+    """
+    Collects the processed rows in memory, creates a Hugging Face Dataset and
+    saves it to Parquet. Returns the number of rows written.
+    """
+    all_images = []
+    all_questions = []
+    all_answers = []
+    for batch_processed_data in processed_batches:
+        for item in batch_processed_data:
+            all_images.append(item["image"])
+            all_questions.append(item["question"])
+            all_answers.append(item["multiple_choice_answer"])
+
     if not all_images:
         logger.warning(
             "[Dataloader] No data was loaded into the lists. Resulting dataset will be empty."
@@ -339,15 +870,7 @@ def load_waymo_data_to_dataset(
     )
 
     try:
-        # Define the features, especially for the image data, to help serialization
-        features = Features(
-            {
-                "image": ImageFeature(),
-                "question": Value("string"),
-                "multiple_choice_answer": Value("string"),
-            }
-        )
-        dataset = Dataset.from_dict(dataset_dict, features=features)
+        dataset = Dataset.from_dict(dataset_dict, features=DATASET_FEATURES)
         logger.info(
             f"[Dataloader] Created Hugging Face Dataset with {len(dataset)} entries."
         )
@@ -359,47 +882,598 @@ def load_waymo_data_to_dataset(
         # You might want to inspect the data here or save it in a different format for debugging
         raise Exception(f"Failed to create dataset: {e}")
 
-    # --- Save dataset to Parquet ---
-    os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
-
-    # Construct output filename, incorporating PARQUET_ID if it exists
-    segment_name = os.path.basename(image_parquet_files[0])
-    final_output_filename = output_filename_base + "_" + segment_name
-
-    output_parquet_path = os.path.join(output_dir, final_output_filename)
-
     logger.info(
         f"[Dataloader] Attempting to save dataset to Parquet format at: {output_parquet_path}"
     )
     try:
-        dataset.to_parquet(output_parquet_path)
+        with _atomic_output(output_parquet_path) as temp_path:
+            dataset.to_parquet(temp_path)
         logger.info(f"[Dataloader] Successfully saved dataset to {output_parquet_path}")
     except Exception as e:
         logger.error(f"[Fatal][Dataloader] Failed to save dataset to Parquet: {e}")
         raise  # Re-raise the exception after logging
+    return len(dataset)
+
+
+def _save_encoded_batches(processed_batches, output_parquet_path: str) -> int:
+    """
+    Streams rows whose images are already encoded to Parquet with a
+    ParquetWriter, one read batch at a time. The schema carries the Hugging
+    Face features metadata, so the image column is still loaded as an Image.
+    Returns the number of rows written.
+    """
+    schema = DATASET_FEATURES.arrow_schema
+    num_rows = 0
+    logger.info(
+        f"[Dataloader] Streaming encoded images to Parquet at: {output_parquet_path}"
+    )
+    try:
+        with _atomic_output(output_parquet_path) as temp_path:
+            with pq.ParquetWriter(temp_path, schema) as writer:
+                for batch_processed_data in processed_batches:
+                    if not batch_processed_data:
+                        continue
+                    writer.write_table(
+                        pa.Table.from_pylist(batch_processed_data, schema=schema)
+                    )
+                    num_rows += len(batch_processed_data)
+    except Exception as e:
+        logger.error(f"[Fatal][Dataloader] Failed to save dataset to Parquet: {e}")
+        raise  # Re-raise the exception after logging
+    logger.info(
+        f"[Dataloader] Successfully saved {num_rows} rows to {output_parquet_path}"
+    )
+    return num_rows
 
 
-def thread_work(
-    thread_id: int,
+def output_parquet_path_for(
+    output_dir: str, output_filename_base: str, image_file: str
+) -> str:
+    """Returns the output Parquet path of the segment of an image file."""
+    # Construct output filename, incorporating PARQUET_ID if it exists
+    segment_name = os.path.basename(image_file)
+    final_output_filename = output_filename_base + "_" + segment_name
+    return os.path.join(output_dir, final_output_filename)
+
+
+def load_waymo_data_to_dataset(
     image_parquet_files: List[str],
     box_parquet_files: List[str],
     output_dir: str,
+    output_filename_base: str,  # = "waymo_processed_dataset.parquet"
+    image_options: ImageOptions = ImageOptions(),
+    skip_failed_segments: bool = True,
+    qa_generators: Tuple[str, ...] = DEFAULT_QA_GENERATORS,
+) -> int:
+    """
+    Loads Waymo camera images and annotations from local Parquet files,
+    processes them, and saves them to a Parquet file locally. The file is
+    written under a temporary name and renamed once complete.
+
+    With the default image format the rows are collected into a Hugging Face
+    Dataset before saving. With "jpeg" or "webp" every image is encoded right
+    after resizing and the rows are streamed to the Parquet file, so decoded
+    images are never accumulated in memory.
+    qa_generators names the QA_GENERATORS producing the question/answer rows.
+    With skip_failed_segments, a segment failing to load or process is left
+    out whole, otherwise its error is raised and no file is written.
+    Returns the number of rows written.
+    """
+    box_dfs_by_segment = _load_box_dfs_by_segment(
+        box_parquet_files, box_read_columns(get_qa_generators(qa_generators))
+    )
+    processed_batches = _iter_processed_batches(
+        image_parquet_files,
+        box_dfs_by_segment,
+        image_options=image_options,
+        skip_failed_segments=skip_failed_segments,
+        qa_generators=qa_generators,
+    )
+
+    # --- Save dataset to Parquet ---
+    os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
+
+    output_parquet_path = output_parquet_path_for(
+        output_dir, output_filename_base, image_parquet_files[0]
+    )
+
+    if image_options.image_format == IMAGE_FORMAT_DATASET:
+        return _save_as_dataset(processed_batches, output_parquet_path)
+    return _save_encoded_batches(processed_batches, output_parquet_path)
+
+
+def _index_by_segment(parquet_files: List[str], kind: str) -> dict:
+    index = {}
+    for parquet_file in parquet_files:
+        segment_id = segment_id_of(parquet_file)
+        if segment_id in index:
+            logger.warning(
+                f"[Dataloader] Duplicate {kind} file for segment {segment_id}: {parquet_file}, using {index[segment_id]}."
+            )
+            continue
+        index[segment_id] = parquet_file
+    return index
+
+
+def match_segment_files(
+    image_parquet_files: List[str], box_parquet_files: List[str]
+) -> Tuple[List[Tuple[str, Optional[str]]], List[str]]:
+    """
+    Joins the image and box files on their segment ID.
+
+    Returns the (image file, box file) pairs sorted by segment ID, with None
+    as the box file of images without one, and the box files without images.
+    """
+    images = _index_by_segment(image_parquet_files, "image")
+    boxes = _index_by_segment(box_parquet_files, "box")
+    pairs = [
+        (images[segment_id], boxes.get(segment_id)) for segment_id in sorted(images)
+    ]
+    unmatched_boxes = [
+        boxes[segment_id] for segment_id in sorted(boxes.keys() - images.keys())
+    ]
+    return pairs, unmatched_boxes
+
+
+def build_work_units(
+    image_parquet_files: List[str], box_parquet_files: List[str]
+) -> List[Tuple[str, Optional[str]]]:
+    """
+    Builds one (image file, box file) work unit per segment by joining the
+    files on their segment ID. Segments without a box file are processed with
+    images only. Box files without an image file are reported and ignored.
+    """
+    work_units, unmatched_boxes = match_segment_files(
+        image_parquet_files, box_parquet_files
+    )
+    missing_boxes = [segment_id_of(image) for image, box in work_units if box is None]
+    if missing_boxes:
+        logger.warning(
+            f"[Dataloader] {len(missing_boxes)} segments have no box file and are processed with images only: {missing_boxes}"
+        )
+    if unmatched_boxes:
+        logger.warning(
+            f"[Dataloader] {len(unmatched_boxes)} box files have no image file and are ignored: {[segment_id_of(box) for box in unmatched_boxes]}"
+        )
+    return work_units
+
+
+def process_segment(
+    work_unit: Tuple[str, Optional[str]],
+    output_dir: str,
     output_filename_base: str,
-) -> None:
-    """Thread worker function to process a subset of Waymo data."""
-    for i, (image_file, box_file) in enumerate(
-        zip(sorted(image_parquet_files), sorted(box_parquet_files))
+    **load_kwargs,
+) -> int:
+    """Worker function processing a single segment work unit.
+
+    load_kwargs are passed to load_waymo_data_to_dataset. Only the number of
+    rows written is returned, so results sent back from worker processes stay
+    small. Errors are raised so the segment is recorded as failed.
+    """
+    image_file, box_file = work_unit
+    logger.info(
+        f"[Worker {os.getpid()}] Processing image file: {image_file}, box file: {box_file}"
+    )
+    return load_waymo_data_to_dataset(
+        image_parquet_files=[image_file],
+        box_parquet_files=[box_file] if box_file else [],
+        output_dir=output_dir,
+        output_filename_base=output_filename_base,
+        skip_failed_segments=False,
+        **load_kwargs,
+    )
+
+
+def _options_signature(output_filename_base: str, load_kwargs: dict) -> dict:
+    """Returns the JSON serializable processing options of a segment."""
+    options = {"output_filename_base": output_filename_base}
+    for key, value in sorted(load_kwargs.items()):
+        options[key] = (
+            dataclasses.asdict(value) if dataclasses.is_dataclass(value) else value
+        )
+    # Round trip so tuples compare equal to the lists of a loaded manifest.
+    return json.loads(json.dumps(options))
+
+
+class SegmentManifest:
+    """
+    Records the processing status of every segment in the output directory.
+
+    Each entry holds the segment ID, the size and mtime of its input files, the
+    output file, the number of rows, the status and the processing options.
+    A segment needs processing when it has no entry, failed, its input files
+    or options changed, or its output file is missing.
+    """
+
+    FILENAME = "manifest.json"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, self.FILENAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def segment_id(work_unit: Tuple[str, Optional[str]]) -> str:
+        return segment_id_of(work_unit[0])
+
+    @staticmethod
+    def _file_stat(path: Optional[str]) -> Optional[dict]:
+        if not path or not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def needs_processing(
+        self, work_unit: Tuple[str, Optional[str]], output_path: str, options: dict
+    ) -> bool:
+        entry = self.entries.get(self.segment_id(work_unit))
+        return (
+            entry is None
+            or entry["status"] != self.STATUS_DONE
+            or entry["image_file"] != self._file_stat(work_unit[0])
+            or entry["box_file"] != self._file_stat(work_unit[1])
+            or entry["options"] != options
+            or not os.path.exists(output_path)
+        )
+
+    def record(
+        self,
+        work_unit: Tuple[str, Optional[str]],
+        output_path: str,
+        options: dict,
+        num_rows: int = 0,
+        error: Optional[str] = None,
     ):
-        logger.info(
-            f"[Thread {thread_id}] Processing image file: {image_file}, box file: {box_file}"
+        self.entries[self.segment_id(work_unit)] = {
+            "segment_id": self.segment_id(work_unit),
+            "image_file": self._file_stat(work_unit[0]),
+            "box_file": self._file_stat(work_unit[1]),
+            "output_file": os.path.basename(output_path),
+            "num_rows": num_rows,
+            "status": self.STATUS_FAILED if error else self.STATUS_DONE,
+            "error": error,
+            "options": options,
+        }
+
+    def done_output_files(self, output_dir: str) -> List[str]:
+        """Returns the output files of the done segments, by segment ID."""
+        return [
+            os.path.join(output_dir, entry["output_file"])
+            for _, entry in sorted(self.entries.items())
+            if entry["status"] == self.STATUS_DONE
+            and os.path.exists(os.path.join(output_dir, entry["output_file"]))
+        ]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with _atomic_output(self.path) as temp_path:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+
+
+def run_pipeline(
+    work_units: Iterable[Tuple[str, Optional[str]]],
+    output_dir: str,
+    output_filename_base: str,
+    num_workers: int,
+    executor: str = EXECUTOR_PROCESS,
+    max_in_flight: Optional[int] = None,
+    resume: bool = False,
+    **load_kwargs,
+) -> int:
+    """Processes the work units on a pool of workers.
+
+    work_units may be a generator, e.g. iter_downloaded_segments, in which case
+    a segment is submitted as soon as it is yielded.
+
+    Work units are scheduled dynamically: a new segment is submitted as soon as
+    one completes, and at most max_in_flight segments (default 2 per worker)
+    are queued at once. Each worker holds a single segment in memory and only
+    returns its row count.
+
+    The status of every segment is recorded in a SegmentManifest in the output
+    directory. With resume, only segments that are missing, failed or changed
+    since the last run are processed.
+
+    load_kwargs are passed to load_waymo_data_to_dataset.
+    Returns the total number of rows written.
+    """
+    manifest = SegmentManifest(output_dir)
+    options = _options_signature(output_filename_base, load_kwargs)
+
+    def output_path(work_unit):
+        return output_parquet_path_for(output_dir, output_filename_base, work_unit[0])
+
+    num_up_to_date = 0
+
+    def skip_up_to_date(work_units):
+        nonlocal num_up_to_date
+        for work_unit in work_units:
+            if manifest.needs_processing(work_unit, output_path(work_unit), options):
+                yield work_unit
+            else:
+                num_up_to_date += 1
+
+    if resume:
+        # Filtered lazily, work units may still be downloading.
+        work_units = skip_up_to_date(work_units)
+
+    max_in_flight = max_in_flight or 2 * num_workers
+    pool_class = (
+        concurrent.futures.ProcessPoolExecutor
+        if executor == EXECUTOR_PROCESS
+        else concurrent.futures.ThreadPoolExecutor
+    )
+    pending_units = iter(work_units)
+    total_rows = 0
+    with pool_class(max_workers=num_workers) as pool:
+        in_flight = {}
+
+        def submit_next() -> bool:
+            work_unit = next(pending_units, None)
+            if work_unit is None:
+                return False
+            future = pool.submit(
+                process_segment,
+                work_unit,
+                output_dir,
+                output_filename_base,
+                **load_kwargs,
+            )
+            in_flight[future] = work_unit
+            return True
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+        while in_flight:
+            done, _ = concurrent.futures.wait(
+                in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                work_unit = in_flight.pop(future)
+                try:
+                    num_rows = future.result()
+                    total_rows += num_rows
+                    manifest.record(
+                        work_unit, output_path(work_unit), options, num_rows=num_rows
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"[Dataloader] Failed to process segment {work_unit[0]}: {e}"
+                    )
+                    manifest.record(
+                        work_unit, output_path(work_unit), options, error=str(e)
+                    )
+                manifest.save()
+                submit_next()
+
+    if resume:
+        logger.info(f"[Dataloader] Resumed: {num_up_to_date} segments were up to date.")
+    failed = [
+        entry["segment_id"]
+        for entry in manifest.entries.values()
+        if entry["status"] == SegmentManifest.STATUS_FAILED
+    ]
+    if failed:
+        logger.warning(
+            f"[Dataloader] {len(failed)} segments failed, see {manifest.path}: {failed}"
         )
-        load_waymo_data_to_dataset(
-            image_parquet_files=[image_file],
-            box_parquet_files=[box_file],
-            output_dir=output_dir,
-            output_filename_base=output_filename_base,
+    return total_rows
+
+
+def _is_variable_width(data_type: pa.DataType) -> bool:
+    return (
+        pa.types.is_binary(data_type)
+        or pa.types.is_large_binary(data_type)
+        or pa.types.is_string(data_type)
+        or pa.types.is_large_string(data_type)
+    )
+
+
+def _stored_row_bytes(table: pa.Table) -> np.ndarray:
+    """
+    Returns the stored size of every row of a table: the length of its binary
+    and string values plus the width of its other values. Shards store binary
+    columns without dictionary encoding or compression, so an image shared by
+    the rows of several QA generators counts once per row, as it is written.
+    """
+    sizes = np.zeros(table.num_rows)
+    for column in table.flatten().columns:
+        if _is_variable_width(column.type):
+            sizes += pc.binary_length(column).fill_null(0).to_numpy()
+        elif len(column):
+            sizes += column.nbytes / len(column)
+    return sizes
+
+
+def plan_shards(segment_files: List[str], shard_size_mb: float) -> List[list]:
+    """
+    Splits the rows of the segment files into shards of about shard_size_mb.
+
+    Sizes are the _stored_row_bytes of the rows, so the segment files are read
+    once. Shards end at the row boundary closest to shard_size_mb, so they are
+    within half a row of it, the last one aside. Returns one list of
+    (segment_file, start_row, end_row) pieces per shard.
+    """
+    shard_bytes = shard_size_mb * 1024 * 1024
+    shards = [[]]
+    current_bytes = 0.0
+    for segment_file in segment_files:
+        start = end = 0
+        for batch in pq.ParquetFile(segment_file).iter_batches(
+            batch_size=READ_BATCH_SIZE
+        ):
+            for row_bytes in _stored_row_bytes(pa.Table.from_batches([batch])):
+                # Closes the shard at the row boundary closest to its size.
+                if current_bytes + row_bytes / 2 > shard_bytes and current_bytes:
+                    if start < end:
+                        shards[-1].append((segment_file, start, end))
+                    shards.append([])
+                    current_bytes = 0.0
+                    start = end
+                current_bytes += row_bytes
+                end += 1
+        if start < end:
+            shards[-1].append((segment_file, start, end))
+    return [shard for shard in shards if shard]
+
+
+def _iter_pieces(pieces: list, batch_size: int):
+    """Yields the rows of (segment_file, start_row, end_row) pieces as tables.
+
+    Only the row groups overlapping the rows of a piece are read, so the rows
+    before it are not decoded again for every piece of a file.
+    """
+    for segment_file, start, end in pieces:
+        parquet_file = pq.ParquetFile(segment_file)
+        row_groups = []
+        offset = None
+        group_start = 0
+        for i in range(parquet_file.metadata.num_row_groups):
+            group_end = group_start + parquet_file.metadata.row_group(i).num_rows
+            if group_start < end and start < group_end:
+                row_groups.append(i)
+                offset = group_start if offset is None else offset
+            group_start = group_end
+        if not row_groups:
+            continue
+        for batch in parquet_file.iter_batches(
+            batch_size=batch_size, row_groups=row_groups
+        ):
+            batch_start, batch_end = max(start, offset), min(
+                end, offset + batch.num_rows
+            )
+            if batch_start < batch_end:
+                yield pa.Table.from_batches([batch]).slice(
+                    batch_start - offset, batch_end - batch_start
+                )
+            offset += batch.num_rows
+
+
+def write_shards(
+    segment_files: List[str],
+    shard_dir: str,
+    shard_filename_base: str,
+    shard_size_mb: float,
+    row_group_size_mb: float = DEFAULT_ROW_GROUP_SIZE_MB,
+) -> List[dict]:
+    """
+    Repacks the rows of the per-segment output files into shards of about
+    shard_size_mb, with row groups of about row_group_size_mb.
+
+    The shards are named <shard_filename_base>-<index>-of-<count>.parquet and
+    described in an index file listing the file, row count, size and row
+    group sizes of every shard, so readers can split the work without opening
+    every file. Shards of a previous run that are not in the new index are
+    removed. Returns the index entries.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    row_group_bytes = min(row_group_size_mb, shard_size_mb) * 1024 * 1024
+    shards = plan_shards(segment_files, shard_size_mb)
+    schema = pq.read_schema(segment_files[0]) if segment_files else None
+    # The images are already compressed. Storing binary columns without
+    # dictionary encoding and compression makes their size that of
+    # _stored_row_bytes: whether the rows sharing an image are deduplicated
+    # would otherwise depend on the dictionary page size and the alignment of
+    # the rows in the compression blocks.
+    columns = (
+        pa.Table.from_batches([], schema=schema).flatten().schema if schema else []
+    )
+    binary_columns = [
+        field.name
+        for field in columns
+        if pa.types.is_binary(field.type) or pa.types.is_large_binary(field.type)
+    ]
+    use_dictionary = [
+        field.name for field in columns if field.name not in binary_columns
+    ]
+    compression = {
+        field.name: "NONE" if field.name in binary_columns else "SNAPPY"
+        for field in columns
+    }
+
+    index = []
+    for i, pieces in enumerate(shards):
+        filename = f"{shard_filename_base}-{i:05d}-of-{len(shards):05d}.parquet"
+        shard_path = os.path.join(shard_dir, filename)
+        with _atomic_output(shard_path) as temp_path:
+            with pq.ParquetWriter(
+                temp_path,
+                schema,
+                use_dictionary=use_dictionary,
+                compression=compression,
+            ) as writer:
+                # Row groups span segment boundaries, so rows are buffered
+                # until a full row group is available.
+                pending = pa.Table.from_batches([], schema=schema)
+                pending_bytes = np.zeros(0)
+                for table in _iter_pieces(pieces, READ_BATCH_SIZE):
+                    table = table.cast(schema)
+                    pending = pa.concat_tables([pending, table])
+                    pending_bytes = np.concatenate(
+                        [pending_bytes, _stored_row_bytes(table)]
+                    )
+                    cumulative_bytes = np.cumsum(pending_bytes)
+                    while pending.num_rows and cumulative_bytes[-1] >= row_group_bytes:
+                        num_rows = (
+                            int(np.searchsorted(cumulative_bytes, row_group_bytes)) + 1
+                        )
+                        writer.write_table(pending.slice(0, num_rows))
+                        pending = pending.slice(num_rows)
+                        pending_bytes = pending_bytes[num_rows:]
+                        cumulative_bytes = np.cumsum(pending_bytes)
+                if pending.num_rows:
+                    writer.write_table(pending)
+        metadata = pq.ParquetFile(shard_path).metadata
+        index.append(
+            {
+                "file": filename,
+                "num_rows": metadata.num_rows,
+                "num_bytes": os.path.getsize(shard_path),
+                "row_groups": [
+                    metadata.row_group(j).num_rows
+                    for j in range(metadata.num_row_groups)
+                ],
+            }
         )
 
+    index_path = os.path.join(shard_dir, SHARD_INDEX_FILENAME)
+    with _atomic_output(index_path) as temp_path:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"num_rows": sum(s["num_rows"] for s in index), "shards": index},
+                f,
+                indent=2,
+            )
+
+    current = {s["file"] for s in index}
+    for stale in glob.glob(os.path.join(shard_dir, f"{shard_filename_base}-*.parquet")):
+        if os.path.basename(stale) not in current:
+            os.remove(stale)
+
+    logger.info(
+        f"[Dataloader] Wrote {len(index)} shards of {sum(s['num_rows'] for s in index)} rows to {shard_dir}."
+    )
+    return index
+
+
+def _parse_segment_ids(segment_ids: Optional[str]) -> Optional[List[str]]:
+    """Parses a comma separated list of segment IDs or an @file of IDs."""
+    if not segment_ids:
+        return None
+    if segment_ids.startswith("@"):
+        with open(segment_ids[1:], "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    return [
+        segment_id.strip()
+        for segment_id in segment_ids.split(",")
+        if segment_id.strip()
+    ]
+
 
 @click.command()
 @click.option(
@@ -421,7 +1495,19 @@ def thread_work(
     "--num_threads",
     type=int,
     default=THREAD_COUNTS,
-    help="Number of threads to use for processing.",
+    help="Number of workers to use for processing.",
+)
+@click.option(
+    "--executor",
+    type=click.Choice([EXECUTOR_PROCESS, EXECUTOR_THREAD]),
+    default=EXECUTOR_PROCESS,
+    help="Run the workers as processes or threads. Image decoding is GIL-bound, so processes scale better.",
+)
+@click.option(
+    "--max_in_flight",
+    type=int,
+    default=None,
+    help="Maximum number of segments submitted to the workers at once. Defaults to twice the number of workers.",
 )
 @click.option(
     "--output_filename_base",
@@ -429,6 +1515,70 @@ def thread_work(
     default="waymo_processed_dataset",
     help="Base filename for the output Parquet dataset.",
 )
+@click.option(
+    "--image_format",
+    type=click.Choice([IMAGE_FORMAT_DATASET] + list(ENCODED_IMAGE_FORMATS)),
+    default=IMAGE_FORMAT_DATASET,
+    help="Store images through a Hugging Face Dataset, or encode them as JPEG/WebP bytes streamed to Parquet.",
+)
+@click.option(
+    "--image_quality",
+    type=int,
+    default=DEFAULT_IMAGE_QUALITY,
+    help="Encoding quality of the jpeg and webp image formats.",
+)
+@click.option(
+    "--qa_generators",
+    type=str,
+    default=",".join(DEFAULT_QA_GENERATORS),
+    help=f"Comma separated question/answer generators run in a single pass over the data, from {list(QA_GENERATORS)}.",
+)
+@click.option(
+    "--num_segments",
+    type=int,
+    default=None,
+    help="Only download and process the first N segments, sorted by segment ID.",
+)
+@click.option(
+    "--segment_ids",
+    type=str,
+    default=None,
+    help="Comma separated segment IDs, or @<file> with one ID per line, to download and process.",
+)
+@click.option(
+    "--download_workers",
+    type=int,
+    default=DEFAULT_DOWNLOAD_WORKERS,
+    help="Number of concurrent segment downloads.",
+)
+@click.option(
+    "--shard_size_mb",
+    type=float,
+    default=None,
+    help="Repack the processed rows into shards of about this size in <output_dir>/shards, with an index file. Disabled by default.",
+)
+@click.option(
+    "--row_group_size_mb",
+    type=float,
+    default=DEFAULT_ROW_GROUP_SIZE_MB,
+    help="Target Parquet row group size of the shards.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    help="Only process segments that are missing, failed or changed according to the manifest of the output directory.",
+)
+@click.option(
+    "--draft_decode",
+    is_flag=True,
+    help="Decode JPEG camera images at a reduced scale (DCT scaling) before resizing. Much faster on full resolution images.",
+)
+@click.option(
+    "--resample",
+    type=click.Choice(list(RESAMPLING_FILTERS)),
+    default="bicubic",
+    help="Resampling filter used to resize the camera images.",
+)
 @click.option(
     "-d",
     "--download",
@@ -439,76 +1589,110 @@ def main(
     output_dir: str,
     input_dir: str,
     num_threads: int,
+    executor: str,
+    max_in_flight: Optional[int],
     output_filename_base: str,
+    image_format: str,
+    image_quality: int,
+    draft_decode: bool,
+    resample: str,
+    qa_generators: str,
+    num_segments: Optional[int],
+    segment_ids: Optional[str],
+    download_workers: int,
+    shard_size_mb: Optional[float],
+    row_group_size_mb: float,
+    resume: bool,
     download: bool,
 ):
     """Waymo open source perception dataset preprocessing script.
 
     This function orchestrates the data processing pipeline. It performs the
     following steps:
-    1. Parses command-line arguments for input/output directories, threading,
+    1. Parses command-line arguments for input/output directories, workers,
        and download options.
-    2. Optionally downloads the Waymo dataset from GCS if the --download flag
-       is specified.
-    3. Discovers all image and bounding box Parquet files in the input
-       directory.
-    4. Divides the list of files among a specified number of threads.
-    5. Spawns a thread for each subset of files, which calls the `thread_work`
-       function to process the data.
-    6. Waits for all threads to complete their execution.
+    2. With the --download flag, downloads the selected segments from GCS
+       concurrently and yields each segment as soon as its files are present.
+    3. Otherwise, discovers all image and bounding box Parquet files in the
+       input directory, builds one work unit per segment by joining the image
+       and box files on their segment ID and selects the segments.
+    4. Processes the work units on a pool of worker processes (or threads),
+       submitting a new segment as soon as a worker is free.
+    5. Optionally repacks the processed segments into size-balanced shards.
     """
 
-    logger.info("[Dataloader] Starting dataset download locally (if needed).")
+    qa_generator_names = tuple(name.strip() for name in qa_generators.split(","))
+    get_qa_generators(qa_generator_names)  # Fail early on unknown names.
+    selected_ids = _parse_segment_ids(segment_ids)
     if download:
-        _download_dataset_locally(input_dir)
-    logger.info("[Dataloader] Dataset download finished.")
-
-    image_dir = os.path.join(input_dir, "camera_image")
-    box_dir = os.path.join(input_dir, "camera_box")
-    thread_counts = num_threads
-
-    image_parquet_files = sorted((glob.glob(os.path.join(image_dir, "*.parquet"))))
-    box_parquet_files = sorted((glob.glob(os.path.join(box_dir, "*.parquet"))))
-
-    if not image_parquet_files:
-        logger.warning(
-            f"[Dataloader] No image Parquet files found in {image_dir}. Ensure data was downloaded correctly."
+        # Segments are processed while later ones are still downloading.
+        work_units = iter_downloaded_segments(
+            input_dir,
+            num_segments=num_segments,
+            segment_ids=selected_ids,
+            num_workers=download_workers,
         )
+    else:
+        image_dir = os.path.join(input_dir, "camera_image")
+        box_dir = os.path.join(input_dir, "camera_box")
 
-    logger.info(f"[Dataloader] Found {len(image_parquet_files)} image Parquet files.")
-    logger.info(f"[Dataloader] Found {len(box_parquet_files)} box Parquet files.")
-
-    threads = []
-    files_per_thread = math.ceil(len(image_parquet_files) / thread_counts)
+        image_parquet_files = sorted(glob.glob(os.path.join(image_dir, "*.parquet")))
+        box_parquet_files = sorted(glob.glob(os.path.join(box_dir, "*.parquet")))
 
-    for i in range(thread_counts):
-        start_index = i * files_per_thread
-        end_index = min((i + 1) * files_per_thread, len(image_parquet_files))
+        if not image_parquet_files:
+            logger.warning(
+                f"[Dataloader] No image Parquet files found in {image_dir}. Ensure data was downloaded correctly."
+            )
 
-        sub_image_parquet_files = image_parquet_files[start_index:end_index]
-        sub_box_parquet_files = box_parquet_files[start_index:end_index]
         logger.info(
-            f"[Dataloader] Thread - {i}: Processing image files {sub_image_parquet_files} and box files {sub_box_parquet_files}"
-        )
-        thread = threading.Thread(
-            target=thread_work,
-            args=(
-                i,
-                sub_image_parquet_files,
-                sub_box_parquet_files,
-                output_dir,
-                output_filename_base,
-            ),
-            name=f"worker-{i}",
+            f"[Dataloader] Found {len(image_parquet_files)} image Parquet files."
+        )
+        logger.info(f"[Dataloader] Found {len(box_parquet_files)} box Parquet files.")
+
+        work_units = build_work_units(image_parquet_files, box_parquet_files)
+        selected = set(
+            select_segments(
+                [segment_id_of(image) for image, _ in work_units],
+                num_segments,
+                selected_ids,
+            )
         )
-        threads.append(thread)
-        thread.start()
-        logger.info(f"[Dataloader] Started thread {thread.name}")
+        work_units = [
+            work_unit
+            for work_unit in work_units
+            if segment_id_of(work_unit[0]) in selected
+        ]
 
-    for thread in threads:
-        thread.join()
+    logger.info(
+        f"[Dataloader] Processing segments with {num_threads} {executor} workers."
+    )
+    total_rows = run_pipeline(
+        work_units,
+        output_dir=output_dir,
+        output_filename_base=output_filename_base,
+        num_workers=num_threads,
+        executor=executor,
+        max_in_flight=max_in_flight,
+        resume=resume,
+        qa_generators=qa_generator_names,
+        image_options=ImageOptions(
+            image_format=image_format,
+            image_quality=image_quality,
+            draft_decode=draft_decode,
+            resample=resample,
+        ),
+    )
 
-    logger.info("[Dataloader] All threads completed.")
+    logger.info(f"[Dataloader] All workers completed. Wrote {total_rows} rows.")
+
+    if shard_size_mb:
+        write_shards(
+            SegmentManifest(output_dir).done_output_files(output_dir),
+            shard_dir=os.path.join(output_dir, SHARD_DIRNAME),
+            shard_filename_base=output_filename_base,
+            shard_size_mb=shard_size_mb,
+            row_group_size_mb=row_group_size_mb,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,551 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the Waymo perception data processor."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zlib
+from io import BytesIO
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image
+
+# Add the module directory to sys.path so we can import the processor.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import waymo_perception_data_processor as processor
+
+CAMERAS = (processor.CameraName.FRONT, processor.CameraName.SIDE_LEFT)
+
+
+def _jpeg(seed) -> bytes:
+    """Returns a small noise JPEG, which stays large once resized."""
+    pixels = np.random.default_rng(seed).integers(0, 255, (48, 64, 3), np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def write_segment(input_dir: str, segment_id: str, num_frames: int = 2):
+    """Writes the camera image and box files of a small segment.
+
+    Every frame has an image per camera of CAMERAS. The FRONT images have a
+    car and a pedestrian, the other cameras have no box.
+    Returns the (image file, box file) work unit of the segment.
+    """
+    image_rows, box_rows = [], []
+    for frame in range(num_frames):
+        for camera in CAMERAS:
+            image_rows.append(
+                {
+                    processor.FRAME_TIMESTAMP_COLUMN: 1000 + frame,
+                    processor.CAMERA_NAME_COLUMN: int(camera),
+                    processor.IMAGE_COLUMN: _jpeg(
+                        zlib.crc32(f"{segment_id}/{frame}/{camera}".encode())
+                    ),
+                }
+            )
+        for box_type in (
+            processor.LabelType.TYPE_CAR,
+            processor.LabelType.TYPE_PEDESTRIAN,
+        ):
+            box_rows.append(
+                {
+                    processor.FRAME_TIMESTAMP_COLUMN: 1000 + frame,
+                    processor.CAMERA_NAME_COLUMN: int(processor.CameraName.FRONT),
+                    processor.BOX_TYPE_COLUMN: int(box_type),
+                    processor.BOX_CENTER_X_COLUMN: 100.0,
+                    processor.BOX_SIZE_X_COLUMN: 50.0,
+                    processor.BOX_SIZE_Y_COLUMN: 40.0,
+                }
+            )
+    image_file = os.path.join(input_dir, "camera_image", segment_id + ".parquet")
+    box_file = os.path.join(input_dir, "camera_box", segment_id + ".parquet")
+    os.makedirs(os.path.dirname(image_file), exist_ok=True)
+    os.makedirs(os.path.dirname(box_file), exist_ok=True)
+    pd.DataFrame(image_rows).to_parquet(image_file)
+    pd.DataFrame(box_rows).to_parquet(box_file)
+    return image_file, box_file
+
+
+class TestProcessWaymoData(unittest.TestCase):
+    """Pins the question/answer rows generated for a fixed frame/box table."""
+
+    def setUp(self):
+        front, side_left = int(CAMERAS[0]), int(CAMERAS[1])
+        self.camera_image_df = pd.DataFrame(
+            {
+                processor.FRAME_TIMESTAMP_COLUMN: [1, 1, 2, 2],
+                processor.CAMERA_NAME_COLUMN: [front, side_left, front, side_left],
+                processor.IMAGE_COLUMN: [_jpeg(i) for i in range(4)],
+            }
+        )
+        car, pedestrian, sign = (
+            int(processor.LabelType.TYPE_CAR),
+            int(processor.LabelType.TYPE_PEDESTRIAN),
+            int(processor.LabelType.TYPE_SIGN),
+        )
+        # The FRONT image at 1 has a small car on the left, a medium
+        # pedestrian in the center and a large car on the right, the
+        # SIDE_LEFT image at 1 has no box.
+        self.camera_box_df = pd.DataFrame(
+            [
+                (1, front, car, 100.0, 50.0, 40.0),
+                (1, front, car, 1500.0, 400.0, 300.0),
+                (1, front, pedestrian, 900.0, 100.0, 100.0),
+                (2, front, sign, 700.0, 10.0, 10.0),
+                (2, side_left, 99, 1919.0, 300.0, 300.0),
+            ],
+            columns=[
+                processor.FRAME_TIMESTAMP_COLUMN,
+                processor.CAMERA_NAME_COLUMN,
+                processor.BOX_TYPE_COLUMN,
+                processor.BOX_CENTER_X_COLUMN,
+                processor.BOX_SIZE_X_COLUMN,
+                processor.BOX_SIZE_Y_COLUMN,
+            ],
+        )
+
+    def test_question_answer_rows(self):
+        rows = processor.process_waymo_data(
+            self.camera_image_df,
+            self.camera_box_df,
+            image_options=processor.ImageOptions(image_format="jpeg"),
+            qa_generators=tuple(processor.QA_GENERATORS),
+        )
+        self.assertEqual(
+            [(row["question"], row["multiple_choice_answer"]) for row in rows],
+            [
+                (
+                    "What objects are visible in the FRONT image at timestamp 1?",
+                    "Objects: TYPE_CAR, TYPE_PEDESTRIAN.",
+                ),
+                (
+                    "How many objects of each type are visible in the FRONT image at timestamp 1?",
+                    "Counts: 2 TYPE_CAR, 1 TYPE_PEDESTRIAN.",
+                ),
+                (
+                    "How many small, medium and large objects are visible in the FRONT image at timestamp 1?",
+                    "Small: 1, medium: 1, large: 1.",
+                ),
+                (
+                    "Where are the objects in the FRONT image at timestamp 1, from left to right?",
+                    "Left: TYPE_CAR. Center: TYPE_PEDESTRIAN. Right: TYPE_CAR.",
+                ),
+                (
+                    "Are there any common objects visible in the SIDE_LEFT image at timestamp 1?",
+                    "No common objects detected.",
+                ),
+                (
+                    "What objects are visible in the FRONT image at timestamp 2?",
+                    "Objects: TYPE_SIGN.",
+                ),
+                (
+                    "How many objects of each type are visible in the FRONT image at timestamp 2?",
+                    "Counts: 1 TYPE_SIGN.",
+                ),
+                (
+                    "How many small, medium and large objects are visible in the FRONT image at timestamp 2?",
+                    "Small: 1, medium: 0, large: 0.",
+                ),
+                (
+                    "Where are the objects in the FRONT image at timestamp 2, from left to right?",
+                    "Center: TYPE_SIGN.",
+                ),
+                (
+                    "What objects are visible in the SIDE_LEFT image at timestamp 2?",
+                    "Objects: Unknown.",
+                ),
+                (
+                    "How many objects of each type are visible in the SIDE_LEFT image at timestamp 2?",
+                    "Counts: 1 Unknown.",
+                ),
+                (
+                    "How many small, medium and large objects are visible in the SIDE_LEFT image at timestamp 2?",
+                    "Small: 0, medium: 0, large: 1.",
+                ),
+                (
+                    "Where are the objects in the SIDE_LEFT image at timestamp 2, from left to right?",
+                    "Right: Unknown.",
+                ),
+            ],
+        )
+        # Every image is decoded once and shared by its rows.
+        images = [row["image"]["bytes"] for row in rows]
+        self.assertEqual(len(set(images)), 4)
+        self.assertEqual(len(set(images[:4])), 1)
+        self.assertEqual(
+            Image.open(BytesIO(images[0])).size, processor.OUTPUT_IMAGE_SIZE
+        )
+
+    def test_batches_match_whole_segment(self):
+        generators = tuple(processor.QA_GENERATORS)
+        box_groups = processor.group_boxes(
+            self.camera_box_df, processor.get_qa_generators(generators)
+        )
+        rows = processor.process_waymo_data(
+            self.camera_image_df, self.camera_box_df, qa_generators=generators
+        )
+        batched_rows = [
+            row
+            for start in range(0, 4, 3)
+            for row in processor.process_waymo_data(
+                self.camera_image_df.iloc[start : start + 3],
+                None,
+                box_groups=box_groups,
+                qa_generators=generators,
+            )
+        ]
+        self.assertEqual(
+            [(r["question"], r["multiple_choice_answer"]) for r in batched_rows],
+            [(r["question"], r["multiple_choice_answer"]) for r in rows],
+        )
+
+    def test_images_without_boxes(self):
+        rows = processor.process_waymo_data(
+            self.camera_image_df.iloc[:2],
+            None,
+            qa_generators=tuple(processor.QA_GENERATORS),
+        )
+        # Only the objects generator has a row for an image without boxes.
+        self.assertEqual(
+            [row["multiple_choice_answer"] for row in rows],
+            ["No common objects detected."] * 2,
+        )
+
+
+class TestMatchSegmentFiles(unittest.TestCase):
+    """Tests for the join of the image and box files on their segment ID."""
+
+    def test_pairs_sorted_by_segment(self):
+        pairs, unmatched_boxes = processor.match_segment_files(
+            ["images/b.parquet", "images/a.parquet"],
+            ["boxes/a.parquet", "boxes/b.parquet"],
+        )
+        self.assertEqual(
+            pairs,
+            [
+                ("images/a.parquet", "boxes/a.parquet"),
+                ("images/b.parquet", "boxes/b.parquet"),
+            ],
+        )
+        self.assertEqual(unmatched_boxes, [])
+
+    def test_duplicate_files(self):
+        with self.assertLogs(processor.logger, "WARNING") as logs:
+            pairs, unmatched_boxes = processor.match_segment_files(
+                ["images/a.parquet", "other/a.parquet"],
+                ["boxes/a.parquet", "other/a.parquet"],
+            )
+        # The first file of a segment is used.
+        self.assertEqual(pairs, [("images/a.parquet", "boxes/a.parquet")])
+        self.assertEqual(unmatched_boxes, [])
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("Duplicate image file for segment a", logs.output[0])
+        self.assertIn("Duplicate box file for segment a", logs.output[1])
+
+    def test_missing_box_file(self):
+        with self.assertLogs(processor.logger, "WARNING") as logs:
+            work_units = processor.build_work_units(
+                ["images/a.parquet", "images/b.parquet"], ["boxes/b.parquet"]
+            )
+        # The segment is processed with images only.
+        self.assertEqual(
+            work_units,
+            [("images/a.parquet", None), ("images/b.parquet", "boxes/b.parquet")],
+        )
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("1 segments have no box file", logs.output[0])
+        self.assertIn("['a']", logs.output[0])
+
+    def test_unmatched_box_file(self):
+        pairs, unmatched_boxes = processor.match_segment_files(
+            ["images/a.parquet"], ["boxes/c.parquet", "boxes/a.parquet"]
+        )
+        self.assertEqual(pairs, [("images/a.parquet", "boxes/a.parquet")])
+        self.assertEqual(unmatched_boxes, ["boxes/c.parquet"])
+        with self.assertLogs(processor.logger, "WARNING") as logs:
+            work_units = processor.build_work_units(
+                ["images/a.parquet"], ["boxes/c.parquet", "boxes/a.parquet"]
+            )
+        # The box file is ignored.
+        self.assertEqual(work_units, pairs)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("1 box files have no image file", logs.output[0])
+        self.assertIn("['c']", logs.output[0])
+
+
+class TestRunPipeline(unittest.TestCase):
+    """Tests for the segment manifest and the resumable pipeline."""
+
+    def setUp(self):
+        self.input_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.work_units = [
+            write_segment(self.input_dir, f"segment_{i}") for i in range(3)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.input_dir)
+        shutil.rmtree(self.output_dir)
+
+    def run_pipeline(self, resume=True):
+        """Runs the pipeline on threads, returns the processed segment IDs."""
+        with mock.patch.object(
+            processor, "process_segment", wraps=processor.process_segment
+        ) as process_segment:
+            processor.run_pipeline(
+                self.work_units,
+                output_dir=self.output_dir,
+                output_filename_base="waymo",
+                num_workers=2,
+                executor=processor.EXECUTOR_THREAD,
+                resume=resume,
+                image_options=processor.ImageOptions(image_format="jpeg"),
+            )
+        return sorted(
+            processor.segment_id_of(call.args[0][0])
+            for call in process_segment.call_args_list
+        )
+
+    def output_files(self):
+        return sorted(f for f in os.listdir(self.output_dir) if f != "manifest.json")
+
+    def test_resume_skips_done_segments(self):
+        self.assertEqual(self.run_pipeline(), ["segment_0", "segment_1", "segment_2"])
+        manifest = processor.SegmentManifest(self.output_dir)
+        self.assertEqual(
+            [entry["num_rows"] for _, entry in sorted(manifest.entries.items())],
+            [4, 4, 4],
+        )
+        self.assertEqual(self.run_pipeline(), [])
+        self.assertEqual(
+            self.run_pipeline(resume=False), ["segment_0", "segment_1", "segment_2"]
+        )
+
+    def test_resume_reprocesses_failed_and_changed_segments(self):
+        image_file, _ = self.work_units[1]
+        with open(image_file, "rb") as f:
+            segment = f.read()
+        with open(image_file, "wb") as f:
+            f.write(b"not parquet")
+        self.run_pipeline()
+        manifest = processor.SegmentManifest(self.output_dir)
+        self.assertEqual(
+            manifest.entries["segment_1"]["status"],
+            processor.SegmentManifest.STATUS_FAILED,
+        )
+        self.assertEqual(
+            self.output_files(), ["waymo_segment_0.parquet", "waymo_segment_2.parquet"]
+        )
+
+        # The failed segment is fixed and another one changes.
+        with open(image_file, "wb") as f:
+            f.write(segment)
+        write_segment(self.input_dir, "segment_2", num_frames=3)
+        self.assertEqual(self.run_pipeline(), ["segment_1", "segment_2"])
+        manifest = processor.SegmentManifest(self.output_dir)
+        self.assertEqual(manifest.entries["segment_2"]["num_rows"], 6)
+        self.assertEqual(len(manifest.done_output_files(self.output_dir)), 3)
+
+        # A deleted output file is written again.
+        os.remove(os.path.join(self.output_dir, "waymo_segment_0.parquet"))
+        self.assertEqual(self.run_pipeline(), ["segment_0"])
+
+    def test_failed_segment_is_skipped_whole(self):
+        read_image_batches = processor.read_image_batches
+
+        def read_one_image_at_a_time(image_file):
+            batches = read_image_batches(image_file, batch_size=1)
+            yield next(batches)
+            if processor.segment_id_of(image_file) == "segment_0":
+                raise OSError("truncated segment")
+            yield from batches
+
+        image_files = [image for image, _ in self.work_units[:2]]
+        box_files = [box for _, box in self.work_units[:2]]
+        with mock.patch.object(
+            processor, "read_image_batches", read_one_image_at_a_time
+        ):
+            num_rows = processor.load_waymo_data_to_dataset(
+                image_files,
+                box_files,
+                self.output_dir,
+                "waymo",
+                image_options=processor.ImageOptions(image_format="jpeg"),
+            )
+            # Only the rows of segment_1 are written.
+            self.assertEqual(num_rows, 4)
+            output = pq.read_table(
+                os.path.join(self.output_dir, "waymo_segment_0.parquet")
+            )
+            self.assertEqual(output.num_rows, 4)
+            with self.assertRaises(OSError):
+                processor.load_waymo_data_to_dataset(
+                    image_files,
+                    box_files,
+                    self.output_dir,
+                    "waymo",
+                    skip_failed_segments=False,
+                )
+
+    def test_interrupted_write_leaves_no_output(self):
+        def interrupted_batches():
+            yield [
+                {
+                    "image": {"bytes": _jpeg(0), "path": None},
+                    "question": "question",
+                    "multiple_choice_answer": "answer",
+                }
+            ]
+            raise KeyboardInterrupt
+
+        output_path = os.path.join(self.output_dir, "waymo_segment_0.parquet")
+        for save in (processor._save_encoded_batches, processor._save_as_dataset):
+            with self.subTest(save.__name__), self.assertRaises(KeyboardInterrupt):
+                save(interrupted_batches(), output_path)
+            self.assertEqual(os.listdir(self.output_dir), [])
+
+        # A segment failing after its first batch has no output either.
+        read_image_batches = processor.read_image_batches
+
+        def failing_read(image_file):
+            batches = read_image_batches(image_file, batch_size=1)
+            yield next(batches)
+            raise OSError("truncated segment")
+
+        with mock.patch.object(processor, "read_image_batches", failing_read):
+            self.run_pipeline()
+        self.assertEqual(self.output_files(), [])
+        manifest = processor.SegmentManifest(self.output_dir)
+        self.assertEqual(
+            {entry["status"] for entry in manifest.entries.values()},
+            {processor.SegmentManifest.STATUS_FAILED},
+        )
+
+
+class TestShards(unittest.TestCase):
+    """Tests for the repacking of the segment outputs into shards."""
+
+    def setUp(self):
+        self.input_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        # Every generator adds a row sharing the image of the objects row.
+        processor.run_pipeline(
+            [write_segment(self.input_dir, f"segment_{i}") for i in range(3)],
+            output_dir=self.output_dir,
+            output_filename_base="waymo",
+            num_workers=1,
+            executor=processor.EXECUTOR_THREAD,
+            qa_generators=tuple(processor.QA_GENERATORS),
+            image_options=processor.ImageOptions(image_format="jpeg"),
+        )
+        self.segment_files = processor.SegmentManifest(
+            self.output_dir
+        ).done_output_files(self.output_dir)
+        self.rows = pa.concat_tables(pq.read_table(f) for f in self.segment_files)
+        self.row_bytes = processor._stored_row_bytes(self.rows)
+        self.shard_dir = os.path.join(self.output_dir, processor.SHARD_DIRNAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.input_dir)
+        shutil.rmtree(self.output_dir)
+
+    def test_plan_shards(self):
+        self.assertEqual(self.rows.num_rows, 30)
+        shard_size_mb = 6 * self.row_bytes.mean() / 1024 / 1024
+        shards = processor.plan_shards(self.segment_files, shard_size_mb)
+        self.assertGreater(len(shards), 3)
+        planned_rows = [
+            (segment_file, row)
+            for pieces in shards
+            for segment_file, start, end in pieces
+            for row in range(start, end)
+        ]
+        self.assertEqual(
+            planned_rows,
+            [
+                (segment_file, row)
+                for segment_file in self.segment_files
+                for row in range(pq.ParquetFile(segment_file).metadata.num_rows)
+            ],
+        )
+        start = 0
+        for pieces in shards[:-1]:
+            end = start + sum(end - start for _, start, end in pieces)
+            self.assertLessEqual(
+                abs(self.row_bytes[start:end].sum() - shard_size_mb * 1024 * 1024),
+                self.row_bytes.max() / 2,
+            )
+            start = end
+
+    def test_write_shards(self):
+        shard_size_mb = 8 * self.row_bytes.mean() / 1024 / 1024
+        index = processor.write_shards(
+            self.segment_files,
+            self.shard_dir,
+            "waymo",
+            shard_size_mb=shard_size_mb,
+            row_group_size_mb=shard_size_mb / 2,
+        )
+        with open(os.path.join(self.shard_dir, processor.SHARD_INDEX_FILENAME)) as f:
+            self.assertEqual(json.load(f), {"num_rows": 30, "shards": index})
+        self.assertEqual(
+            sorted(os.listdir(self.shard_dir)),
+            sorted([processor.SHARD_INDEX_FILENAME] + [s["file"] for s in index]),
+        )
+        for shard in index:
+            shard_path = os.path.join(self.shard_dir, shard["file"])
+            metadata = pq.ParquetFile(shard_path).metadata
+            self.assertEqual(shard["num_rows"], metadata.num_rows)
+            self.assertEqual(shard["num_bytes"], os.path.getsize(shard_path))
+            self.assertEqual(
+                shard["row_groups"],
+                [
+                    metadata.row_group(i).num_rows
+                    for i in range(metadata.num_row_groups)
+                ],
+            )
+            self.assertEqual(sum(shard["row_groups"]), shard["num_rows"])
+        # The shared images are stored once per row, so the shards are about
+        # the planned size.
+        for shard in index[:-1]:
+            self.assertAlmostEqual(
+                shard["num_bytes"] / (shard_size_mb * 1024 * 1024), 1.0, delta=0.1
+            )
+        shards = pa.concat_tables(
+            pq.read_table(os.path.join(self.shard_dir, shard["file"]))
+            for shard in index
+        )
+        self.assertTrue(shards.equals(self.rows))
+
+        # A smaller rewrite removes the shards of the previous run.
+        index = processor.write_shards(
+            self.segment_files, self.shard_dir, "waymo", shard_size_mb=1024
+        )
+        self.assertEqual(len(index), 1)
+        self.assertEqual(len(os.listdir(self.shard_dir)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
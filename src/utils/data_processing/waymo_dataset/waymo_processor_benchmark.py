@@ -0,0 +1,255 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput benchmark of the Waymo perception processor on synthetic data."""
+
+import os
+import random
+import shutil
+import tempfile
+import time
+from io import BytesIO
+from typing import List
+
+import click
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from PIL import Image
+
+import waymo_perception_data_processor as processor
+
+IMAGE_SIZE = (1920, 1280)
+
+
+def _synthetic_jpeg(rng: np.random.Generator) -> bytes:
+    """Returns a full resolution camera-like JPEG.
+
+    A low resolution noise pattern is upscaled so the image has some structure
+    and compresses like a real camera frame rather than like pure noise.
+    """
+    width, height = IMAGE_SIZE
+    pattern = rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(pattern).resize(IMAGE_SIZE, Image.Resampling.BILINEAR)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def generate_synthetic_segments(
+    input_dir: str,
+    num_segments: int,
+    frames_per_segment: int,
+    seed: int = 0,
+) -> None:
+    """Writes synthetic camera_image/camera_box Parquet segments to input_dir."""
+    rng = np.random.default_rng(seed)
+    py_rng = random.Random(seed)
+    image_dir = os.path.join(input_dir, "camera_image")
+    box_dir = os.path.join(input_dir, "camera_box")
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(box_dir, exist_ok=True)
+    # Encoding is the slow part of the generation, so a pool of images is reused.
+    jpeg_pool = [_synthetic_jpeg(rng) for _ in range(8)]
+
+    for segment_index in range(num_segments):
+        segment_name = f"synthetic_segment_{segment_index:05d}"
+        image_rows = []
+        box_rows = []
+        for frame_index in range(frames_per_segment):
+            frame_ts = 100_000 * frame_index + segment_index
+            for camera in processor.CameraName:
+                if camera == processor.CameraName.UNKNOWN:
+                    continue
+                image_rows.append(
+                    {
+                        "key.segment_context_name": segment_name,
+                        processor.FRAME_TIMESTAMP_COLUMN: frame_ts,
+                        processor.CAMERA_NAME_COLUMN: int(camera),
+                        processor.IMAGE_COLUMN: py_rng.choice(jpeg_pool),
+                    }
+                )
+                for object_index in range(py_rng.randint(0, 8)):
+                    box_rows.append(
+                        {
+                            "key.segment_context_name": segment_name,
+                            processor.FRAME_TIMESTAMP_COLUMN: frame_ts,
+                            processor.CAMERA_NAME_COLUMN: int(camera),
+                            "key.camera_object_id": f"object_{object_index}",
+                            processor.BOX_TYPE_COLUMN: py_rng.randint(1, 4),
+                        }
+                    )
+        pd.DataFrame(image_rows).to_parquet(
+            os.path.join(image_dir, segment_name + ".parquet")
+        )
+        pd.DataFrame(box_rows).to_parquet(
+            os.path.join(box_dir, segment_name + ".parquet")
+        )
+
+
+def run_benchmark(
+    input_dir: str,
+    output_dir: str,
+    workers: List[int],
+    executors: List[str],
+    **load_kwargs,
+) -> List[dict]:
+    """Runs the pipeline for every executor and worker count.
+
+    load_kwargs are passed to the processor, e.g. the image_options.
+    Returns one result per run with the number of decoded images, written
+    rows and images/s. Every camera image is decoded once, whatever the
+    number of question/answer rows generated from it.
+    """
+    image_files = [
+        os.path.join(input_dir, "camera_image", f)
+        for f in os.listdir(os.path.join(input_dir, "camera_image"))
+    ]
+    box_files = [
+        os.path.join(input_dir, "camera_box", f)
+        for f in os.listdir(os.path.join(input_dir, "camera_box"))
+    ]
+    work_units = processor.build_work_units(image_files, box_files)
+    num_images = sum(pq.ParquetFile(f).metadata.num_rows for f in image_files)
+
+    results = []
+    for executor in executors:
+        for num_workers in workers:
+            run_output_dir = os.path.join(output_dir, f"{executor}_{num_workers}")
+            start = time.perf_counter()
+            num_rows = processor.run_pipeline(
+                work_units,
+                output_dir=run_output_dir,
+                output_filename_base="benchmark",
+                num_workers=num_workers,
+                executor=executor,
+                **load_kwargs,
+            )
+            elapsed = time.perf_counter() - start
+            shutil.rmtree(run_output_dir, ignore_errors=True)
+            results.append(
+                {
+                    "executor": executor,
+                    "workers": num_workers,
+                    "images": num_images,
+                    "rows": num_rows,
+                    "seconds": elapsed,
+                    "images_per_s": num_images / elapsed,
+                }
+            )
+    return results
+
+
+@click.command()
+@click.option(
+    "--num_segments",
+    type=int,
+    default=16,
+    help="Number of synthetic segments to generate.",
+)
+@click.option(
+    "--frames_per_segment",
+    type=int,
+    default=20,
+    help="Number of frames per segment, each frame has one image per camera.",
+)
+@click.option(
+    "--workers",
+    type=str,
+    default="1,2,4,8",
+    help="Comma separated list of worker counts to benchmark.",
+)
+@click.option(
+    "--executors",
+    type=str,
+    default=f"{processor.EXECUTOR_THREAD},{processor.EXECUTOR_PROCESS}",
+    help="Comma separated list of executors to benchmark.",
+)
+@click.option(
+    "--image_format",
+    type=click.Choice(
+        [processor.IMAGE_FORMAT_DATASET] + list(processor.ENCODED_IMAGE_FORMATS)
+    ),
+    default=processor.IMAGE_FORMAT_DATASET,
+    help="Output image format of the processor.",
+)
+@click.option(
+    "--draft_decode",
+    type=str,
+    default="false,true",
+    help="Comma separated list of draft decode settings to benchmark.",
+)
+@click.option(
+    "--resample",
+    type=click.Choice(list(processor.RESAMPLING_FILTERS)),
+    default="bicubic",
+    help="Resampling filter used to resize the camera images.",
+)
+@click.option(
+    "--work_dir",
+    type=str,
+    default=None,
+    help="Directory for the synthetic data. A temporary directory is used by default.",
+)
+def main(
+    num_segments: int,
+    frames_per_segment: int,
+    workers: str,
+    executors: str,
+    image_format: str,
+    draft_decode: str,
+    resample: str,
+    work_dir: str,
+):
+    """Measures images/s of the Waymo processor against the number of workers."""
+    cleanup = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="waymo_benchmark_")
+    input_dir = os.path.join(work_dir, "input")
+    try:
+        if not os.path.isdir(os.path.join(input_dir, "camera_image")):
+            generate_synthetic_segments(input_dir, num_segments, frames_per_segment)
+        results = []
+        for draft in draft_decode.split(","):
+            image_options = processor.ImageOptions(
+                image_format=image_format,
+                draft_decode=draft.strip().lower() == "true",
+                resample=resample,
+            )
+            for result in run_benchmark(
+                input_dir,
+                os.path.join(work_dir, "output"),
+                workers=[int(w) for w in workers.split(",")],
+                executors=executors.split(","),
+                image_options=image_options,
+            ):
+                result["draft_decode"] = image_options.draft_decode
+                results.append(result)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(
+        f"{'executor':<10}{'draft':<7}{'workers':>8}{'images':>8}{'rows':>8}"
+        f"{'seconds':>10}{'images/s':>10}"
+    )
+    for result in results:
+        print(
+            f"{result['executor']:<10}{str(result['draft_decode']):<7}"
+            f"{result['workers']:>8}{result['images']:>8}{result['rows']:>8}"
+            f"{result['seconds']:>10.2f}{result['images_per_s']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
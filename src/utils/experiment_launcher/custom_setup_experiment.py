@@ -0,0 +1,409 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sets up and runs a Megatron-Bridge performance experiment on the local node.
+
+The launcher of a recipe copies this file to scripts/performance/ of a
+Megatron-Bridge checkout and runs it on every rank, passing the declarative
+configuration of the recipe:
+
+    python scripts/performance/custom_setup_experiment.py \\
+        --recipe_config scripts/performance/recipe_config.json
+
+The recipe configuration is a JSON object mapping scripts/performance
+argument names to values, e.g. {"gpu": "gb200", "num_gpus": 256,
+"tensor_model_parallel_size": 4}. Arguments following --recipe_config on the
+command line take precedence over the configuration. The optional
+"launcher_options" object of the configuration sets options of this launcher,
+e.g. {"experiment_name": "{model_recipe_name}_{model_family_name}"}.
+"""
+
+import importlib
+import inspect
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+ENTRYPOINT_PEFORMANCE = "run_script.py"
+ENTRYPOINT_RECIPE = "run_recipe.py"
+
+RECIPE_CONFIG_FLAG = "--recipe_config"
+# Key of the recipe configuration holding Hydra style overrides, e.g.
+# logger.log_throughput=True, passed as positional arguments.
+CONFIG_OVERRIDES_KEY = "config_overrides"
+# Key of the recipe configuration holding the options of this launcher, not
+# passed to scripts/performance:
+#   experiment_name: format string of the experiment name, fields are the
+#     parsed arguments, e.g. "{model_recipe_name}_{model_family_name}".
+#   executor_env_vars: if true, --custom_env_vars and the NCCL user buffer
+#     variables of --nccl_ub are set in the environment of the local executor.
+LAUNCHER_OPTIONS_KEY = "launcher_options"
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def load_recipe_config(path: str) -> dict:
+    """Loads the JSON configuration of a recipe."""
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"Recipe config {path} must be a JSON object")
+    return config
+
+
+def recipe_config_args(config: dict) -> List[str]:
+    """Renders a recipe configuration as scripts/performance arguments.
+
+    true values become flags without a value, false values are omitted and
+    null values are passed as None.
+
+    Args:
+        config (dict): recipe configuration
+
+    Returns:
+        List[str]: command line arguments
+    """
+    args = []
+    for key, value in config.items():
+        if key in (CONFIG_OVERRIDES_KEY, LAUNCHER_OPTIONS_KEY):
+            continue
+        if value is True:
+            args.append(f"--{key}")
+        elif value is not False:
+            args.extend([f"--{key}", str(value)])
+    args.extend(config.get(CONFIG_OVERRIDES_KEY, []))
+    return args
+
+
+def recipe_command(config: dict, argv: List[str]) -> List[str]:
+    """Returns the effective arguments of a recipe configuration and argv."""
+    return recipe_config_args(config) + list(argv)
+
+
+def _expand_recipe_config(argv: List[str]) -> Tuple[List[str], dict]:
+    for i, arg in enumerate(argv):
+        if arg == RECIPE_CONFIG_FLAG:
+            if i + 1 == len(argv):
+                raise ValueError(f"{RECIPE_CONFIG_FLAG} requires a path")
+            path, rest = argv[i + 1], argv[i + 2 :]
+        elif arg.startswith(RECIPE_CONFIG_FLAG + "="):
+            path, rest = arg.split("=", 1)[1], argv[i + 1 :]
+        else:
+            continue
+        config = load_recipe_config(path)
+        return argv[:i] + recipe_command(config, rest), config
+    return list(argv), {}
+
+
+def expand_recipe_config(argv: List[str]) -> List[str]:
+    """Replaces --recipe_config <path> in argv by the recipe arguments.
+
+    Args:
+        argv (List[str]): command line arguments, without the program name
+
+    Returns:
+        List[str]: argv with the configuration expanded, unchanged if
+            --recipe_config is not given
+    """
+    return _expand_recipe_config(argv)[0]
+
+
+def _supported_kwargs(callable_, **kwargs) -> dict:
+    """Drops the keyword arguments a callable does not accept.
+
+    The scripts/performance plugins take different arguments across
+    Megatron-Bridge releases.
+    """
+    parameters = inspect.signature(callable_).parameters
+    if any(p.kind == p.VAR_KEYWORD for p in parameters.values()):
+        return kwargs
+    return {key: value for key, value in kwargs.items() if key in parameters}
+
+
+def _is_probed_module(error: ModuleNotFoundError, module_name: str) -> bool:
+    """Whether an import error is the module, or one of its packages, missing."""
+    return error.name is not None and (
+        module_name == error.name or module_name.startswith(f"{error.name}.")
+    )
+
+
+def _import_performance_module(name: str, required: bool = False):
+    """Imports a module of scripts/performance, if this release has it.
+
+    Only the module itself, or one of its packages, missing means that the
+    release does not have it. Every other error, e.g. a missing dependency or
+    a syntax error of the module, is raised.
+
+    Args:
+        name (str): module name relative to scripts/performance
+        required (bool): raise a ModuleNotFoundError instead of returning None
+            if the module is missing
+
+    Returns:
+        the module, None if this release does not have it
+    """
+    module_names = [name]
+    if __package__:
+        module_names.append(f"{__package__}.{name}")
+    for module_name in module_names:
+        try:
+            return importlib.import_module(module_name)
+        except ModuleNotFoundError as e:
+            if not _is_probed_module(e, module_name):
+                raise
+    if required:
+        raise ModuleNotFoundError(
+            f"No module {name} in {SCRIPT_DIR}, this file is expected in "
+            "scripts/performance of a Megatron-Bridge checkout",
+            name=name,
+        )
+    return None
+
+
+def _parse_args(argv: List[str]):
+    argument_parser = _import_performance_module("argument_parser", required=True)
+    parsed = argument_parser.parse_cli_args()
+    # Older releases parse sys.argv and return (args, unknown_args).
+    if isinstance(parsed, tuple):
+        return parsed
+    return parsed.parse_known_args(argv)
+
+
+def _model_recipe_name(args) -> str:
+    name = getattr(args, "model_recipe_name", None)
+    if name is None:
+        name = (
+            f"{getattr(args, 'model_name', None)}_{getattr(args, 'model_size', None)}"
+        )
+    return name
+
+
+def _env_vars(args) -> Dict[str, str]:
+    env_vars = getattr(args, "custom_env_vars", None) or {}
+    if not isinstance(env_vars, dict):
+        env_vars = dict(var.split("=", 1) for var in env_vars)
+    env_vars = dict(env_vars)
+    if getattr(args, "nccl_ub", False):
+        env_vars.update({"NCCL_NVLS_ENABLE": "1", "NCCL_CTA_POLICY": "1"})
+    return env_vars
+
+
+def _wandb_names(args) -> Tuple[Optional[str], Optional[str]]:
+    """Returns the WandB (project, experiment) names.
+
+    The argument parser of the NeMo 25.11 recipes with --model_name names them
+    --wandb_prj_name and --wandb_exp_name.
+    """
+    project = getattr(args, "wandb_project_name", None)
+    if project is None:
+        project = getattr(args, "wandb_prj_name", None)
+    experiment = getattr(args, "wandb_experiment_name", None)
+    if experiment is None:
+        experiment = getattr(args, "wandb_exp_name", None)
+    return project, experiment
+
+
+def experiment_name(
+    args, config_variant: Optional[str], rank: str, name_format: Optional[str] = None
+) -> str:
+    """Returns the NeMo-Run experiment name of a rank.
+
+    Args:
+        args: parsed scripts/performance arguments
+        config_variant (str): configuration variant of the recipe
+        rank (str): rank of the local process
+        name_format (str): format string of the name, fields are the parsed
+            arguments. If not given, the name of the Megatron-Bridge
+            scripts/performance/setup_experiment.py is used.
+
+    Returns:
+        str: experiment name
+    """
+    if name_format is not None:
+        return f"{name_format.format(**vars(args))}_worker{rank}"
+
+    model_recipe_name = _model_recipe_name(args)
+    task = getattr(args, "task", "pretrain")
+    _, exp_name = _wandb_names(args)
+    if exp_name is None and getattr(args, "use_recipes", False):
+        exp_name = f"{model_recipe_name}_{task}_{args.num_gpus}gpu_{args.gpu}"
+    elif exp_name is None:
+        exp_name = f"{task}_{model_recipe_name}_{args.compute_dtype}"
+        utils = _import_performance_module("utils.utils")
+        if hasattr(utils, "get_exp_name_config"):
+            exp_config = utils.get_exp_name_config(
+                args,
+                args.model_family_name,
+                model_recipe_name,
+                args.gpu,
+                args.compute_dtype,
+                task,
+                config_variant,
+            )
+            exp_name += f"_{exp_config}"
+    return f"{exp_name}_worker{rank}"
+
+
+def _plugins(args, config_variant: Optional[str]) -> list:
+    perf_plugins = _import_performance_module("perf_plugins", required=True)
+    task = getattr(args, "task", "pretrain")
+    profiling = dict(
+        profile_step_start=args.profiling_start_step,
+        profile_step_end=args.profiling_stop_step,
+        profile_ranks=getattr(args, "profiling_ranks", None),
+    )
+
+    plugins = []
+    if not getattr(args, "use_recipes", False):
+        plugins.append(
+            perf_plugins.PerfEnvPlugin(
+                **_supported_kwargs(
+                    perf_plugins.PerfEnvPlugin,
+                    enable_vboost=args.enable_vboost,
+                    moe_a2a_overlap=args.moe_a2a_overlap,
+                    tp_size=args.tensor_model_parallel_size,
+                    pp_size=args.pipeline_model_parallel_size,
+                    cp_size=args.context_parallel_size,
+                    ep_size=getattr(args, "expert_model_parallel_size", None),
+                    model_family_name=getattr(args, "model_family_name", None),
+                    model_recipe_name=getattr(args, "model_recipe_name", None),
+                    model_name=getattr(args, "model_name", None),
+                    model_size=getattr(args, "model_size", None),
+                    domain=getattr(args, "domain", None),
+                    use_tokendrop=getattr(args, "use_tokendrop", None),
+                    gpu=args.gpu,
+                    compute_dtype=args.compute_dtype,
+                    train_task=task,
+                    task=task,
+                    config_variant=config_variant,
+                )
+            )
+        )
+    if args.enable_nsys:
+        plugins.append(
+            perf_plugins.NsysPlugin(
+                **_supported_kwargs(
+                    perf_plugins.NsysPlugin,
+                    nsys_gpu_metrics=args.profiling_gpu_metrics,
+                    nsys_trace=getattr(args, "nsys_trace", None),
+                    nsys_extra_args=getattr(args, "nsys_extra_args", None),
+                    **profiling,
+                )
+            )
+        )
+    if getattr(args, "pytorch_profiler", False):
+        plugins.append(
+            perf_plugins.PyTorchProfilerPlugin(
+                **_supported_kwargs(
+                    perf_plugins.PyTorchProfilerPlugin,
+                    record_memory_history=args.record_memory_history,
+                    **profiling,
+                )
+            )
+        )
+    return plugins
+
+
+def main(argv: List[str]):
+    """Sets up the experiment of the local rank and runs it."""
+    import nemo_run as run
+
+    argv, config = _expand_recipe_config(argv)
+    options = config.get(LAUNCHER_OPTIONS_KEY, {})
+    # The run script and older argument parsers read sys.argv.
+    sys.argv = sys.argv[:1] + argv
+    args, unknown_args = _parse_args(argv)
+
+    assert not (
+        args.enable_nsys and getattr(args, "pytorch_profiler", False)
+    ), "Both NSys and PyTorch profiler cannot be enabled at the same time"
+    # probably better to use parser.parse_args() and make unknowns an error,
+    # but for now we'll just issue a warning.
+    if unknown_args:
+        logger.warning(f"Ignoring unrecognized arguments: {' '.join(unknown_args)}")
+
+    model_family_name = getattr(args, "model_family_name", None)
+    if (
+        getattr(args, "model_name", model_family_name) == "qwen3"
+        and _model_recipe_name(args) in ["qwen3_30b_a3b", "qwen3_235b_a22b"]
+        and getattr(args, "task", "pretrain") == "pretrain"
+    ):
+        assert (
+            args.hf_token is not None
+        ), "HF token is required for Qwen3 tokenizer. NullTokenizer to be used soon."
+    if args.wandb_key is not None:
+        assert None not in _wandb_names(
+            args
+        ), "both a WandB project and experiment name are required for logging with WandB"
+
+    config_variant = getattr(args, "config_variant", None)
+    if getattr(args, "list_config_variants", False):
+        utils = _import_performance_module("utils.utils", required=True)
+        config_variant = utils.select_config_variant_interactive(
+            model_family_name=args.model_family_name,
+            model_recipe_name=args.model_recipe_name,
+            gpu=args.gpu,
+            compute_dtype=args.compute_dtype,
+            task=args.task,
+        )
+
+    script_name = (
+        ENTRYPOINT_RECIPE
+        if getattr(args, "use_recipes", False)
+        else ENTRYPOINT_PEFORMANCE
+    )
+    run_script_path = SCRIPT_DIR / script_name
+    logger.info(f"Run script path: {run_script_path}")
+    if not run_script_path.is_file():
+        logger.error(f"Specified run script not found: {run_script_path}")
+        sys.exit(1)
+
+    nemorun_script = run.Script(
+        path=str(run_script_path),
+        entrypoint="python",
+        env={"PYTHONPATH": f"{SCRIPT_DIR}:$PYTHONPATH"},
+        args=argv,
+    )
+    logger.info(
+        "Will launch the following command with Nemo-Run: %s",
+        " ".join(nemorun_script.to_command()),
+    )
+
+    if options.get("executor_env_vars", False):
+        executor = run.LocalExecutor(env_vars=_env_vars(args))
+    else:
+        executor = run.LocalExecutor()
+
+    run.run(
+        nemorun_script,
+        executor=executor,
+        plugins=_plugins(args, config_variant),
+        dryrun=args.dryrun,
+        detach=args.detach,
+        name=experiment_name(
+            args,
+            config_variant,
+            os.environ.get("RANK", "0"),
+            name_format=options.get("experiment_name"),
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,602 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the shared experiment launcher."""
+
+import argparse
+import glob
+import inspect
+import json
+import os
+import re
+import shlex
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from typing import List
+from unittest import mock
+
+# Add the module directory to sys.path so we can import the modules.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import custom_setup_experiment
+
+REPO_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+)
+# Arguments each recipe launcher passed to its copy of
+# custom_setup_experiment.py before the recipes shared this launcher.
+EXPECTED_COMMANDS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "testdata", "recipe_commands.json"
+)
+SCRIPT_NAME = "custom_setup_experiment.py"
+HEREDOC_PATTERN = re.compile(
+    r"^cat > (?P<path>\S+) << 'EOF'\n(?P<body>.*?)\nEOF$", re.MULTILINE | re.DOTALL
+)
+
+
+def launcher_command(path: str):
+    """Returns the arguments a launcher passes to custom_setup_experiment.py.
+
+    Files written by the launcher with a quoted heredoc are returned as well,
+    keyed by their path.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    files = {m.group("path"): m.group("body") for m in HEREDOC_PATTERN.finditer(text)}
+    lines = text.splitlines()
+    start = next(
+        i for i, line in enumerate(lines) if line.strip().startswith("python ")
+    )
+    command = []
+    for line in lines[start:]:
+        command.append(line.strip().rstrip("\\"))
+        if not line.rstrip().endswith("\\"):
+            break
+    args = shlex.split(" ".join(command))
+    return args[args.index(f"scripts/performance/{SCRIPT_NAME}") + 1 :], files
+
+
+def effective_arguments(args):
+    """Returns the (flags, positional arguments) argparse would see.
+
+    Later flags take precedence, as with argparse.
+    """
+    flags, positional = {}, []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if not arg.startswith("-"):
+            positional.append(arg)
+        elif "=" in arg:
+            key, value = arg.split("=", 1)
+            flags[key] = value
+        elif i + 1 < len(args) and not args[i + 1].startswith("-"):
+            flags[arg] = args[i + 1]
+            i += 1
+        else:
+            flags[arg] = True
+        i += 1
+    return flags, positional
+
+
+def render_launcher(path: str):
+    """Renders the effective arguments of a launcher offline."""
+    args, files = launcher_command(path)
+    if custom_setup_experiment.RECIPE_CONFIG_FLAG not in args:
+        return args
+    i = args.index(custom_setup_experiment.RECIPE_CONFIG_FLAG)
+    config = json.loads(files[args[i + 1]])
+    return args[:i] + custom_setup_experiment.recipe_command(config, args[i + 2 :])
+
+
+def fake_argument_parser(release: str) -> types.ModuleType:
+    """Returns a fake scripts/performance/argument_parser of a release.
+
+    Releases are "nemo2602", "nemo2511" and "nemo2511_legacy", the NeMo 25.11
+    parser with --model_name and --model_size.
+    """
+    parser = argparse.ArgumentParser()
+    for name in ["gpu", "compute_dtype", "hf_token", "wandb_key"]:
+        parser.add_argument(f"--{name}")
+    parser.add_argument("--task", default="pretrain")
+    parser.add_argument("--num_gpus", type=int)
+    parser.add_argument("--moe_a2a_overlap", default=False)
+    for name in [
+        "tensor_model_parallel_size",
+        "pipeline_model_parallel_size",
+        "context_parallel_size",
+        "expert_model_parallel_size",
+    ]:
+        parser.add_argument(f"--{name}", type=int)
+    parser.add_argument("--profiling_start_step", type=int, default=10)
+    parser.add_argument("--profiling_stop_step", type=int, default=11)
+    for name in [
+        "detach",
+        "dryrun",
+        "enable_vboost",
+        "enable_nsys",
+        "profiling_gpu_metrics",
+        "nccl_ub",
+    ]:
+        parser.add_argument(f"--{name}", action="store_true")
+    parser.add_argument("--custom_env_vars", type=json.loads, default={})
+
+    if release == "nemo2511_legacy":
+        parser.add_argument("--model_name")
+        parser.add_argument("--model_size")
+        parser.add_argument("--domain", default="llm")
+        parser.add_argument("--use_tokendrop", action="store_true")
+        parser.add_argument("--wandb_prj_name")
+        parser.add_argument("--wandb_exp_name")
+        # This release parses sys.argv and returns (args, unknown_args).
+        parse_cli_args = parser.parse_known_args
+    else:
+        parser.add_argument("--model_family_name")
+        parser.add_argument("--model_recipe_name")
+        parser.add_argument("--use_recipes", action="store_true")
+        parser.add_argument("--profiling_ranks")
+        parser.add_argument("--wandb_project_name")
+        parser.add_argument("--wandb_experiment_name")
+        parse_cli_args = lambda: parser
+    if release == "nemo2602":
+        parser.add_argument("--config_variant", default="v1")
+        parser.add_argument("--list_config_variants", action="store_true")
+        parser.add_argument("--pytorch_profiler", action="store_true")
+        parser.add_argument("--record_memory_history", action="store_true")
+        parser.add_argument("--nsys_trace")
+        parser.add_argument("--nsys_extra_args")
+
+    module = types.ModuleType("argument_parser")
+    module.parse_cli_args = parse_cli_args
+    return module
+
+
+# Parameters of the (PerfEnvPlugin, NsysPlugin) of scripts/performance.
+PLUGIN_PARAMETERS = {
+    "nemo2511_legacy": (
+        [
+            "enable_vboost",
+            "moe_a2a_overlap",
+            "tp_size",
+            "pp_size",
+            "cp_size",
+            "model_name",
+            "model_size",
+            "gpu",
+            "compute_dtype",
+            "use_tokendrop",
+            "domain",
+            "task",
+        ],
+        ["profile_step_start", "profile_step_end", "nsys_gpu_metrics"],
+    ),
+    "nemo2511": (
+        [
+            "enable_vboost",
+            "moe_a2a_overlap",
+            "tp_size",
+            "pp_size",
+            "cp_size",
+            "model_family_name",
+            "model_recipe_name",
+            "gpu",
+            "compute_dtype",
+            "train_task",
+        ],
+        ["profile_step_start", "profile_step_end", "nsys_gpu_metrics", "profile_ranks"],
+    ),
+    "nemo2602": (
+        [
+            "enable_vboost",
+            "moe_a2a_overlap",
+            "tp_size",
+            "pp_size",
+            "cp_size",
+            "ep_size",
+            "model_family_name",
+            "model_recipe_name",
+            "gpu",
+            "compute_dtype",
+            "train_task",
+            "config_variant",
+        ],
+        [
+            "profile_step_start",
+            "profile_step_end",
+            "nsys_gpu_metrics",
+            "profile_ranks",
+            "nsys_trace",
+            "nsys_extra_args",
+        ],
+    ),
+}
+
+
+def fake_plugin(name: str, parameters: List[str]) -> type:
+    """Returns a plugin class recording the keyword arguments it accepts."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    plugin = type(name, (), {"__init__": __init__})
+    plugin.__signature__ = inspect.Signature(
+        [inspect.Parameter(p, inspect.Parameter.KEYWORD_ONLY) for p in parameters]
+    )
+    return plugin
+
+
+def fake_perf_plugins(release: str) -> types.ModuleType:
+    """Returns a fake scripts/performance/perf_plugins of a release."""
+    perf_env, nsys = PLUGIN_PARAMETERS[release]
+    module = types.ModuleType("perf_plugins")
+    module.PerfEnvPlugin = fake_plugin("PerfEnvPlugin", perf_env)
+    module.NsysPlugin = fake_plugin("NsysPlugin", nsys)
+    return module
+
+
+def fake_nemo_run(calls: list) -> types.ModuleType:
+    """Returns a fake nemo_run appending the arguments of run.run to calls."""
+
+    class Script:
+        def __init__(self, path, entrypoint, env, args):
+            self.path, self.args = path, args
+
+        def to_command(self):
+            return ["python", self.path] + self.args
+
+    class LocalExecutor:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+    def run(script, **kwargs):
+        calls.append(dict(kwargs, script=script))
+
+    module = types.ModuleType("nemo_run")
+    module.Script, module.LocalExecutor, module.run = Script, LocalExecutor, run
+    return module
+
+
+def fake_utils(release: str) -> types.ModuleType:
+    """Returns a fake scripts/performance/utils/utils of a release."""
+    module = types.ModuleType("utils.utils")
+    if release == "nemo2602":
+        module.get_exp_name_config = (
+            lambda args, family, recipe, gpu, dtype, task, variant: f"{gpu}_{variant}"
+        )
+    return module
+
+
+class TestRecipeConfig(unittest.TestCase):
+    """Tests for rendering recipe configurations."""
+
+    def test_recipe_config_args(self):
+        config = {
+            "gpu": "gb200",
+            "num_gpus": 256,
+            "virtual_pipeline_model_parallel_size": None,
+            "use_megatron_fsdp": "false",
+            "list_config_variants": True,
+            "enable_nsys": False,
+            "config_overrides": ["logger.log_throughput=True"],
+        }
+        self.assertEqual(
+            custom_setup_experiment.recipe_config_args(config),
+            [
+                "--gpu",
+                "gb200",
+                "--num_gpus",
+                "256",
+                "--virtual_pipeline_model_parallel_size",
+                "None",
+                "--use_megatron_fsdp",
+                "false",
+                "--list_config_variants",
+                "logger.log_throughput=True",
+            ],
+        )
+
+    def test_expand_recipe_config(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "recipe_config.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"gpu": "gb200", "max_steps": 30}, f)
+
+            argv = custom_setup_experiment.expand_recipe_config(
+                ["--recipe_config", path, "--max_steps", "10"]
+            )
+            self.assertEqual(
+                argv, ["--gpu", "gb200", "--max_steps", "30", "--max_steps", "10"]
+            )
+            # Arguments following the configuration take precedence.
+            self.assertEqual(effective_arguments(argv)[0]["--max_steps"], "10")
+            self.assertEqual(
+                custom_setup_experiment.expand_recipe_config(
+                    [f"--recipe_config={path}"]
+                ),
+                ["--gpu", "gb200", "--max_steps", "30"],
+            )
+        self.assertEqual(
+            custom_setup_experiment.expand_recipe_config(["--gpu", "b200"]),
+            ["--gpu", "b200"],
+        )
+        with self.assertRaises(ValueError):
+            custom_setup_experiment.expand_recipe_config(["--recipe_config"])
+
+
+class TestImportPerformanceModule(unittest.TestCase):
+    """Tests for the import of the optional scripts/performance modules."""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.scripts_dir = tmpdir.name
+        os.makedirs(os.path.join(self.scripts_dir, "perf_utils"))
+        for name, source in [
+            ("perf_utils/__init__.py", ""),
+            ("perf_utils/utils.py", "VALUE = 1\n"),
+            ("missing_dependency.py", "import no_such_dependency\n"),
+            ("broken_import.py", "from os import no_such_name\n"),
+        ]:
+            with open(os.path.join(self.scripts_dir, name), "w") as f:
+                f.write(source)
+        for patch in (
+            mock.patch.object(sys, "path", [self.scripts_dir] + sys.path),
+            mock.patch.dict(sys.modules),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_present_module(self):
+        module = custom_setup_experiment._import_performance_module("perf_utils.utils")
+        self.assertEqual(module.VALUE, 1)
+
+    def test_missing_module(self):
+        for name in ["no_such_module", "perf_utils.no_such_module", "no_such.utils"]:
+            with self.subTest(name):
+                self.assertIsNone(
+                    custom_setup_experiment._import_performance_module(name)
+                )
+                with self.assertRaises(ModuleNotFoundError):
+                    custom_setup_experiment._import_performance_module(
+                        name, required=True
+                    )
+
+    def test_import_errors_are_raised(self):
+        with self.assertRaises(ModuleNotFoundError) as error:
+            custom_setup_experiment._import_performance_module("missing_dependency")
+        self.assertEqual(error.exception.name, "no_such_dependency")
+        with self.assertRaises(ImportError):
+            custom_setup_experiment._import_performance_module("broken_import")
+
+
+class TestRecipeLaunchers(unittest.TestCase):
+    """Renders the command of every recipe and compares it to the old one."""
+
+    def setUp(self):
+        with open(EXPECTED_COMMANDS_FILE, "r", encoding="utf-8") as f:
+            self.expected = json.load(f)
+
+    def test_no_recipe_copies(self):
+        copies = glob.glob(
+            os.path.join(REPO_ROOT, "training", "**", SCRIPT_NAME), recursive=True
+        )
+        self.assertEqual(copies, [])
+
+    def test_recipe_commands(self):
+        for launcher, expected in sorted(self.expected.items()):
+            with self.subTest(launcher=launcher):
+                path = os.path.join(REPO_ROOT, launcher)
+                args, _ = launcher_command(path)
+                self.assertIn(custom_setup_experiment.RECIPE_CONFIG_FLAG, args)
+                self.assertEqual(
+                    effective_arguments(render_launcher(path)),
+                    effective_arguments(expected),
+                )
+
+
+class TestLauncherRun(unittest.TestCase):
+    """Renders the NeMo-Run call of a recipe of each release offline."""
+
+    LAUNCHERS = {
+        "nemo2511_legacy": "training/a4x-max/gpt-oss-120b/megatron-bridge-gke/nemo2511/64gpus-bf16-seq4096-gbs512/recipe/launcher.sh",
+        "nemo2511": "training/a4x/qwen3_235b_a22b/megatron-bridge-gke/nemo2511/64gpus-bf16-seq4096-gbs1024/recipe/launcher.sh",
+        "nemo2602": "training/a4/qwen3_235b_a22b/megatron-bridge-gke/nemo2602/128gpus-bf16-seq4096-gbs4096/recipe/launcher.sh",
+    }
+
+    def run_launcher(self, release: str, extra_args=(), launcher_options=None) -> dict:
+        """Runs the launcher of a release on rank 3, returns the run.run call."""
+        args, files = launcher_command(os.path.join(REPO_ROOT, self.LAUNCHERS[release]))
+        i = args.index(custom_setup_experiment.RECIPE_CONFIG_FLAG)
+        config = json.loads(files[args[i + 1]])
+        if launcher_options is not None:
+            config[custom_setup_experiment.LAUNCHER_OPTIONS_KEY] = dict(
+                config.get(custom_setup_experiment.LAUNCHER_OPTIONS_KEY, {}),
+                **launcher_options,
+            )
+        calls = []
+        modules = {
+            "argument_parser": fake_argument_parser(release),
+            "perf_plugins": fake_perf_plugins(release),
+            "nemo_run": fake_nemo_run(calls),
+            "utils": types.ModuleType("utils"),
+            "utils.utils": fake_utils(release),
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_path = os.path.join(tmpdir, "recipe_config.json")
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump(config, f)
+            Path(tmpdir, custom_setup_experiment.ENTRYPOINT_PEFORMANCE).touch()
+            argv = args[: i + 1] + [config_path] + args[i + 2 :] + list(extra_args)
+            with mock.patch.dict(sys.modules, modules), mock.patch.dict(
+                os.environ, {"RANK": "3"}
+            ), mock.patch.object(sys, "argv", [SCRIPT_NAME]), mock.patch.object(
+                custom_setup_experiment, "SCRIPT_DIR", Path(tmpdir)
+            ):
+                custom_setup_experiment.main(argv)
+        self.assertEqual(len(calls), 1)
+        return calls[0]
+
+    @staticmethod
+    def plugins(call: dict):
+        return [(type(plugin).__name__, plugin.kwargs) for plugin in call["plugins"]]
+
+    def test_nemo2511_legacy(self):
+        call = self.run_launcher("nemo2511_legacy", ["--enable_nsys"])
+        self.assertEqual(call["name"], "gpt_oss_120b_llm_pretrain_bf16_worker3")
+        self.assertEqual(call["executor"].kwargs, {})
+        self.assertEqual(
+            self.plugins(call),
+            [
+                (
+                    "PerfEnvPlugin",
+                    {
+                        "enable_vboost": False,
+                        "moe_a2a_overlap": False,
+                        "tp_size": 1,
+                        "pp_size": 1,
+                        "cp_size": 1,
+                        "model_name": "gpt_oss",
+                        "model_size": "120b",
+                        "gpu": "gb300",
+                        "compute_dtype": "bf16",
+                        "use_tokendrop": False,
+                        "domain": "llm",
+                        "task": "pretrain",
+                    },
+                ),
+                (
+                    "NsysPlugin",
+                    {
+                        "profile_step_start": 10,
+                        "profile_step_end": 11,
+                        "nsys_gpu_metrics": False,
+                    },
+                ),
+            ],
+        )
+        self.assertFalse(call["dryrun"])
+        self.assertFalse(call["detach"])
+
+    def test_nemo2511_legacy_wandb(self):
+        with self.assertRaises(AssertionError):
+            self.run_launcher("nemo2511_legacy", ["--wandb_key", "key"])
+        call = self.run_launcher(
+            "nemo2511_legacy",
+            ["--wandb_key", "key", "--wandb_prj_name", "p", "--wandb_exp_name", "e"],
+        )
+        # The WandB experiment name does not rename the NeMo-Run experiment.
+        self.assertEqual(call["name"], "gpt_oss_120b_llm_pretrain_bf16_worker3")
+
+    def test_nemo2511(self):
+        call = self.run_launcher("nemo2511", ["--enable_nsys"])
+        self.assertEqual(call["name"], "qwen3_235b_a22b_qwen_worker3")
+        self.assertEqual(call["executor"].kwargs, {})
+        self.assertEqual(
+            self.plugins(call),
+            [
+                (
+                    "PerfEnvPlugin",
+                    {
+                        "enable_vboost": False,
+                        "moe_a2a_overlap": False,
+                        "tp_size": 1,
+                        "pp_size": 8,
+                        "cp_size": 1,
+                        "model_family_name": "qwen",
+                        "model_recipe_name": "qwen3_235b_a22b",
+                        "gpu": "gb200",
+                        "compute_dtype": "bf16",
+                        "train_task": "pretrain",
+                    },
+                ),
+                (
+                    "NsysPlugin",
+                    {
+                        "profile_step_start": 10,
+                        "profile_step_end": 11,
+                        "nsys_gpu_metrics": False,
+                        "profile_ranks": None,
+                    },
+                ),
+            ],
+        )
+
+    def test_nemo2602(self):
+        call = self.run_launcher("nemo2602")
+        self.assertEqual(call["name"], "pretrain_qwen3_235b_a22b_bf16_b200_v1_worker3")
+        self.assertEqual(call["executor"].kwargs, {})
+        self.assertEqual(
+            self.plugins(call),
+            [
+                (
+                    "PerfEnvPlugin",
+                    {
+                        "enable_vboost": False,
+                        "moe_a2a_overlap": "True",
+                        "tp_size": 1,
+                        "pp_size": 8,
+                        "cp_size": None,
+                        "ep_size": 8,
+                        "model_family_name": "qwen",
+                        "model_recipe_name": "qwen3_235b_a22b",
+                        "gpu": "b200",
+                        "compute_dtype": "bf16",
+                        "train_task": "pretrain",
+                        "config_variant": "v1",
+                    },
+                ),
+            ],
+        )
+
+    def test_nemo2602_wandb(self):
+        with self.assertRaises(AssertionError):
+            self.run_launcher("nemo2602", ["--wandb_key", "key"])
+        call = self.run_launcher(
+            "nemo2602",
+            [
+                "--wandb_key",
+                "key",
+                "--wandb_project_name",
+                "p",
+                "--wandb_experiment_name",
+                "e",
+            ],
+        )
+        self.assertEqual(call["name"], "e_worker3")
+
+    def test_executor_env_vars(self):
+        extra_args = ["--custom_env_vars", '{"A": "1"}', "--nccl_ub"]
+        # The recipes did not set these variables in the executor environment.
+        call = self.run_launcher("nemo2602", extra_args)
+        self.assertEqual(call["executor"].kwargs, {})
+        call = self.run_launcher(
+            "nemo2602", extra_args, launcher_options={"executor_env_vars": True}
+        )
+        self.assertEqual(
+            call["executor"].kwargs,
+            {
+                "env_vars": {
+                    "A": "1",
+                    "NCCL_NVLS_ENABLE": "1",
+                    "NCCL_CTA_POLICY": "1",
+                }
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
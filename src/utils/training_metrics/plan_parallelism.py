@@ -0,0 +1,178 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tool to rank the parallelism layouts of a model before running it"""
+
+import argparse
+import json
+import sys
+
+from src.data_defs import MODEL_ARCHITECTURES, PRECISIONS
+from src.parallelism_planner import (
+    DEFAULT_COMPUTE_EFFICIENCY,
+    DEFAULT_GRAD_BYTES,
+    DEFAULT_MAX_VIRTUAL_STAGES,
+    DEFAULT_MEMORY_FRACTION,
+    DEFAULT_OPTIMIZER_BYTES,
+    MACHINE_NETWORKS,
+    get_cluster_spec,
+    plan_layouts,
+)
+from process_training_results import format_table, write_json
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model_type",
+        type=str,
+        required=True,
+        choices=sorted(MODEL_ARCHITECTURES),
+        help="Type of model",
+    )
+    parser.add_argument(
+        "--accelerator_type",
+        type=str,
+        required=True,
+        choices=sorted(MACHINE_NETWORKS),
+        help="Machine family (e.g. a4x) used for training",
+    )
+    parser.add_argument(
+        "--num_accelerators",
+        type=int,
+        required=True,
+        help="Number of GPUs used for training",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        required=True,
+        help="Global batch size used during training.",
+    )
+    parser.add_argument(
+        "--seq_length",
+        type=int,
+        required=True,
+        help="Sequence length used during training.",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        choices=PRECISIONS,
+        default="bf16",
+        help="Precision used during training, selects the peak TFLOPS",
+    )
+    parser.add_argument(
+        "--memory_gb",
+        type=float,
+        required=False,
+        help="Memory of a GPU in GB. If not provided, the memory of the accelerator of the machine family is used",
+    )
+    parser.add_argument(
+        "--micro_batch_sizes",
+        type=str,
+        default="1,2,4",
+        help="Comma separated micro batch sizes to consider",
+    )
+    parser.add_argument(
+        "--max_virtual_stages",
+        type=int,
+        default=DEFAULT_MAX_VIRTUAL_STAGES,
+        help="Maximum virtual pipeline stages per pipeline rank",
+    )
+    parser.add_argument(
+        "--grad_bytes",
+        type=int,
+        default=DEFAULT_GRAD_BYTES,
+        help="Bytes of a gradient, 2 when gradients are reduced in bf16",
+    )
+    parser.add_argument(
+        "--optimizer_bytes",
+        type=int,
+        default=DEFAULT_OPTIMIZER_BYTES,
+        help="Bytes of the optimizer state of a parameter, 8 with the bf16 Adam moments of the precision aware optimizer",
+    )
+    parser.add_argument(
+        "--memory_fraction",
+        type=float,
+        default=DEFAULT_MEMORY_FRACTION,
+        help="Fraction of the GPU memory usable by the model",
+    )
+    parser.add_argument(
+        "--compute_efficiency",
+        type=float,
+        default=DEFAULT_COMPUTE_EFFICIENCY,
+        help="Fraction of the peak TFLOPS reached by the transformer layers",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Number of layouts to print",
+    )
+    parser.add_argument(
+        "--output_json",
+        type=str,
+        required=False,
+        help="Optional JSON file to write the ranked layouts and their recipe configuration to",
+    )
+
+    return parser.parse_args()
+
+
+def main(args) -> int:
+    """Main processing"""
+    cluster = get_cluster_spec(
+        args.accelerator_type,
+        args.num_accelerators,
+        precision=args.precision,
+        memory_gb=args.memory_gb,
+    )
+    plans = plan_layouts(
+        MODEL_ARCHITECTURES[args.model_type],
+        cluster,
+        global_batch_size=args.batch_size,
+        seq_length=args.seq_length,
+        micro_batch_sizes=[int(mbs) for mbs in args.micro_batch_sizes.split(",")],
+        max_virtual_stages=args.max_virtual_stages,
+        grad_bytes=args.grad_bytes,
+        optimizer_bytes=args.optimizer_bytes,
+        memory_fraction=args.memory_fraction,
+        compute_efficiency=args.compute_efficiency,
+    )
+    if not plans:
+        print(
+            f"No layout of {args.model_type} fits in "
+            f"{cluster.memory_gb * args.memory_fraction:.1f} GB per GPU"
+        )
+        return 1
+
+    print(format_table([plan.as_row() for plan in plans[: args.top]]))
+    print()
+    print("Recipe configuration of the fastest layout:")
+    print(json.dumps(plans[0].layout.recipe_config(), indent=2))
+    if args.output_json:
+        write_json(
+            [
+                dict(plan.as_row(), recipe_config=plan.layout.recipe_config())
+                for plan in plans[: args.top]
+            ],
+            args.output_json,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(main(args))
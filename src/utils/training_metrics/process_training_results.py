@@ -15,14 +15,47 @@
 """ Tool to calculate training metrics for common LLM models"""
 
 import argparse
+import csv
+import functools
 import json
+import multiprocessing
+import sys
+from typing import List, Optional
 
-from src.data_defs import MODEL_FLOPS_PER_SAMPLE, MAX_TFLOPS, ACCELERATORS
+from src.data_defs import (
+    MODEL_ARCHITECTURES,
+    MODEL_FLOPS_PER_SAMPLE,
+    MODEL_NAME_ALIASES,
+    ACCELERATORS,
+    PRECISIONS,
+    get_max_tflops,
+    resolve_precision,
+)
+from src.model_flops import get_model_flops
+from src.baselines import (
+    BaselineStore,
+    STATUS_ERROR,
+    STATUS_MISSING,
+    STATUS_REGRESSION,
+    baseline_key,
+    compare_to_baseline,
+    missing_run_report,
+)
+from src.recipe_runs import RecipeRun, find_recipe_runs
+
+# Row fields not shown in the comparison table.
+HIDDEN_COLUMNS = ["step_times"]
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--file", type=str, required=True, help="DLLogger file")
+    parser.add_argument("--file", type=str, required=False, help="DLLogger file")
+    parser.add_argument(
+        "--results_dir",
+        type=str,
+        required=False,
+        help="Root of a results tree laid out like training/. When provided, every DLLogger file under it is processed and a comparison table is printed",
+    )
     parser.add_argument(
         "--model_flops",
         type=float,
@@ -33,38 +66,48 @@ def parse_args():
         "--max_flops",
         type=float,
         required=False,
-        help="Max theoretical TFLOPS. If not provided, default values will be used for the accelerator type on bf16 precision",
+        help="Max theoretical TFLOPS. If not provided, default values will be used for the accelerator type and precision",
     )
     parser.add_argument(
         "--batch_size",
         type=int,
-        required=True,
+        required=False,
         help="Global batch size used during training.",
     )
+    parser.add_argument(
+        "--seq_length",
+        type=int,
+        required=False,
+        help="Sequence length used during training. If not provided, it is read from the DLLogger PARAMETER entries when available. Only a given sequence length replaces the fixed FLOPs of a model by the analytical model",
+    )
     parser.add_argument(
         "--model_type",
         type=str,
-        choices=list(MODEL_FLOPS_PER_SAMPLE.keys()),
+        choices=sorted(
+            set(MODEL_FLOPS_PER_SAMPLE)
+            | set(MODEL_ARCHITECTURES)
+            | set(MODEL_NAME_ALIASES)
+        ),
         help="Type of model",
     )
     parser.add_argument(
         "--num_accelerators",
         type=int,
-        required=True,
+        required=False,
         help="Number of GPUs/TPUs used for training",
     )
     parser.add_argument(
         "--accelerator_type",
         type=str,
         choices=ACCELERATORS,
-        help="Number of GPUs used for training",
+        help="Type of accelerator or machine family (e.g. a4x) used for training",
     )
     parser.add_argument(
         "--precision",
         type=str,
-        choices=["bf16", "fp8"],
+        choices=PRECISIONS,
         default="bf16",
-        help="Precision using during training",
+        help="Precision used during training",
     )
     parser.add_argument(
         "--start_step",
@@ -80,6 +123,55 @@ def parse_args():
         default=30,
         help="Start step to compute the training step time",
     )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        required=False,
+        default=multiprocessing.cpu_count(),
+        help="Number of parallel workers used in --results_dir mode",
+    )
+    parser.add_argument(
+        "--output_csv",
+        type=str,
+        required=False,
+        help="Optional CSV file to write the --results_dir comparison table to",
+    )
+    parser.add_argument(
+        "--output_json",
+        type=str,
+        required=False,
+        help="Optional JSON file to write the computed metrics to",
+    )
+    parser.add_argument(
+        "--baseline_dir",
+        type=str,
+        required=False,
+        help="Directory with one JSON baseline per recipe, used with --results_dir",
+    )
+    parser.add_argument(
+        "--save_baseline",
+        action="store_true",
+        help="Store the processed runs as the new baselines in --baseline_dir",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare the processed runs with the baselines in --baseline_dir and exit with a nonzero code on regressions, runs without a step time and baseline recipes without a run",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        required=False,
+        default=5.0,
+        help="Step time increase, in percent, above which a significant delta is a regression",
+    )
+    parser.add_argument(
+        "--significance",
+        type=float,
+        required=False,
+        default=0.05,
+        help="p-value of the Welch's t-test on the per-step times below which a delta is significant",
+    )
 
     return parser.parse_args()
 
@@ -90,6 +182,7 @@ def compute_mfu(
     num_accelerators: int,
     model_flops_per_sample: float,
     batch_size: int,
+    verbose: bool = True,
 ) -> float:
     """Computes the MFU
 
@@ -99,6 +192,7 @@ def compute_mfu(
         num_accelerators (int): Number of accelerators used during the training process
         model_flops_per_sample (float): Number of FLOPS for a single sample training step
         batch_size (int): Global batch size used during training
+        verbose (bool): Print the results to the console
 
     Returns:
         float: Returns the Model FLOPS Utilization MFU
@@ -108,73 +202,427 @@ def compute_mfu(
     )
     mfu = tflops_per_accelerator / max_tflops
 
+    if not verbose:
+        return mfu
     print(f"Average step time: {step_time:.8f}")
     print(f"TFLOPS/Accelerator: {tflops_per_accelerator:.8f}")
     print(f"MFU: {mfu:.8f}")
     return mfu
 
 
-def get_average_step_time(file: str, start_step: int, end_step: int) -> float:
-    """Computes the average step time from a dllogger json file
-    between the step start_step and end_step, both included.
+def compute_throughput(
+    step_time: float,
+    batch_size: int,
+    num_accelerators: int,
+    seq_length: Optional[int] = None,
+) -> dict:
+    """Computes the training throughput
 
     Args:
-        file (str): path to the dllogger file to use
+        step_time (float): forward + backward step time in seconds
+        batch_size (int): Global batch size used during training
+        num_accelerators (int): Number of accelerators used during the training process
+        seq_length (int): Sequence length used during training. Token based
+            metrics are None when not provided
 
     Returns:
-        float: average step time between the steps start_step and end_step
+        dict: samples_per_s, tokens_per_s, tokens_per_s_per_gpu and
+            hours_per_1t_tokens, the projected time to train on 1 trillion tokens
     """
+    throughput = {
+        "samples_per_s": batch_size / step_time,
+        "tokens_per_s": None,
+        "tokens_per_s_per_gpu": None,
+        "hours_per_1t_tokens": None,
+    }
+    if seq_length:
+        tokens_per_s = batch_size * seq_length / step_time
+        throughput["tokens_per_s"] = tokens_per_s
+        throughput["tokens_per_s_per_gpu"] = tokens_per_s / num_accelerators
+        throughput["hours_per_1t_tokens"] = 1e12 / tokens_per_s / 3600
+    return throughput
+
+
+def get_seq_length(parameters: dict) -> Optional[int]:
+    """Returns the sequence length logged in the DLLogger PARAMETER entries."""
+    return parameters.get("cfg/encoder_seq_length") or parameters.get(
+        "cfg/seq_length"
+    )
+
+
+def read_dllogger(file: str) -> List[dict]:
+    """Reads a dllogger json file.
 
+    Args:
+        file (str): path to the dllogger file to use
+
+    Returns:
+        List[dict]: one entry per logged line
+    """
     with open(file, "r", encoding="utf-8") as f:
         data = f.readlines()
 
-    datajson = [json.loads(line[4:]) for line in data]
-    time_step_accumulator = 0
-    num_steps = 0
-    for line in datajson:
+    return [json.loads(line[4:]) for line in data if line.strip()]
+
+
+def get_dllogger_parameters(file: str) -> dict:
+    """Returns the PARAMETER entries logged in a dllogger json file.
+
+    Args:
+        file (str): path to the dllogger file to use
+
+    Returns:
+        dict: merged data of every PARAMETER line
+    """
+    parameters = {}
+    for line in read_dllogger(file):
+        if line.get("step") == "PARAMETER":
+            parameters.update(line.get("data", {}))
+    return parameters
+
+
+def get_step_times(file: str, start_step: int, end_step: int) -> List[float]:
+    """Returns the step times from a dllogger json file
+    between the step start_step and end_step, both included.
+
+    Args:
+        file (str): path to the dllogger file to use
+
+    Returns:
+        List[float]: step times between the steps start_step and end_step
+    """
+    step_times = []
+    for line in read_dllogger(file):
         if line.get("step") != "PARAMETER":
             step = line.get("step")
             if step >= start_step and step <= end_step:
-                time_step_accumulator += line["data"].get("train_step_timing in s")
-                num_steps += 1
-    if num_steps == 0:
+                step_times.append(line["data"].get("train_step_timing in s"))
+    if not step_times:
         raise ValueError(
             "Make sure your dllogger.json file contains steps in the range of --start_step and --end_step"
         )
-    return time_step_accumulator / num_steps
+    return step_times
+
+
+def get_average_step_time(file: str, start_step: int, end_step: int) -> float:
+    """Computes the average step time from a dllogger json file
+    between the step start_step and end_step, both included.
+
+    Args:
+        file (str): path to the dllogger file to use
+
+    Returns:
+        float: average step time between the steps start_step and end_step
+    """
+    step_times = get_step_times(file, start_step, end_step)
+    return sum(step_times) / len(step_times)
+
+
+def process_recipe_run(
+    run: RecipeRun,
+    start_step: int,
+    end_step: int,
+    default_precision: str = "bf16",
+) -> dict:
+    """Computes the metrics of a single run discovered in a results tree.
+
+    Values that cannot be inferred from the recipe path are read from the
+    PARAMETER entries of the DLLogger file when available.
+
+    Args:
+        run (RecipeRun): run to process
+        start_step (int): first step used to compute the step time
+        end_step (int): last step used to compute the step time
+        default_precision (str): precision used when not encoded in the path
+
+    Returns:
+        dict: a row of the comparison table. MFU related columns are None
+            and the error column is set when they cannot be computed.
+    """
+    row = {
+        "recipe": run.recipe,
+        "machine": run.machine_family,
+        "model": run.model,
+        "framework": run.framework,
+        "gpus": run.num_accelerators,
+        "precision": resolve_precision(run.precision or default_precision),
+        "gbs": run.global_batch_size,
+        "seq": run.seq_length,
+        "step_time": None,
+        "tflops_per_gpu": None,
+        "mfu": None,
+        "routed_flops_pct": None,
+        "samples_per_s": None,
+        "tokens_per_s": None,
+        "tokens_per_s_per_gpu": None,
+        "hours_per_1t_tokens": None,
+        "error": None,
+        "step_times": None,
+    }
+    try:
+        parameters = get_dllogger_parameters(run.file)
+        if row["gbs"] is None:
+            row["gbs"] = parameters.get("cfg/global_batch_size")
+        if row["seq"] is None:
+            row["seq"] = get_seq_length(parameters)
+        row["step_times"] = get_step_times(run.file, start_step, end_step)
+        row["step_time"] = sum(row["step_times"]) / len(row["step_times"])
+    except (OSError, ValueError, TypeError) as e:
+        row["error"] = str(e)
+        return row
+
+    missing = [key for key in ("gpus", "gbs") if row[key] is None]
+    if missing:
+        row["error"] = f"Could not infer {', '.join(missing)}"
+        return row
+    row.update(
+        compute_throughput(
+            step_time=row["step_time"],
+            batch_size=row["gbs"],
+            num_accelerators=row["gpus"],
+            seq_length=row["seq"],
+        )
+    )
+
+    try:
+        model_flops = get_model_flops(row["model"], row["seq"])
+        max_tflops = get_max_tflops(row["machine"], row["precision"])
+    except ValueError as e:
+        row["error"] = str(e)
+        return row
+
+    row["mfu"] = compute_mfu(
+        step_time=row["step_time"],
+        max_tflops=max_tflops,
+        num_accelerators=row["gpus"],
+        model_flops_per_sample=model_flops.total,
+        batch_size=row["gbs"],
+        verbose=False,
+    )
+    row["tflops_per_gpu"] = row["mfu"] * max_tflops
+    row["routed_flops_pct"] = model_flops.routed / model_flops.total * 100
+    return row
 
 
-def main(args):
+def process_results_dir(
+    results_dir: str,
+    start_step: int,
+    end_step: int,
+    default_precision: str = "bf16",
+    num_workers: Optional[int] = None,
+) -> List[dict]:
+    """Computes the metrics of every run found under results_dir in parallel.
+
+    Args:
+        results_dir (str): root of the results tree
+        start_step (int): first step used to compute the step time
+        end_step (int): last step used to compute the step time
+        default_precision (str): precision used when not encoded in the path
+        num_workers (int): number of worker processes
+
+    Returns:
+        List[dict]: one row per run, sorted by recipe
+    """
+    runs = find_recipe_runs(results_dir)
+    if not runs:
+        return []
+    process_run = functools.partial(
+        process_recipe_run,
+        start_step=start_step,
+        end_step=end_step,
+        default_precision=default_precision,
+    )
+    num_workers = min(num_workers or multiprocessing.cpu_count(), len(runs))
+    if num_workers <= 1:
+        return [process_run(run) for run in runs]
+    with multiprocessing.Pool(num_workers) as pool:
+        return pool.map(process_run, runs)
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return str(value)
+
+
+def format_table(rows: List[dict]) -> str:
+    """Formats the rows of process_results_dir as a plain text table."""
+    if not rows:
+        return ""
+    columns = [c for c in rows[0].keys() if c not in HIDDEN_COLUMNS]
+    cells = [columns] + [[_format_value(row[c]) for c in columns] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    lines = ["  ".join(v.ljust(w) for v, w in zip(line, widths)).rstrip() for line in cells]
+    lines.insert(1, "  ".join("-" * w for w in widths))
+    return "\n".join(lines)
+
+
+def write_json(data, output_file: str):
+    """Writes the computed metrics to a JSON file."""
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def write_csv(rows: List[dict], output_file: str):
+    """Writes the rows of process_results_dir to a CSV file."""
+    with open(output_file, "w", encoding="utf-8", newline="") as f:
+        columns = [c for c in rows[0].keys() if c not in HIDDEN_COLUMNS] if rows else []
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def compare_to_baselines(
+    rows: List[dict], store: BaselineStore, threshold: float, significance: float
+) -> List[dict]:
+    """Compares every row of process_results_dir with its stored baseline.
+
+    Rows and baselines are matched by baseline_key. The stored baselines
+    without a row are reported as missing.
+    """
+    reports = [
+        compare_to_baseline(
+            row, store.load(baseline_key(row)), threshold, significance
+        )
+        for row in rows
+    ]
+    keys = {baseline_key(row) for row in rows}
+    for key in store.keys():
+        if key not in keys:
+            reports.append(missing_run_report(store.load(key)))
+    return reports
+
+
+def batch_main(args) -> int:
+    """Processes every run under --results_dir and prints a comparison table"""
+    if (args.save_baseline or args.compare) and not args.baseline_dir:
+        print("--baseline_dir is needed with --save_baseline and --compare")
+        return 1
+    rows = process_results_dir(
+        args.results_dir,
+        start_step=args.start_step,
+        end_step=args.end_step,
+        default_precision=args.precision,
+        num_workers=args.num_workers,
+    )
+    if not rows:
+        print(f"No DLLogger files found under {args.results_dir}")
+        return 1
+    print(format_table(rows))
+    if args.output_csv:
+        write_csv(rows, args.output_csv)
+    if args.output_json:
+        write_json(
+            [{k: v for k, v in row.items() if k not in HIDDEN_COLUMNS} for row in rows],
+            args.output_json,
+        )
+
+    exit_code = 0
+    if args.compare:
+        reports = compare_to_baselines(
+            rows,
+            BaselineStore(args.baseline_dir),
+            threshold=args.threshold,
+            significance=args.significance,
+        )
+        print()
+        print(format_table(reports))
+        statuses = [r["status"] for r in reports]
+        for status, message in [
+            (STATUS_REGRESSION, f"regression(s) above {args.threshold}%"),
+            (STATUS_ERROR, "run(s) without a step time"),
+            (STATUS_MISSING, "baseline recipe(s) without a run"),
+        ]:
+            if status in statuses:
+                print(f"{statuses.count(status)} {message}")
+                exit_code = 1
+    if args.save_baseline:
+        store = BaselineStore(args.baseline_dir)
+        for row in rows:
+            if row["step_time"] is not None:
+                store.save(row)
+    return exit_code
+
+
+def main(args) -> int:
     """Main processing"""
+    if args.results_dir:
+        return batch_main(args)
+    if args.file is None or args.batch_size is None or args.num_accelerators is None:
+        print("--file, --batch_size and --num_accelerators are needed")
+        return 1
     if args.model_type is None and args.model_flops is None:
         print("Either the --model_type or --model_flops is needed")
-        return
+        return 1
     if args.accelerator_type is None and args.max_flops is None:
         print("Either the --accelerator_type or --max_flops is needed")
-        return
+        return 1
 
-    model_flops_per_sample = (
-        args.model_flops
-        if args.model_flops
-        else MODEL_FLOPS_PER_SAMPLE[args.model_type]
-    )
+    seq_length = args.seq_length or get_seq_length(get_dllogger_parameters(args.file))
+    if args.model_flops:
+        model_flops_per_sample = args.model_flops
+        print(f"FLOPS per sample: {model_flops_per_sample:.6e} (--model_flops)")
+    else:
+        # The fixed value of a model is only replaced by the analytical model
+        # when --seq_length is given, not by the logged sequence length.
+        model = MODEL_NAME_ALIASES.get(args.model_type, args.model_type)
+        flops_seq_length = seq_length
+        if model in MODEL_FLOPS_PER_SAMPLE and not args.seq_length:
+            flops_seq_length = None
+        model_flops = get_model_flops(model, flops_seq_length)
+        model_flops_per_sample = model_flops.total
+        source = (
+            f"analytical, sequence length {flops_seq_length}"
+            if flops_seq_length and model in MODEL_ARCHITECTURES
+            else "MODEL_FLOPS_PER_SAMPLE"
+        )
+        print(f"FLOPS per sample: {model_flops_per_sample:.6e} ({source})")
+        if model_flops.routed:
+            print(f"Dense FLOPS per sample: {model_flops.dense:.6e}")
+            print(f"Routed expert FLOPS per sample: {model_flops.routed:.6e}")
     max_tflops = (
         args.max_flops
         if args.max_flops
-        else MAX_TFLOPS[(args.accelerator_type, args.precision)]
+        else get_max_tflops(args.accelerator_type, args.precision)
     )
     average_step_time = get_average_step_time(
         args.file, start_step=args.start_step, end_step=args.end_step
     )
-    compute_mfu(
+    mfu = compute_mfu(
         step_time=average_step_time,
         max_tflops=max_tflops,
         num_accelerators=args.num_accelerators,
         model_flops_per_sample=model_flops_per_sample,
         batch_size=args.batch_size,
     )
+    throughput = compute_throughput(
+        step_time=average_step_time,
+        batch_size=args.batch_size,
+        num_accelerators=args.num_accelerators,
+        seq_length=seq_length,
+    )
+    print(f"Samples/s: {throughput['samples_per_s']:.8f}")
+    if seq_length:
+        print(f"Tokens/s: {throughput['tokens_per_s']:.8f}")
+        print(f"Tokens/s/Accelerator: {throughput['tokens_per_s_per_gpu']:.8f}")
+        print(f"Hours per 1T tokens: {throughput['hours_per_1t_tokens']:.8f}")
+
+    if args.output_json:
+        metrics = {
+            "step_time": average_step_time,
+            "tflops_per_gpu": mfu * max_tflops,
+            "mfu": mfu,
+            "gbs": args.batch_size,
+            "gpus": args.num_accelerators,
+            "seq": seq_length,
+        }
+        metrics.update(throughput)
+        write_json(metrics, args.output_json)
+    return 0
 
 
 if __name__ == "__main__":
     args = parse_args()
-    main(args)
+    sys.exit(main(args))
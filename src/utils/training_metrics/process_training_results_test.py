@@ -0,0 +1,594 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the training metrics tool."""
+
+import dataclasses
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# Add the module directory to sys.path so we can import the modules.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src import baselines
+from src import data_defs
+from src import model_flops
+from src import parallelism_planner
+from src import recipe_runs
+import process_training_results
+
+EXAMPLE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "examples", "dllogger.json"
+)
+
+
+class TestAcceleratorSpecs(unittest.TestCase):
+    """Tests for the accelerator spec registry."""
+
+    def test_machine_family_resolves_to_accelerator(self):
+        self.assertEqual(data_defs.get_accelerator_spec("a4x").name, "gb200")
+        self.assertEqual(data_defs.get_accelerator_spec("a4x-max").name, "gb300")
+        self.assertEqual(data_defs.get_accelerator_spec("g4").name, "rtx-pro-6000")
+
+    def test_precision_aliases(self):
+        self.assertEqual(data_defs.get_max_tflops("a4", "fp8cs"), 4500)
+        self.assertEqual(data_defs.get_max_tflops("b200", "mxfp8"), 4500)
+        self.assertEqual(data_defs.get_max_tflops("a4x-max", "nvfp4"), 15000)
+
+    def test_unsupported_precision_raises(self):
+        with self.assertRaises(ValueError):
+            data_defs.get_max_tflops("h100", "nvfp4")
+
+    def test_unknown_accelerator_raises(self):
+        with self.assertRaises(ValueError):
+            data_defs.get_accelerator_spec("unknown")
+
+    def test_legacy_max_tflops_table(self):
+        self.assertEqual(data_defs.MAX_TFLOPS[("h100", "bf16")], 989)
+        self.assertEqual(data_defs.MAX_TFLOPS[("b200", "fp8")], 4500)
+
+
+class TestComputeMfu(unittest.TestCase):
+    """Tests for the MFU computation."""
+
+    def test_average_step_time(self):
+        step_time = process_training_results.get_average_step_time(
+            EXAMPLE_FILE, start_step=10, end_step=30
+        )
+        self.assertAlmostEqual(step_time, 25.39738855, places=6)
+
+    def test_compute_mfu(self):
+        mfu = process_training_results.compute_mfu(
+            step_time=2.0,
+            max_tflops=1000,
+            num_accelerators=8,
+            model_flops_per_sample=1e15,
+            batch_size=16,
+        )
+        self.assertAlmostEqual(mfu, 1.0)
+
+    def test_compute_throughput(self):
+        throughput = process_training_results.compute_throughput(
+            step_time=2.0, batch_size=16, num_accelerators=8, seq_length=4096
+        )
+        self.assertAlmostEqual(throughput["samples_per_s"], 8.0)
+        self.assertAlmostEqual(throughput["tokens_per_s"], 8.0 * 4096)
+        self.assertAlmostEqual(throughput["tokens_per_s_per_gpu"], 4096.0)
+        self.assertAlmostEqual(
+            throughput["hours_per_1t_tokens"], 1e12 / (8.0 * 4096) / 3600
+        )
+
+    def test_compute_throughput_without_seq_length(self):
+        throughput = process_training_results.compute_throughput(
+            step_time=2.0, batch_size=16, num_accelerators=8
+        )
+        self.assertAlmostEqual(throughput["samples_per_s"], 8.0)
+        self.assertIsNone(throughput["tokens_per_s"])
+
+    def single_file_main(self, *argv):
+        """Runs the single file mode on the example file, returns its metrics
+        and output."""
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        output_json = os.path.join(output_dir, "metrics.json")
+        argv = [
+            "",
+            "--file",
+            EXAMPLE_FILE,
+            "--batch_size",
+            "2048",
+            "--num_accelerators",
+            "256",
+            "--model_type",
+            "gpt3-175b",
+            "--accelerator_type",
+            "b200",
+            "--output_json",
+            output_json,
+            *argv,
+        ]
+        with mock.patch.object(sys, "argv", argv):
+            args = process_training_results.parse_args()
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            self.assertEqual(process_training_results.main(args), 0)
+        with open(output_json, "r", encoding="utf-8") as f:
+            return json.load(f), stdout.getvalue()
+
+    def test_single_file_flops_source(self):
+        # The example file logs a sequence length of 2048, which only sets the
+        # token throughput.
+        metrics, output = self.single_file_main()
+        self.assertEqual(metrics["seq"], 2048)
+        table_flops = data_defs.MODEL_FLOPS_PER_SAMPLE["gpt3-175b"]
+        self.assertIn(f"{table_flops:.6e} (MODEL_FLOPS_PER_SAMPLE)", output)
+        self.assertAlmostEqual(
+            metrics["mfu"], table_flops * 2048 / 25.39738855 / 256 / 1e12 / 2250
+        )
+
+        metrics, output = self.single_file_main("--seq_length", "2048")
+        flops = model_flops.get_model_flops("gpt3-175b", 2048).total
+        self.assertIn(f"{flops:.6e} (analytical, sequence length 2048)", output)
+        self.assertAlmostEqual(
+            metrics["mfu"], flops * 2048 / 25.39738855 / 256 / 1e12 / 2250
+        )
+
+
+class TestModelFlops(unittest.TestCase):
+    """Tests for the analytical dense and MoE FLOPs."""
+
+    def test_parameter_counts(self):
+        total, active = model_flops.count_parameters(
+            data_defs.MODEL_ARCHITECTURES["deepseek-v3"]
+        )
+        self.assertAlmostEqual(total / 1e9, 671, delta=5)
+        self.assertAlmostEqual(active / 1e9, 37, delta=1)
+        total, active = model_flops.count_parameters(
+            data_defs.MODEL_ARCHITECTURES["qwen3-235b-a22b"]
+        )
+        self.assertAlmostEqual(total / 1e9, 235, delta=2)
+        self.assertAlmostEqual(active / 1e9, 22, delta=1)
+
+    def test_mixtral_matches_reference_value(self):
+        flops = model_flops.get_model_flops("mixtral-8x7b", seq_length=4096)
+        self.assertAlmostEqual(flops.total / 3.4e14, 1.0, places=2)
+        self.assertGreater(flops.routed, flops.dense)
+
+    def test_mixtral_alias(self):
+        self.assertNotIn("mixtral-7b", data_defs.MODEL_FLOPS_PER_SAMPLE)
+        for seq_length in [None, 8192]:
+            self.assertEqual(
+                model_flops.get_model_flops("mixtral-7b", seq_length),
+                model_flops.get_model_flops("mixtral-8x7b", seq_length),
+            )
+
+    def test_dense_model_has_no_routed_flops(self):
+        flops = model_flops.get_model_flops("nemotron4-340b", seq_length=4096)
+        self.assertEqual(flops.routed, 0)
+
+    def test_mtp_layers_add_flops(self):
+        arch = data_defs.MODEL_ARCHITECTURES["deepseek-v3"]
+        without_mtp = dataclasses.replace(arch, mtp_num_layers=0)
+        self.assertGreater(
+            model_flops.compute_model_flops(arch, 4096).total,
+            model_flops.compute_model_flops(without_mtp, 4096).total,
+        )
+
+    def test_dense_models_use_seq_length(self):
+        self.assertAlmostEqual(
+            model_flops.get_model_flops("llama3-70b", 8192).total
+            / model_flops.get_model_flops("llama3-70b", 4096).total,
+            2.14,
+            places=2,
+        )
+        # The fixed values are those of the analytical model at the reference
+        # sequence length of each model.
+        for model, seq_length in [
+            ("gpt3-5b", 2048),
+            ("gpt3-175b", 2048),
+            ("llama2-7b", 4096),
+            ("llama2-70b", 4096),
+            ("llama3-70b", 8192),
+            ("llama3.1-8b", 8192),
+            ("llama3.1-70b", 8192),
+            ("llama3.1-405b", 8192),
+        ]:
+            with self.subTest(model=model):
+                self.assertAlmostEqual(
+                    model_flops.get_model_flops(model, seq_length).total
+                    / data_defs.MODEL_FLOPS_PER_SAMPLE[model],
+                    1.0,
+                    delta=0.02,
+                )
+
+    def test_ignored_seq_length_warns(self):
+        with mock.patch.dict(data_defs.MODEL_FLOPS_PER_SAMPLE, {"my-model": 1e15}):
+            with self.assertWarns(UserWarning):
+                flops = model_flops.get_model_flops("my-model", seq_length=4096)
+        self.assertEqual(flops.total, 1e15)
+
+    def test_fixed_value_without_seq_length(self):
+        flops = model_flops.get_model_flops("gpt3-175b")
+        self.assertEqual(flops.total, 2.2e15)
+        with self.assertRaises(ValueError):
+            model_flops.get_model_flops("deepseek-v3")
+
+
+class TestRecipeRuns(unittest.TestCase):
+    """Tests for the discovery of runs in a results tree."""
+
+    def test_parse_recipe_dir(self):
+        self.assertEqual(
+            recipe_runs.parse_recipe_dir("256gpus-bf16-seq4096-gbs2048"),
+            {
+                "num_accelerators": 256,
+                "precision": "bf16",
+                "seq_length": 4096,
+                "global_batch_size": 2048,
+            },
+        )
+        self.assertEqual(
+            recipe_runs.parse_recipe_dir("128gpu-fp8mx-gcs"),
+            {"num_accelerators": 128, "precision": "fp8mx"},
+        )
+        self.assertEqual(recipe_runs.parse_recipe_dir("nemo-gke"), {})
+
+    def test_parse_recipe_dir_precision_aliases(self):
+        # training/a4x/llama31_405b/megatron-bridge-slurm/nemo2509
+        self.assertEqual(
+            recipe_runs.parse_recipe_dir("128gpus-fp8ds-gbs128"),
+            {"num_accelerators": 128, "precision": "fp8", "global_batch_size": 128},
+        )
+        for alias, precision in data_defs.PRECISION_ALIASES.items():
+            self.assertEqual(
+                recipe_runs.parse_recipe_dir(f"8gpus-{alias}")["precision"], precision
+            )
+            self.assertIn(alias, data_defs.PRECISIONS)
+
+    def test_parse_recipe_path(self):
+        run = recipe_runs.parse_recipe_path(
+            "/results/a4x/llama31_405b/nemo-gke/nemo2602/64gpus-fp8cs-gbs1536/recipe/dllogger.json",
+            "/results",
+        )
+        self.assertEqual(run.machine_family, "a4x")
+        self.assertEqual(run.model, "llama3.1-405b")
+        self.assertEqual(run.framework, "nemo-gke")
+        self.assertEqual(run.num_accelerators, 64)
+        self.assertEqual(run.precision, "fp8")
+        self.assertEqual(run.global_batch_size, 1536)
+        self.assertIsNone(run.seq_length)
+
+
+class TestResultsDir(unittest.TestCase):
+    """Tests for the --results_dir batch mode."""
+
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        for recipe in [
+            "a4/gpt3_175b/nemo-gke/nemo2507/256gpus-fp8-gbs2048",
+            "a4x/qwen3_235b_a22b/megatron-bridge-gke/nemo2602/64gpus-bf16-seq4096-gbs1024",
+        ]:
+            os.makedirs(os.path.join(self.results_dir, recipe))
+            shutil.copy(EXAMPLE_FILE, os.path.join(self.results_dir, recipe))
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def test_process_results_dir(self):
+        rows = process_training_results.process_results_dir(
+            self.results_dir, start_step=10, end_step=30, num_workers=1
+        )
+        self.assertEqual(len(rows), 2)
+        gpt3, qwen3 = rows
+        self.assertEqual(gpt3["seq"], 2048)
+        gpt3_flops = model_flops.get_model_flops("gpt3-175b", 2048).total
+        self.assertAlmostEqual(
+            gpt3["mfu"], gpt3_flops * 2048 / 25.39738855 / 256 / 1e12 / 4500, places=6
+        )
+        self.assertIsNone(gpt3["error"])
+        self.assertEqual(gpt3["routed_flops_pct"], 0)
+        self.assertIsNone(qwen3["error"])
+        self.assertGreater(qwen3["routed_flops_pct"], 0)
+        self.assertAlmostEqual(
+            qwen3["tokens_per_s_per_gpu"], 1024 * 4096 / 25.39738855 / 64, places=3
+        )
+        self.assertIn("qwen3-235b-a22b", process_training_results.format_table(rows))
+
+    def batch_main(self, *argv):
+        """Runs the batch mode on the results, returns its exit code and output."""
+        argv = ["", "--results_dir", self.results_dir, "--num_workers", "1", *argv]
+        with mock.patch.object(sys, "argv", argv):
+            args = process_training_results.parse_args()
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            exit_code = process_training_results.batch_main(args)
+        return exit_code, stdout.getvalue()
+
+    def test_compare_across_containers(self):
+        baseline_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, baseline_dir)
+        self.batch_main("--baseline_dir", baseline_dir, "--save_baseline")
+        # The same recipes run with newer containers.
+        for recipe, container in [
+            ("a4/gpt3_175b/nemo-gke", "nemo2507"),
+            ("a4x/qwen3_235b_a22b/megatron-bridge-gke", "nemo2602"),
+        ]:
+            recipe = os.path.join(self.results_dir, recipe)
+            os.rename(os.path.join(recipe, container), os.path.join(recipe, "nemo2604"))
+        exit_code, output = self.batch_main("--baseline_dir", baseline_dir, "--compare")
+        self.assertEqual(exit_code, 0)
+        reports = output.split("\n\n")[-1]
+        self.assertEqual(reports.count(f" {baselines.STATUS_OK}"), 2, reports)
+        self.assertNotIn(baselines.STATUS_NEW, reports)
+        self.assertNotIn(baselines.STATUS_MISSING, reports)
+
+    def test_compare_fails_on_errors_and_missing_runs(self):
+        baseline_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, baseline_dir)
+        compare = ["--baseline_dir", baseline_dir, "--compare"]
+        self.assertEqual(
+            self.batch_main("--baseline_dir", baseline_dir, "--save_baseline")[0], 0
+        )
+        self.assertEqual(self.batch_main(*compare)[0], 0)
+
+        # A run without a step time.
+        recipe = os.path.join(
+            self.results_dir, "a4/llama3_70b/nemo-gke/nemo2602/64gpus-bf16-gbs256"
+        )
+        os.makedirs(recipe)
+        with open(os.path.join(recipe, "dllogger.json"), "w") as f:
+            f.write("not json")
+        exit_code, output = self.batch_main(*compare)
+        self.assertEqual(exit_code, 1)
+        self.assertIn("1 run(s) without a step time", output)
+
+        # A recipe of the baselines without a run.
+        shutil.rmtree(recipe)
+        shutil.rmtree(os.path.join(self.results_dir, "a4"))
+        exit_code, output = self.batch_main(*compare)
+        self.assertEqual(exit_code, 1)
+        self.assertIn("1 baseline recipe(s) without a run", output)
+        self.assertIn(baselines.STATUS_MISSING, output)
+
+
+class TestBaselines(unittest.TestCase):
+    """Tests for the baseline store and the regression check."""
+
+    def setUp(self):
+        self.baseline_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.baseline_dir)
+
+    def _row(self, step_times):
+        return {
+            "recipe": "a4/llama3_70b/nemo-gke/nemo2602/64gpus-bf16-gbs256",
+            "step_time": sum(step_times) / len(step_times),
+            "mfu": 0.5 / (sum(step_times) / len(step_times)),
+            "step_times": step_times,
+        }
+
+    def test_welch_t_test(self):
+        self.assertAlmostEqual(
+            baselines.welch_t_test([1, 2, 3, 4, 5], [2, 3, 4, 5, 6]),
+            0.3466,
+            places=4,
+        )
+
+    def test_store_round_trip(self):
+        store = baselines.BaselineStore(self.baseline_dir)
+        row = self._row([1.0, 1.1, 0.9])
+        self.assertIsNone(store.load(row["recipe"]))
+        store.save(row)
+        self.assertEqual(store.load(row["recipe"])["step_times"], [1.0, 1.1, 0.9])
+
+    def test_regression_detected(self):
+        baseline = self._row([1.0, 1.01, 0.99, 1.0, 1.02, 0.98])
+        current = self._row([1.2, 1.21, 1.19, 1.2, 1.22, 1.18])
+        report = baselines.compare_to_baseline(current, baseline, 5.0, 0.05)
+        self.assertEqual(report["status"], baselines.STATUS_REGRESSION)
+        self.assertAlmostEqual(report["step_time_delta_pct"], 20.0)
+
+    def test_noisy_delta_not_significant(self):
+        baseline = self._row([1.0, 2.0, 0.5, 1.5])
+        current = self._row([1.5, 2.2, 0.6, 1.7])
+        report = baselines.compare_to_baseline(current, baseline, 5.0, 0.05)
+        self.assertEqual(report["status"], baselines.STATUS_OK)
+
+    def test_baseline_key(self):
+        row = {
+            "recipe": "a4x/llama3_70b/nemo-gke/nemo2602/64gpus-fp8mx-gbs256",
+            "machine": "a4x",
+            "model": "llama3-70b",
+            "framework": "nemo-gke",
+            "gpus": 64,
+            "precision": "fp8mx",
+            "gbs": 256,
+            "seq": 8192,
+        }
+        self.assertEqual(
+            baselines.baseline_key(row),
+            "a4x/llama3-70b/nemo-gke/64gpus-fp8mx-seq8192-gbs256",
+        )
+        self.assertEqual(
+            baselines.baseline_key(dict(row, recipe="nemo2509/other")),
+            baselines.baseline_key(row),
+        )
+        # Without a machine family the recipe path is the key.
+        self.assertEqual(baselines.baseline_key(dict(row, machine=None)), row["recipe"])
+
+    def test_store_path(self):
+        store = baselines.BaselineStore(self.baseline_dir)
+        self.assertEqual(
+            store.path("a4/llama3_70b/nemo-gke"),
+            os.path.join(self.baseline_dir, "a4%2Fllama3_70b%2Fnemo-gke.json"),
+        )
+        # Keys never share a file.
+        keys = ["a/b", "a__b", "a_b", "a b", ".", "..", "%2E", "a%2Fb"]
+        self.assertEqual(len({store.path(key) for key in keys}), len(keys))
+        for key in keys:
+            self.assertFalse(os.path.basename(store.path(key)).startswith("."), key)
+            self.assertEqual(os.path.dirname(store.path(key)), self.baseline_dir)
+        with self.assertRaises(ValueError):
+            store.path("")
+        self.assertEqual(store.keys(), [])
+        row = self._row([1.0])
+        store.save(dict(row, recipe="."))
+        store.save(row)
+        self.assertEqual(sorted(store.keys()), sorted([".", row["recipe"]]))
+
+    def test_missing_baseline(self):
+        report = baselines.compare_to_baseline(self._row([1.0, 1.0]), None, 5.0, 0.05)
+        self.assertEqual(report["status"], baselines.STATUS_NEW)
+
+
+class TestParallelismPlanner(unittest.TestCase):
+    """Tests for the offline parallelism planner."""
+
+    def setUp(self):
+        self.arch = data_defs.MODEL_ARCHITECTURES["deepseek-v3"]
+        # Layout of the a4 DeepSeek V3 recipe, 256 GPUs, gbs 2048, seq 4096.
+        self.cluster = parallelism_planner.get_cluster_spec("a4", 256)
+        self.recipe_layout = parallelism_planner.ParallelLayout(
+            pp=16, ep=8, recompute_modules=("mla_up_proj",)
+        )
+
+    def estimate(self, layout, cluster=None, global_batch_size=2048):
+        return parallelism_planner.estimate_layout(
+            self.arch, layout, cluster or self.cluster, global_batch_size, 4096
+        )
+
+    def test_cluster_spec(self):
+        self.assertEqual(self.cluster.memory_gb, 180)
+        self.assertEqual(self.cluster.peak_tflops, 2250)
+        self.assertEqual(
+            parallelism_planner.get_cluster_spec("a4", 8, memory_gb=80).memory_gb, 80
+        )
+        with self.assertRaises(ValueError):
+            parallelism_planner.get_cluster_spec("v5e", 8)
+        # Every GPU machine family with recipes has a network.
+        g4 = parallelism_planner.get_cluster_spec("g4", 8)
+        self.assertEqual(g4.memory_gb, 96)
+        plans = parallelism_planner.plan_layouts(
+            data_defs.MODEL_ARCHITECTURES["llama3.1-8b"], g4, 32, 4096
+        )
+        self.assertTrue(plans)
+        self.assertTrue(all(plan.fits for plan in plans))
+
+    def test_enumerated_layouts_are_valid(self):
+        layouts = parallelism_planner.enumerate_layouts(
+            self.arch, 256, 2048, 4096, nvlink_domain=8
+        )
+        self.assertIn(
+            dataclasses.replace(self.recipe_layout, recompute_modules=()), layouts
+        )
+        for layout in layouts:
+            dp = layout.data_parallel_size(256)
+            self.assertEqual(layout.tp * layout.cp * layout.pp * dp, 256, layout)
+            self.assertLessEqual(layout.tp, 8, layout)
+            self.assertEqual(self.arch.num_moe_experts % layout.ep, 0, layout)
+            self.assertEqual((256 // layout.pp) % (layout.ep * layout.etp), 0, layout)
+            self.assertEqual(2048 % (dp * layout.micro_batch_size), 0, layout)
+            self.assertLessEqual(
+                layout.pp * (layout.vp or 1), self.arch.num_layers, layout
+            )
+
+    def test_invalid_layouts(self):
+        invalid_layouts = {
+            # 256 data parallel ranks of 4 samples take more than 512 samples.
+            "microbatches": (
+                parallelism_planner.ParallelLayout(micro_batch_size=4),
+                512,
+            ),
+            "tensor": (dataclasses.replace(self.recipe_layout, tp=16), 2048),
+            "experts": (dataclasses.replace(self.recipe_layout, ep=3), 2048),
+            "virtual": (dataclasses.replace(self.recipe_layout, vp=4), 2048),
+            "pipeline": (dataclasses.replace(self.recipe_layout, pp=3), 2048),
+        }
+        for name, (layout, global_batch_size) in invalid_layouts.items():
+            with self.subTest(name), self.assertRaises(ValueError):
+                self.estimate(layout, global_batch_size=global_batch_size)
+
+    def test_recipe_layouts_fit(self):
+        estimate = self.estimate(self.recipe_layout)
+        self.assertTrue(estimate.fits)
+        self.assertGreater(estimate.mfu, 0)
+        # The recipe needs its recomputation.
+        self.assertFalse(
+            self.estimate(
+                dataclasses.replace(self.recipe_layout, recompute_modules=())
+            ).fits
+        )
+        # a4x recipe, interleaved pipeline over 4 stages and 64 expert ranks.
+        a4x_layout = parallelism_planner.ParallelLayout(
+            pp=4, vp=4, ep=64, recompute_modules=("mla_up_proj",)
+        )
+        a4x = parallelism_planner.get_cluster_spec("a4x", 256)
+        self.assertTrue(self.estimate(a4x_layout, a4x, global_batch_size=4096).fits)
+
+    def test_replicated_model_does_not_fit(self):
+        estimate = self.estimate(parallelism_planner.ParallelLayout())
+        self.assertFalse(estimate.fits)
+        self.assertGreater(estimate.parameter_memory_gb, 671 * 6)
+
+    def test_interleaving_reduces_bubble(self):
+        interleaved = dataclasses.replace(self.recipe_layout, pp=8, vp=4)
+        self.assertLess(
+            self.estimate(interleaved).bubble_time,
+            self.estimate(dataclasses.replace(interleaved, vp=None)).bubble_time,
+        )
+
+    def test_plan_layouts(self):
+        plans = parallelism_planner.plan_layouts(self.arch, self.cluster, 2048, 4096)
+        self.assertTrue(plans)
+        self.assertTrue(all(plan.fits for plan in plans))
+        step_times = [plan.step_time for plan in plans]
+        self.assertEqual(step_times, sorted(step_times))
+        # Every layout uses the cheapest recomputation fitting in memory.
+        candidates = parallelism_planner.recompute_candidates(self.arch)
+        self.assertEqual(candidates[0], ())
+        for plan in plans[:20]:
+            cheaper = candidates[: candidates.index(plan.layout.recompute_modules)]
+            for modules in cheaper:
+                layout = dataclasses.replace(plan.layout, recompute_modules=modules)
+                self.assertFalse(self.estimate(layout).fits)
+
+    def test_recipe_config(self):
+        layout = parallelism_planner.ParallelLayout(
+            pp=4, ep=8, recompute_modules=("layernorm", "moe_act")
+        )
+        self.assertEqual(
+            layout.recipe_config(),
+            {
+                "tensor_model_parallel_size": 1,
+                "pipeline_model_parallel_size": 4,
+                "virtual_pipeline_model_parallel_size": None,
+                "context_parallel_size": 1,
+                "expert_model_parallel_size": 8,
+                "expert_tensor_parallel_size": 1,
+                "micro_batch_size": 1,
+                "recompute_modules": "layernorm,moe_act",
+            },
+        )
+        self.assertNotIn(
+            "recompute_modules", parallelism_planner.ParallelLayout().recipe_config()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
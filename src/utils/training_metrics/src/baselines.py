@@ -0,0 +1,262 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Baseline store and regression checks for training metrics"""
+
+import json
+import math
+import os
+import statistics
+import urllib.parse
+from typing import List, Optional
+
+STATUS_OK = "ok"
+STATUS_REGRESSION = "regression"
+STATUS_IMPROVEMENT = "improvement"
+STATUS_NEW = "new"
+STATUS_ERROR = "error"
+STATUS_MISSING = "missing"
+
+# Fields of a process_recipe_run row persisted in a baseline.
+BASELINE_FIELDS = [
+    "key",
+    "recipe",
+    "machine",
+    "model",
+    "framework",
+    "gpus",
+    "precision",
+    "gbs",
+    "seq",
+    "step_time",
+    "tflops_per_gpu",
+    "mfu",
+    "step_times",
+]
+
+
+def baseline_key(row: dict) -> str:
+    """Returns the baseline key of a process_recipe_run row.
+
+    The key is made of the machine family, model, framework, GPU count,
+    precision, sequence length and global batch size of the run, e.g.
+    a4x/llama3.1-70b/nemo-gke/64gpus-fp8mx-gbs256, and not of the container
+    directory, so that the runs of two containers share their baselines. Rows
+    whose machine family, model or GPU count is unknown use their recipe path.
+    """
+    if None in (row.get("machine"), row.get("model"), row.get("gpus")):
+        return row["recipe"]
+    config = [f"{row['gpus']}gpus", row.get("precision")]
+    if row.get("seq") is not None:
+        config.append(f"seq{row['seq']}")
+    if row.get("gbs") is not None:
+        config.append(f"gbs{row['gbs']}")
+    parts = [row["machine"], row["model"], row.get("framework")]
+    return "/".join([p for p in parts if p] + ["-".join(c for c in config if c)])
+
+
+class BaselineStore:
+    """Stores one JSON baseline per baseline key in a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, key: str) -> str:
+        """Returns the baseline file of a baseline key.
+
+        The key is percent-encoded, path separators included, so that two keys
+        never share a file. A leading dot is encoded too.
+        """
+        if not key:
+            raise ValueError("Empty baseline key")
+        name = urllib.parse.quote(key, safe="")
+        if name.startswith("."):
+            name = "%2E" + name[1:]
+        return os.path.join(self.directory, name + ".json")
+
+    def keys(self) -> List[str]:
+        """Returns the keys of the stored baselines."""
+        if not os.path.isdir(self.directory):
+            return []
+        keys = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                with open(
+                    os.path.join(self.directory, name), "r", encoding="utf-8"
+                ) as f:
+                    keys.append(json.load(f)["key"])
+        return keys
+
+    def load(self, key: str) -> Optional[dict]:
+        """Returns the baseline of a baseline key or None if there is none."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, row: dict):
+        """Saves a process_recipe_run row as the baseline of its key."""
+        os.makedirs(self.directory, exist_ok=True)
+        baseline = {field: row.get(field) for field in BASELINE_FIELDS}
+        baseline["key"] = baseline_key(row)
+        with open(self.path(baseline["key"]), "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Continued fraction of the regularized incomplete beta function."""
+    tiny = 1e-30
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 201):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-12:
+            break
+    return h
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function I_x(a, b)."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(
+        math.lgamma(a + b)
+        - math.lgamma(a)
+        - math.lgamma(b)
+        + a * math.log(x)
+        + b * math.log(1.0 - x)
+    )
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def welch_t_test(baseline: List[float], current: List[float]) -> float:
+    """Two sided Welch's t-test on two samples of step times.
+
+    Args:
+        baseline (List[float]): baseline samples
+        current (List[float]): new samples
+
+    Returns:
+        float: p-value of the hypothesis that both means are equal
+    """
+    if len(baseline) < 2 or len(current) < 2:
+        return float("nan")
+    var_b = statistics.variance(baseline) / len(baseline)
+    var_c = statistics.variance(current) / len(current)
+    diff = statistics.fmean(current) - statistics.fmean(baseline)
+    if var_b + var_c == 0:
+        return 1.0 if diff == 0 else 0.0
+    t = diff / math.sqrt(var_b + var_c)
+    dof = (var_b + var_c) ** 2 / (
+        var_b**2 / (len(baseline) - 1) + var_c**2 / (len(current) - 1)
+    )
+    return _betainc(dof / 2.0, 0.5, dof / (dof + t * t))
+
+
+def _relative_delta(baseline: Optional[float], current: Optional[float]):
+    if baseline is None or current is None or baseline == 0:
+        return None
+    return (current - baseline) / baseline * 100
+
+
+def _report(recipe: str, step_time: Optional[float], mfu: Optional[float]) -> dict:
+    return {
+        "recipe": recipe,
+        "baseline_step_time": None,
+        "step_time": step_time,
+        "step_time_delta_pct": None,
+        "baseline_mfu": None,
+        "mfu": mfu,
+        "mfu_delta_pct": None,
+        "p_value": None,
+        "status": STATUS_NEW,
+    }
+
+
+def compare_to_baseline(
+    row: dict,
+    baseline: Optional[dict],
+    threshold: float,
+    significance: float,
+) -> dict:
+    """Compares a process_recipe_run row with its baseline.
+
+    A run is a regression when its mean step time is more than threshold
+    percent slower than the baseline and the difference is statistically
+    significant at the given level. Improvements are reported symmetrically.
+
+    Args:
+        row (dict): metrics of the new run
+        baseline (dict): stored baseline of the recipe, None if missing
+        threshold (float): step time increase in percent tolerated
+        significance (float): p-value below which a delta is significant
+
+    Returns:
+        dict: a row of the comparison report
+    """
+    report = _report(row["recipe"], row.get("step_time"), row.get("mfu"))
+    if row.get("step_time") is None:
+        report["status"] = STATUS_ERROR
+        return report
+    if baseline is None:
+        return report
+
+    report["baseline_step_time"] = baseline.get("step_time")
+    report["baseline_mfu"] = baseline.get("mfu")
+    report["step_time_delta_pct"] = _relative_delta(
+        report["baseline_step_time"], report["step_time"]
+    )
+    report["mfu_delta_pct"] = _relative_delta(report["baseline_mfu"], report["mfu"])
+    report["p_value"] = welch_t_test(
+        baseline.get("step_times") or [], row.get("step_times") or []
+    )
+
+    # Without per-step samples on either side only the threshold is used.
+    significant = math.isnan(report["p_value"]) or report["p_value"] < significance
+    report["status"] = STATUS_OK
+    if significant and report["step_time_delta_pct"] is not None:
+        if report["step_time_delta_pct"] > threshold:
+            report["status"] = STATUS_REGRESSION
+        elif report["step_time_delta_pct"] < -threshold:
+            report["status"] = STATUS_IMPROVEMENT
+    return report
+
+
+def missing_run_report(baseline: dict) -> dict:
+    """Reports a stored baseline whose recipe has no run in the new results."""
+    report = _report(baseline["recipe"], None, None)
+    report["baseline_step_time"] = baseline.get("step_time")
+    report["baseline_mfu"] = baseline.get("mfu")
+    report["status"] = STATUS_MISSING
+    return report
@@ -14,35 +14,163 @@
 
 """Accelerators and models definitions"""
 
-ACCELERATORS = ["b200", "h100", "h200", "a100", "v5e", "v5p"]
+import dataclasses
+from typing import Dict, Optional
+
+
+@dataclasses.dataclass(frozen=True)
+class AcceleratorSpec:
+    """Peak dense (non-sparse) tensor throughput and memory of an accelerator.
+
+    Attributes:
+        name: Short accelerator name, e.g. "b200".
+        peak_tflops: Peak dense TFLOPS keyed by numeric format. Only formats
+            with native tensor core support are listed.
+        source: Where the numbers come from.
+        memory_gb: High bandwidth memory of the accelerator in GB (1e9 bytes).
+    """
+
+    name: str
+    peak_tflops: Dict[str, float]
+    source: str = ""
+    memory_gb: float = 0.0
+
+
+# Numeric formats of ACCELERATOR_SPECS. fp8 covers per-tensor scaling,
+# fp8mx is the block scaled MXFP8 format and nvfp4 is NVIDIA's block scaled
+# FP4 format.
+CANONICAL_PRECISIONS = ["bf16", "fp8", "fp8mx", "nvfp4"]
+
+# Recipe naming aliases resolved to the format used in ACCELERATOR_SPECS.
+# fp8cs and fp8ds are the current and delayed scaling FP8 recipes.
+PRECISION_ALIASES = {
+    "fp8cs": "fp8",
+    "fp8ds": "fp8",
+    "mxfp8": "fp8mx",
+    "fp4": "nvfp4",
+}
+
+# Numeric formats understood by the tool, aliases included.
+PRECISIONS = CANONICAL_PRECISIONS + list(PRECISION_ALIASES)
+
+
+def resolve_precision(precision: str) -> str:
+    """Resolves a recipe precision alias, e.g. fp8ds, to its canonical format."""
+    return PRECISION_ALIASES.get(precision, precision)
+
+
+ACCELERATOR_SPECS = {
+    spec.name: spec
+    for spec in [
+        AcceleratorSpec(
+            "a100",
+            {"bf16": 312},
+            "https://resources.nvidia.com/en-us-tensor-core page39",
+            memory_gb=80,
+        ),
+        AcceleratorSpec(
+            "h100",
+            {"bf16": 989, "fp8": 1978},
+            "https://resources.nvidia.com/en-us-tensor-core page39",
+            memory_gb=80,
+        ),
+        AcceleratorSpec(
+            "h200",
+            {"bf16": 989, "fp8": 1978},
+            "https://www.nvidia.com/en-us/data-center/h200/",
+            memory_gb=141,
+        ),
+        AcceleratorSpec(
+            "b200",
+            {"bf16": 2250, "fp8": 4500, "fp8mx": 4500, "nvfp4": 9000},
+            "https://www.nvidia.com/en-us/data-center/hgx/",
+            memory_gb=180,
+        ),
+        AcceleratorSpec(
+            "gb200",
+            {"bf16": 2500, "fp8": 5000, "fp8mx": 5000, "nvfp4": 10000},
+            "https://www.nvidia.com/en-us/data-center/gb200-nvl72/",
+            memory_gb=186,
+        ),
+        AcceleratorSpec(
+            "gb300",
+            {"bf16": 2500, "fp8": 5000, "fp8mx": 5000, "nvfp4": 15000},
+            "https://www.nvidia.com/en-us/data-center/gb300-nvl72/",
+            memory_gb=288,
+        ),
+        # The datasheet lists sparse numbers, the values below are halved.
+        AcceleratorSpec(
+            "rtx-pro-6000",
+            {"bf16": 504, "fp8": 1008, "fp8mx": 1008, "nvfp4": 2015},
+            "https://www.nvidia.com/en-us/data-center/rtx-pro-6000-blackwell-server-edition/",
+            memory_gb=96,
+        ),
+        AcceleratorSpec(
+            "v5e", {"bf16": 197}, "https://cloud.google.com/tpu/docs/v5e", memory_gb=16
+        ),
+        AcceleratorSpec(
+            "v5p", {"bf16": 459}, "https://cloud.google.com/tpu/docs/v5p", memory_gb=95
+        ),
+    ]
+}
+
+# Machine families used in the training/ directory and their accelerator.
+MACHINE_FAMILIES = {
+    "a3mega": "h100",
+    "a3ultra": "h200",
+    "a4": "b200",
+    "a4x": "gb200",
+    "a4x-max": "gb300",
+    "g4": "rtx-pro-6000",
+}
+
+ACCELERATORS = list(ACCELERATOR_SPECS.keys()) + list(MACHINE_FAMILIES.keys())
 
 MAX_TFLOPS = {
-    (
-        "h100",
-        "bf16",
-    ): 989,  # https://resources.nvidia.com/en-us-tensor-core page39 - bf16
-    (
-        "h100",
-        "fp8",
-    ): 1978,  # https://resources.nvidia.com/en-us-tensor-core page39 - fp8
-    ("v5e", "bf16"): 197,  # https://cloud.google.com/tpu/docs/v5e
-    ("v5p", "bf16"): 459,  # https://cloud.google.com/tpu/docs/v5p
-    (
-        "a100",
-        "bf16",
-    ): 312,  # https://resources.nvidia.com/en-us-tensor-core page39 - bf16
-    (
-        "h200",
-        "bf16",
-    ): 989,
-    (
-        "h200",
-        "fp8",
-    ): 1978,
-    ("b200", "bf16"): 2250,  # https://www.nvidia.com/en-us/data-center/hgx/
-    ("b200", "fp8"): 4500,
+    (spec.name, precision): tflops
+    for spec in ACCELERATOR_SPECS.values()
+    for precision, tflops in spec.peak_tflops.items()
 }
 
+
+def get_accelerator_spec(accelerator: str) -> AcceleratorSpec:
+    """Returns the spec for an accelerator or machine family name.
+
+    Args:
+        accelerator (str): accelerator name (e.g. "gb200") or machine family
+            (e.g. "a4x")
+
+    Returns:
+        AcceleratorSpec: the spec of the accelerator
+    """
+    name = MACHINE_FAMILIES.get(accelerator, accelerator)
+    if name not in ACCELERATOR_SPECS:
+        raise ValueError(
+            f"Unknown accelerator {accelerator}. Known values: {ACCELERATORS}"
+        )
+    return ACCELERATOR_SPECS[name]
+
+
+def get_max_tflops(accelerator: str, precision: str) -> float:
+    """Returns the peak dense TFLOPS of an accelerator for a numeric format.
+
+    Args:
+        accelerator (str): accelerator name or machine family
+        precision (str): numeric format, recipe aliases such as fp8cs allowed
+
+    Returns:
+        float: peak dense TFLOPS
+    """
+    spec = get_accelerator_spec(accelerator)
+    precision = resolve_precision(precision)
+    if precision not in spec.peak_tflops:
+        raise ValueError(
+            f"{precision} is not supported on {spec.name}. "
+            f"Supported formats: {list(spec.peak_tflops.keys())}"
+        )
+    return spec.peak_tflops[precision]
+
+
 MODEL_FLOPS_PER_SAMPLE = {
     "gpt3-5b": 6.69e13,
     "gpt3-175b": 2.2e15,
@@ -52,6 +180,226 @@ MODEL_FLOPS_PER_SAMPLE = {
     "llama3.1-8b": 4.74e14,
     "llama3.1-70b": 3.9129e15,
     "llama3.1-405b": 2.16533e16,
-    "mixtral-7b": 3.4e14,
+    # Active FLOPs at seq 4096.
     "mixtral-8x7b": 3.4e14,
 }
+
+# Former model names resolved to the keys of MODEL_ARCHITECTURES and
+# MODEL_FLOPS_PER_SAMPLE.
+MODEL_NAME_ALIASES = {
+    "mixtral-7b": "mixtral-8x7b",
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class ModelArchitecture:
+    """Transformer architecture used to compute the model FLOPs analytically.
+
+    Attributes:
+        num_layers: Number of transformer layers.
+        hidden_size: Hidden size.
+        num_attention_heads: Number of attention heads.
+        ffn_hidden_size: Hidden size of the dense MLP layers.
+        vocab_size: Vocabulary size.
+        num_query_groups: Number of key/value heads for GQA. Defaults to
+            num_attention_heads.
+        head_dim: Attention head size. Defaults to hidden_size / num_attention_heads.
+        gated_linear_unit: Whether the MLP is gated (SwiGLU), i.e. has three
+            weight matrices instead of two.
+        num_moe_experts: Number of routed experts, 0 for dense models.
+        moe_ffn_hidden_size: Hidden size of a routed expert.
+        moe_router_topk: Number of routed experts active per token.
+        moe_shared_expert_ffn_hidden_size: Total hidden size of the shared
+            experts, applied to every token.
+        num_dense_layers: Number of leading layers using a dense MLP instead of
+            experts (first_k_dense_replace in DeepSeek V3).
+        q_lora_rank: Query compression rank of Multi-head Latent Attention.
+        kv_lora_rank: Key/value compression rank of Multi-head Latent
+            Attention, 0 when the model does not use MLA.
+        qk_head_dim: MLA query/key head size without the rotary part.
+        qk_pos_emb_head_dim: MLA rotary query/key head size.
+        v_head_dim: MLA value head size.
+        mtp_num_layers: Number of Multi-Token Prediction layers.
+    """
+
+    num_layers: int
+    hidden_size: int
+    num_attention_heads: int
+    ffn_hidden_size: int
+    vocab_size: int
+    num_query_groups: Optional[int] = None
+    head_dim: Optional[int] = None
+    gated_linear_unit: bool = True
+    num_moe_experts: int = 0
+    moe_ffn_hidden_size: int = 0
+    moe_router_topk: int = 0
+    moe_shared_expert_ffn_hidden_size: int = 0
+    num_dense_layers: int = 0
+    q_lora_rank: Optional[int] = None
+    kv_lora_rank: int = 0
+    qk_head_dim: int = 0
+    qk_pos_emb_head_dim: int = 0
+    v_head_dim: int = 0
+    mtp_num_layers: int = 0
+
+
+# Architectures of the models trained by the recipes, from their Hugging Face
+# configs. Used to compute FLOPs for any sequence length and to separate the
+# routed expert FLOPs of MoE models from the dense FLOPs.
+MODEL_ARCHITECTURES = {
+    "deepseek-v3": ModelArchitecture(
+        num_layers=61,
+        hidden_size=7168,
+        num_attention_heads=128,
+        ffn_hidden_size=18432,
+        vocab_size=129280,
+        num_moe_experts=256,
+        moe_ffn_hidden_size=2048,
+        moe_router_topk=8,
+        moe_shared_expert_ffn_hidden_size=2048,
+        num_dense_layers=3,
+        q_lora_rank=1536,
+        kv_lora_rank=512,
+        qk_head_dim=128,
+        qk_pos_emb_head_dim=64,
+        v_head_dim=128,
+        mtp_num_layers=1,
+    ),
+    "kimi-k2": ModelArchitecture(
+        num_layers=61,
+        hidden_size=7168,
+        num_attention_heads=64,
+        ffn_hidden_size=18432,
+        vocab_size=163840,
+        num_moe_experts=384,
+        moe_ffn_hidden_size=2048,
+        moe_router_topk=8,
+        moe_shared_expert_ffn_hidden_size=2048,
+        num_dense_layers=1,
+        q_lora_rank=1536,
+        kv_lora_rank=512,
+        qk_head_dim=128,
+        qk_pos_emb_head_dim=64,
+        v_head_dim=128,
+    ),
+    "qwen3-235b-a22b": ModelArchitecture(
+        num_layers=94,
+        hidden_size=4096,
+        num_attention_heads=64,
+        num_query_groups=4,
+        head_dim=128,
+        ffn_hidden_size=12288,
+        vocab_size=151936,
+        num_moe_experts=128,
+        moe_ffn_hidden_size=1536,
+        moe_router_topk=8,
+    ),
+    "qwen3-30b-a3b": ModelArchitecture(
+        num_layers=48,
+        hidden_size=2048,
+        num_attention_heads=32,
+        num_query_groups=4,
+        head_dim=128,
+        ffn_hidden_size=6144,
+        vocab_size=151936,
+        num_moe_experts=128,
+        moe_ffn_hidden_size=768,
+        moe_router_topk=8,
+    ),
+    # Sliding window attention of every other layer is counted as full attention.
+    "gpt-oss-120b": ModelArchitecture(
+        num_layers=36,
+        hidden_size=2880,
+        num_attention_heads=64,
+        num_query_groups=8,
+        head_dim=64,
+        ffn_hidden_size=2880,
+        vocab_size=201088,
+        num_moe_experts=128,
+        moe_ffn_hidden_size=2880,
+        moe_router_topk=4,
+    ),
+    "mixtral-8x7b": ModelArchitecture(
+        num_layers=32,
+        hidden_size=4096,
+        num_attention_heads=32,
+        num_query_groups=8,
+        ffn_hidden_size=14336,
+        vocab_size=32000,
+        num_moe_experts=8,
+        moe_ffn_hidden_size=14336,
+        moe_router_topk=2,
+    ),
+    "nemotron4-340b": ModelArchitecture(
+        num_layers=96,
+        hidden_size=18432,
+        num_attention_heads=96,
+        num_query_groups=8,
+        ffn_hidden_size=73728,
+        vocab_size=256000,
+        gated_linear_unit=False,
+    ),
+    "gpt3-5b": ModelArchitecture(
+        num_layers=24,
+        hidden_size=4096,
+        num_attention_heads=32,
+        ffn_hidden_size=16384,
+        vocab_size=50257,
+        gated_linear_unit=False,
+    ),
+    "gpt3-175b": ModelArchitecture(
+        num_layers=96,
+        hidden_size=12288,
+        num_attention_heads=96,
+        ffn_hidden_size=49152,
+        vocab_size=50257,
+        gated_linear_unit=False,
+    ),
+    "llama2-7b": ModelArchitecture(
+        num_layers=32,
+        hidden_size=4096,
+        num_attention_heads=32,
+        ffn_hidden_size=11008,
+        vocab_size=32000,
+    ),
+    "llama2-70b": ModelArchitecture(
+        num_layers=80,
+        hidden_size=8192,
+        num_attention_heads=64,
+        num_query_groups=8,
+        ffn_hidden_size=28672,
+        vocab_size=32000,
+    ),
+    "llama3-70b": ModelArchitecture(
+        num_layers=80,
+        hidden_size=8192,
+        num_attention_heads=64,
+        num_query_groups=8,
+        ffn_hidden_size=28672,
+        vocab_size=128256,
+    ),
+    "llama3.1-8b": ModelArchitecture(
+        num_layers=32,
+        hidden_size=4096,
+        num_attention_heads=32,
+        num_query_groups=8,
+        ffn_hidden_size=14336,
+        vocab_size=128256,
+    ),
+    "llama3.1-70b": ModelArchitecture(
+        num_layers=80,
+        hidden_size=8192,
+        num_attention_heads=64,
+        num_query_groups=8,
+        ffn_hidden_size=28672,
+        vocab_size=128256,
+    ),
+    "llama3.1-405b": ModelArchitecture(
+        num_layers=126,
+        hidden_size=16384,
+        num_attention_heads=128,
+        num_query_groups=8,
+        ffn_hidden_size=53248,
+        vocab_size=128256,
+    ),
+}
@@ -0,0 +1,199 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Analytical model FLOPs for dense and Mixture of Experts transformers"""
+
+import dataclasses
+import warnings
+from typing import Optional
+
+from src.data_defs import (
+    MODEL_ARCHITECTURES,
+    MODEL_FLOPS_PER_SAMPLE,
+    MODEL_NAME_ALIASES,
+    ModelArchitecture,
+)
+
+# Forward + backward FLOPs per forward multiply-accumulate.
+FLOPS_PER_MAC = 2 * 3
+
+
+@dataclasses.dataclass(frozen=True)
+class ModelFlops:
+    """Forward + backward FLOPs of a single training sample.
+
+    Attributes:
+        dense: FLOPs applied to every token: attention, dense MLP layers,
+            shared experts, routers, MTP projections and output logits.
+        routed: FLOPs of the top-k routed experts, only active parameters.
+    """
+
+    dense: float
+    routed: float = 0.0
+
+    @property
+    def total(self) -> float:
+        return self.dense + self.routed
+
+
+def mlp_macs(arch: ModelArchitecture, ffn_hidden_size: int) -> int:
+    """Per token MACs of one MLP, or one expert, of the given hidden size."""
+    num_matrices = 3 if arch.gated_linear_unit else 2
+    return num_matrices * arch.hidden_size * ffn_hidden_size
+
+
+def _attention_macs(arch: ModelArchitecture, seq_length: int) -> int:
+    """Per token MACs of one attention block, causal masking not discounted."""
+    h = arch.hidden_size
+    heads = arch.num_attention_heads
+    if arch.kv_lora_rank:
+        qk_dim = arch.qk_head_dim + arch.qk_pos_emb_head_dim
+        if arch.q_lora_rank:
+            q_proj = h * arch.q_lora_rank + arch.q_lora_rank * heads * qk_dim
+        else:
+            q_proj = h * heads * qk_dim
+        kv_proj = h * (arch.kv_lora_rank + arch.qk_pos_emb_head_dim)
+        kv_proj += arch.kv_lora_rank * heads * (arch.qk_head_dim + arch.v_head_dim)
+        out_proj = heads * arch.v_head_dim * h
+        core = seq_length * heads * (qk_dim + arch.v_head_dim)
+        return q_proj + kv_proj + out_proj + core
+
+    head_dim = arch.head_dim or h // heads
+    query_groups = arch.num_query_groups or heads
+    qkv_proj = h * (heads + 2 * query_groups) * head_dim
+    out_proj = heads * head_dim * h
+    core = 2 * seq_length * heads * head_dim
+    return qkv_proj + out_proj + core
+
+
+def _layer_macs(arch: ModelArchitecture, seq_length: int, moe: bool):
+    """Per token (dense, routed) MACs of one transformer layer."""
+    dense = _attention_macs(arch, seq_length)
+    if not moe:
+        return dense + mlp_macs(arch, arch.ffn_hidden_size), 0
+    dense += arch.hidden_size * arch.num_moe_experts
+    if arch.moe_shared_expert_ffn_hidden_size:
+        dense += mlp_macs(arch, arch.moe_shared_expert_ffn_hidden_size)
+    routed = arch.moe_router_topk * mlp_macs(arch, arch.moe_ffn_hidden_size)
+    return dense, routed
+
+
+def layer_flops(arch: ModelArchitecture, seq_length: int, moe: bool) -> ModelFlops:
+    """Computes the forward + backward FLOPs of one transformer layer and sample."""
+    dense, routed = _layer_macs(arch, seq_length, moe=moe)
+    factor = FLOPS_PER_MAC * seq_length
+    return ModelFlops(dense=dense * factor, routed=routed * factor)
+
+
+def compute_model_flops(arch: ModelArchitecture, seq_length: int) -> ModelFlops:
+    """Computes the forward + backward FLOPs of one sample.
+
+    Args:
+        arch (ModelArchitecture): model architecture
+        seq_length (int): sequence length of a sample
+
+    Returns:
+        ModelFlops: dense and routed expert FLOPs per sample
+    """
+    is_moe = arch.num_moe_experts > 0
+    num_dense_layers = arch.num_dense_layers if is_moe else arch.num_layers
+    num_moe_layers = arch.num_layers - num_dense_layers
+
+    dense_layer, _ = _layer_macs(arch, seq_length, moe=False)
+    dense = num_dense_layers * dense_layer
+    routed = 0
+    if num_moe_layers:
+        moe_dense, moe_routed = _layer_macs(arch, seq_length, moe=True)
+        dense += num_moe_layers * moe_dense
+        routed += num_moe_layers * moe_routed
+
+    logits = arch.hidden_size * arch.vocab_size
+    dense += logits
+    if arch.mtp_num_layers:
+        # Each MTP module projects the concatenated hidden states, runs one
+        # transformer layer of the main model type and its own output logits.
+        mtp_dense, mtp_routed = _layer_macs(arch, seq_length, moe=is_moe)
+        mtp_proj = 2 * arch.hidden_size * arch.hidden_size
+        dense += arch.mtp_num_layers * (mtp_dense + mtp_proj + logits)
+        routed += arch.mtp_num_layers * mtp_routed
+
+    factor = FLOPS_PER_MAC * seq_length
+    return ModelFlops(dense=dense * factor, routed=routed * factor)
+
+
+def layer_parameters(arch: ModelArchitecture, moe: bool):
+    """Returns the (non expert, single expert) parameters of one layer.
+
+    Norms and biases are ignored. The non expert parameters of a MoE layer
+    include the attention, the router and the shared experts.
+    """
+    # Parameters of the attention projections are the MACs at seq 0.
+    attention = _attention_macs(arch, 0)
+    if not moe:
+        return attention + mlp_macs(arch, arch.ffn_hidden_size), 0
+    shared = attention + arch.hidden_size * arch.num_moe_experts
+    if arch.moe_shared_expert_ffn_hidden_size:
+        shared += mlp_macs(arch, arch.moe_shared_expert_ffn_hidden_size)
+    return shared, mlp_macs(arch, arch.moe_ffn_hidden_size)
+
+
+def count_parameters(arch: ModelArchitecture):
+    """Returns the (total, active) number of parameters of a model.
+
+    Norms and biases are ignored. Input and output embeddings are untied.
+    """
+    is_moe = arch.num_moe_experts > 0
+    num_dense_layers = arch.num_dense_layers if is_moe else arch.num_layers
+    num_moe_layers = arch.num_layers - num_dense_layers
+    dense_layer, _ = layer_parameters(arch, moe=False)
+    shared, expert = layer_parameters(arch, moe=True)
+    moe_total = shared + arch.num_moe_experts * expert
+    moe_active = shared + arch.moe_router_topk * expert
+
+    embeddings = 2 * arch.hidden_size * arch.vocab_size
+    total = embeddings + num_dense_layers * dense_layer + num_moe_layers * moe_total
+    active = embeddings + num_dense_layers * dense_layer + num_moe_layers * moe_active
+    return total, active
+
+
+def get_model_flops(model: str, seq_length: Optional[int] = None) -> ModelFlops:
+    """Returns the FLOPs per sample of a known model.
+
+    The analytical model of MODEL_ARCHITECTURES is used when the sequence
+    length is known, otherwise the fixed values of MODEL_FLOPS_PER_SAMPLE. A
+    warning is issued when a sequence length is given for a model with a fixed
+    value only.
+
+    Args:
+        model (str): model name, aliases of MODEL_NAME_ALIASES allowed
+        seq_length (int): sequence length of a sample
+
+    Returns:
+        ModelFlops: dense and routed expert FLOPs per sample
+    """
+    model = MODEL_NAME_ALIASES.get(model, model)
+    if model in MODEL_ARCHITECTURES and seq_length:
+        return compute_model_flops(MODEL_ARCHITECTURES[model], seq_length)
+    if model in MODEL_FLOPS_PER_SAMPLE:
+        if seq_length:
+            warnings.warn(
+                f"{model} has no architecture in MODEL_ARCHITECTURES, the fixed "
+                f"FLOPs per sample are used and the sequence length {seq_length} "
+                "is ignored"
+            )
+        return ModelFlops(dense=MODEL_FLOPS_PER_SAMPLE[model])
+    raise ValueError(
+        f"Unknown model flops for {model}"
+        + (", a sequence length is needed" if model in MODEL_ARCHITECTURES else "")
+    )
@@ -0,0 +1,799 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline planner of Megatron-Bridge parallelism layouts
+
+Enumerates the tensor, pipeline, virtual pipeline, context and expert parallel
+layouts of a MODEL_ARCHITECTURES model, estimates the memory of every pipeline
+stage and the step time analytically, and ranks the layouts fitting in memory
+by predicted step time.
+
+The estimates follow the defaults of the Megatron-Bridge recipes: bf16 weights
+and activations, sequence parallelism with tensor parallelism, the distributed
+optimizer with Adam and the 1F1B or interleaved 1F1B pipeline schedule.
+Communication other than the data parallel gradient reduction is assumed not
+to overlap with compute.
+"""
+
+import dataclasses
+import functools
+import itertools
+from typing import List, Optional, Sequence, Tuple
+
+from src.data_defs import ModelArchitecture, get_accelerator_spec, get_max_tflops
+from src.model_flops import (
+    FLOPS_PER_MAC,
+    compute_model_flops,
+    layer_flops,
+    layer_parameters,
+    mlp_macs,
+)
+
+GB = 1e9
+BF16_BYTES = 2
+# Logits are upcast to fp32 for the cross entropy.
+LOGITS_BYTES = 4
+
+MAX_TENSOR_PARALLEL_SIZE = 8
+MAX_CONTEXT_PARALLEL_SIZE = 8
+DEFAULT_MICRO_BATCH_SIZES = (1, 2, 4)
+DEFAULT_MAX_VIRTUAL_STAGES = 8
+# Bytes of a gradient, fp32 unless gradients are reduced in bf16.
+DEFAULT_GRAD_BYTES = 4
+# Bytes of the optimizer state of a parameter, sharded by the distributed
+# optimizer: fp32 master weights and Adam moments. 8 with the bf16 moments of
+# the precision aware optimizer.
+DEFAULT_OPTIMIZER_BYTES = 12
+# Fraction of the GPU memory left for the model once the CUDA context,
+# communication buffers and allocator fragmentation are accounted for.
+DEFAULT_MEMORY_FRACTION = 0.9
+# Fraction of the peak TFLOPS reached by the transformer layers.
+DEFAULT_COMPUTE_EFFICIENCY = 0.6
+
+# Modules Megatron-Bridge recomputes in the backward pass with
+# --recompute_modules.
+RECOMPUTE_MODULES = ("layernorm", "moe_act", "mla_up_proj", "mlp")
+
+
+@dataclasses.dataclass(frozen=True)
+class NetworkSpec:
+    """Interconnect of a machine family.
+
+    Attributes:
+        nvlink_domain: Number of GPUs connected by NVLink.
+        nvlink_bandwidth: Unidirectional NVLink bandwidth of a GPU in GB/s.
+        scale_out_bandwidth: Unidirectional bandwidth of a GPU to GPUs outside
+            its NVLink domain in GB/s.
+    """
+
+    nvlink_domain: int
+    nvlink_bandwidth: float
+    scale_out_bandwidth: float
+
+
+# GPU network of the machine families, one NIC per GPU.
+MACHINE_NETWORKS = {
+    "a3mega": NetworkSpec(8, 450, 25),
+    "a3ultra": NetworkSpec(8, 450, 50),
+    "a4": NetworkSpec(8, 900, 50),
+    "a4x": NetworkSpec(72, 900, 50),
+    "a4x-max": NetworkSpec(72, 900, 100),
+    # No NVLink: the 8 GPUs of a VM communicate over PCIe Gen5 x16 and share
+    # the 400 Gbps network of the VM.
+    "g4": NetworkSpec(8, 64, 6.25),
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class ClusterSpec:
+    """GPUs a model is planned for.
+
+    Attributes:
+        num_gpus: Number of GPUs.
+        memory_gb: Memory of a GPU in GB.
+        peak_tflops: Peak dense TFLOPS of a GPU for the training precision.
+        network: Interconnect of the GPUs.
+    """
+
+    num_gpus: int
+    memory_gb: float
+    peak_tflops: float
+    network: NetworkSpec
+
+
+def get_cluster_spec(
+    machine_family: str,
+    num_gpus: int,
+    precision: str = "bf16",
+    memory_gb: Optional[float] = None,
+) -> ClusterSpec:
+    """Returns the cluster spec of a machine family.
+
+    Args:
+        machine_family (str): machine family, e.g. "a4"
+        num_gpus (int): number of GPUs
+        precision (str): numeric format of the training
+        memory_gb (float): GPU memory override, in GB
+
+    Returns:
+        ClusterSpec: the cluster spec
+    """
+    if machine_family not in MACHINE_NETWORKS:
+        raise ValueError(
+            f"Unknown network for {machine_family}. "
+            f"Known machine families: {list(MACHINE_NETWORKS.keys())}"
+        )
+    return ClusterSpec(
+        num_gpus=num_gpus,
+        memory_gb=memory_gb or get_accelerator_spec(machine_family).memory_gb,
+        peak_tflops=get_max_tflops(machine_family, precision),
+        network=MACHINE_NETWORKS[machine_family],
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class ParallelLayout:
+    """Parallelism layout of a training run.
+
+    Attributes:
+        tp: Tensor parallel size.
+        pp: Pipeline parallel size.
+        cp: Context parallel size.
+        ep: Expert parallel size.
+        etp: Expert tensor parallel size.
+        vp: Virtual pipeline stages per pipeline rank, None without
+            interleaving.
+        micro_batch_size: Micro batch size.
+        recompute_modules: Modules recomputed in the backward pass.
+    """
+
+    tp: int = 1
+    pp: int = 1
+    cp: int = 1
+    ep: int = 1
+    etp: int = 1
+    vp: Optional[int] = None
+    micro_batch_size: int = 1
+    recompute_modules: Tuple[str, ...] = ()
+
+    def data_parallel_size(self, num_gpus: int) -> int:
+        return num_gpus // (self.tp * self.pp * self.cp)
+
+    def recipe_config(self) -> dict:
+        """Returns the layout as entries of a recipe configuration.
+
+        The keys are arguments of custom_setup_experiment.py in
+        src/utils/experiment_launcher.
+        """
+        config = {
+            "tensor_model_parallel_size": self.tp,
+            "pipeline_model_parallel_size": self.pp,
+            "virtual_pipeline_model_parallel_size": self.vp,
+            "context_parallel_size": self.cp,
+            "expert_model_parallel_size": self.ep,
+            "expert_tensor_parallel_size": self.etp,
+            "micro_batch_size": self.micro_batch_size,
+        }
+        if self.recompute_modules:
+            config["recompute_modules"] = ",".join(self.recompute_modules)
+        return config
+
+    def __str__(self) -> str:
+        return (
+            f"TP{self.tp} PP{self.pp} VP{self.vp or '-'} CP{self.cp} "
+            f"EP{self.ep} ETP{self.etp} MBS{self.micro_batch_size}"
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class PlanEstimate:
+    """Predicted memory and step time of a layout.
+
+    Memory values are those of the pipeline stage using the most memory.
+
+    Attributes:
+        layout: The layout.
+        parameter_memory_gb: bf16 weights and their gradients.
+        optimizer_memory_gb: Master weights and Adam moments.
+        activation_memory_gb: Activations stored for the backward pass.
+        available_memory_gb: Memory of a GPU usable by the model.
+        compute_time: Time of the slowest stage on its microbatches, in s.
+        bubble_time: Pipeline bubble, in s.
+        communication_time: Exposed communication, in s.
+        model_tflops: Model TFLOPs of a step, recomputation excluded.
+        peak_tflops: Peak TFLOPS of the cluster.
+    """
+
+    layout: ParallelLayout
+    parameter_memory_gb: float
+    optimizer_memory_gb: float
+    activation_memory_gb: float
+    available_memory_gb: float
+    compute_time: float
+    bubble_time: float
+    communication_time: float
+    model_tflops: float
+    peak_tflops: float
+
+    @property
+    def memory_gb(self) -> float:
+        return (
+            self.parameter_memory_gb
+            + self.optimizer_memory_gb
+            + self.activation_memory_gb
+        )
+
+    @property
+    def fits(self) -> bool:
+        return self.memory_gb <= self.available_memory_gb
+
+    @property
+    def step_time(self) -> float:
+        return self.compute_time + self.bubble_time + self.communication_time
+
+    @property
+    def mfu(self) -> float:
+        return self.model_tflops / (self.step_time * self.peak_tflops)
+
+    def as_row(self) -> dict:
+        """Returns the estimate as a row of process_training_results tables."""
+        return {
+            "layout": str(self.layout),
+            "recompute": ",".join(self.layout.recompute_modules) or None,
+            "memory_gb": self.memory_gb,
+            "params_gb": self.parameter_memory_gb,
+            "optimizer_gb": self.optimizer_memory_gb,
+            "activations_gb": self.activation_memory_gb,
+            "step_time": self.step_time,
+            "bubble": self.bubble_time,
+            "communication": self.communication_time,
+            "mfu": self.mfu,
+        }
+
+
+def _is_moe(arch: ModelArchitecture) -> bool:
+    return arch.num_moe_experts > 0
+
+
+def _num_dense_layers(arch: ModelArchitecture) -> int:
+    return arch.num_dense_layers if _is_moe(arch) else arch.num_layers
+
+
+def _mla_up_proj_macs(arch: ModelArchitecture) -> int:
+    heads = arch.num_attention_heads
+    qk_dim = arch.qk_head_dim + arch.qk_pos_emb_head_dim
+    q_up = (arch.q_lora_rank or 0) * heads * qk_dim
+    kv_up = arch.kv_lora_rank * heads * (arch.qk_head_dim + arch.v_head_dim)
+    return q_up + kv_up
+
+
+def _recompute_macs(arch: ModelArchitecture, modules: Sequence[str], moe: bool):
+    """Per token forward MACs of one layer recomputed in the backward pass."""
+    macs = 0
+    if "mla_up_proj" in modules:
+        macs += _mla_up_proj_macs(arch)
+    if "mlp" in modules and not moe:
+        macs += mlp_macs(arch, arch.ffn_hidden_size)
+    return macs
+
+
+def recompute_candidates(arch: ModelArchitecture) -> List[Tuple[str, ...]]:
+    """Returns the sets of recompute modules applicable to a model.
+
+    The sets are sorted by recomputed FLOPs, cheapest first, starting with the
+    empty set.
+    """
+    applicable = {
+        "layernorm": True,
+        "moe_act": _is_moe(arch),
+        "mla_up_proj": bool(arch.kv_lora_rank),
+        "mlp": bool(_num_dense_layers(arch)),
+    }
+    modules = [module for module in RECOMPUTE_MODULES if applicable[module]]
+    candidates = [
+        subset
+        for size in range(len(modules) + 1)
+        for subset in itertools.combinations(modules, size)
+    ]
+    num_dense_layers = _num_dense_layers(arch)
+    num_moe_layers = arch.num_layers - num_dense_layers
+    return sorted(
+        candidates,
+        key=lambda subset: (
+            num_dense_layers * _recompute_macs(arch, subset, moe=False)
+            + num_moe_layers * _recompute_macs(arch, subset, moe=True)
+        ),
+    )
+
+
+def _attention_activations(arch: ModelArchitecture, recompute) -> float:
+    h = arch.hidden_size
+    heads = arch.num_attention_heads
+    # Input of the layer norm, then its output unless recomputed.
+    elements = h if "layernorm" in recompute else 2 * h
+    if arch.kv_lora_rank:
+        qk_dim = arch.qk_head_dim + arch.qk_pos_emb_head_dim
+        # Compressed query/key/value and their layer norm outputs.
+        elements += 2 * (arch.q_lora_rank or 0) + 2 * arch.kv_lora_rank
+        elements += arch.qk_pos_emb_head_dim
+        if "mla_up_proj" not in recompute:
+            elements += heads * (2 * qk_dim + arch.v_head_dim)
+        return elements + heads * arch.v_head_dim
+    head_dim = arch.head_dim or h // heads
+    query_groups = arch.num_query_groups or heads
+    elements += (heads + 2 * query_groups) * head_dim
+    return elements + heads * head_dim
+
+
+def _mlp_activations(arch: ModelArchitecture, ffn_hidden_size: int, recompute):
+    """Activations of the projections and activation function of an MLP."""
+    fc1 = (2 if arch.gated_linear_unit else 1) * ffn_hidden_size
+    return fc1 if "moe_act" in recompute else fc1 + ffn_hidden_size
+
+
+def _layer_activations(arch: ModelArchitecture, moe: bool, recompute, etp: int):
+    """Activation elements of one layer stored per token of a GPU.
+
+    With sequence parallelism a tensor parallel rank stores 1 / tp of the
+    tokens of the non expert activations, or all tokens of 1 / tp of the
+    heads, so the elements per local token are those of an unsharded token.
+    Routed tokens are gathered across the expert tensor parallel group.
+    """
+    h = arch.hidden_size
+    elements = _attention_activations(arch, recompute)
+    ln = h if "layernorm" in recompute else 2 * h
+    if not moe:
+        if "mlp" in recompute:
+            return elements + h
+        fc1 = (2 if arch.gated_linear_unit else 1) * arch.ffn_hidden_size
+        return elements + ln + fc1 + arch.ffn_hidden_size
+    # fp32 router probabilities.
+    elements += ln + 2 * arch.num_moe_experts
+    if arch.moe_shared_expert_ffn_hidden_size:
+        elements += _mlp_activations(
+            arch, arch.moe_shared_expert_ffn_hidden_size, recompute
+        )
+    routed = etp * h + _mlp_activations(arch, arch.moe_ffn_hidden_size, recompute)
+    return elements + arch.moe_router_topk * routed
+
+
+def _chunk_layers(num_layers: int, num_chunks: int) -> List[int]:
+    """Splits the layers across pipeline chunks.
+
+    Layers not evenly divisible go to the middle chunks first, the first and
+    last chunks also hold the embedding and the output layer.
+    """
+    base, extra = divmod(num_layers, num_chunks)
+    sizes = [base] * num_chunks
+    order = sorted(range(num_chunks), key=lambda c: (c in (0, num_chunks - 1), c))
+    for chunk in order[:extra]:
+        sizes[chunk] += 1
+    return sizes
+
+
+@functools.lru_cache(maxsize=None)
+def _pipeline_stages(num_layers: int, num_dense_layers: int, pp: int, vp: int):
+    """Returns the (dense, moe) layers of every pipeline rank."""
+    sizes = _chunk_layers(num_layers, pp * vp)
+    starts = list(itertools.accumulate([0] + sizes))
+    stages = []
+    for rank in range(pp):
+        dense = moe = 0
+        for chunk in range(rank, pp * vp, pp):
+            start, end = starts[chunk], starts[chunk] + sizes[chunk]
+            num_dense = max(0, min(end, num_dense_layers) - start)
+            dense += num_dense
+            moe += end - start - num_dense
+        stages.append((dense, moe))
+    return tuple(stages)
+
+
+def _in_flight_chunks(layout: ParallelLayout, rank: int, num_microbatches: int):
+    """Microbatches of a model chunk holding activations on a pipeline rank."""
+    if not layout.vp:
+        return min(num_microbatches, layout.pp - rank)
+    warmup = 2 * (layout.pp - rank - 1) + (layout.vp - 1) * layout.pp
+    return min(num_microbatches * layout.vp, warmup + 1)
+
+
+def _bandwidth(cluster: ClusterSpec, span: int) -> float:
+    """Bandwidth of a group of consecutive GPU ranks, in bytes per second."""
+    network = cluster.network
+    if span <= network.nvlink_domain:
+        return network.nvlink_bandwidth * GB
+    return network.scale_out_bandwidth * GB
+
+
+def estimate_layout(
+    arch: ModelArchitecture,
+    layout: ParallelLayout,
+    cluster: ClusterSpec,
+    global_batch_size: int,
+    seq_length: int,
+    grad_bytes: int = DEFAULT_GRAD_BYTES,
+    optimizer_bytes: int = DEFAULT_OPTIMIZER_BYTES,
+    memory_fraction: float = DEFAULT_MEMORY_FRACTION,
+    compute_efficiency: float = DEFAULT_COMPUTE_EFFICIENCY,
+) -> PlanEstimate:
+    """Estimates the memory and step time of a layout.
+
+    Args:
+        arch (ModelArchitecture): model architecture
+        layout (ParallelLayout): parallelism layout
+        cluster (ClusterSpec): GPUs of the training
+        global_batch_size (int): global batch size
+        seq_length (int): sequence length
+        grad_bytes (int): bytes of a gradient
+        optimizer_bytes (int): bytes of the optimizer state of a parameter
+        memory_fraction (float): fraction of the GPU memory usable by the model
+        compute_efficiency (float): fraction of the peak TFLOPS reached
+
+    Returns:
+        PlanEstimate: the estimate
+
+    Raises:
+        ValueError: if the layout is not valid, see validate_layout
+    """
+    validate_layout(
+        arch,
+        layout,
+        cluster.num_gpus,
+        global_batch_size,
+        seq_length,
+        cluster.network.nvlink_domain,
+    )
+    is_moe = _is_moe(arch)
+    h = arch.hidden_size
+    tp, pp, cp, ep, etp = layout.tp, layout.pp, layout.cp, layout.ep, layout.etp
+    vp = layout.vp or 1
+    num_gpus = cluster.num_gpus
+    dp = layout.data_parallel_size(num_gpus)
+    stage_gpus = num_gpus // pp
+    expert_dp = stage_gpus // (ep * etp)
+    num_microbatches = global_batch_size // (dp * layout.micro_batch_size)
+    # Tokens of a microbatch on one GPU.
+    local_tokens = layout.micro_batch_size * seq_length / (tp * cp)
+    recompute = layout.recompute_modules
+
+    dense_params, _ = layer_parameters(arch, moe=False)
+    moe_params, expert_params = layer_parameters(arch, moe=True)
+    dense_flops = layer_flops(arch, seq_length, moe=False).total
+    moe_flops = layer_flops(arch, seq_length, moe=True).total
+    # Recomputed forward MACs, 2 FLOPs each.
+    dense_flops += 2 * seq_length * _recompute_macs(arch, recompute, moe=False)
+    moe_flops += 2 * seq_length * _recompute_macs(arch, recompute, moe=True)
+    activation_bytes = {
+        moe: BF16_BYTES * local_tokens * _layer_activations(arch, moe, recompute, etp)
+        for moe in (False, True)
+    }
+    logits_flops = FLOPS_PER_MAC * seq_length * h * arch.vocab_size
+    mtp_params = moe_params if is_moe else dense_params
+    mtp_flops = moe_flops if is_moe else dense_flops
+    mtp_flops += FLOPS_PER_MAC * seq_length * 2 * h * h + logits_flops
+
+    tp_bandwidth = _bandwidth(cluster, tp)
+    cp_bandwidth = _bandwidth(cluster, tp * cp)
+    ep_bandwidth = _bandwidth(cluster, etp * ep)
+    pp_bandwidth = _bandwidth(cluster, 2 * stage_gpus)
+    dp_bandwidth = _bandwidth(cluster, stage_gpus)
+    if arch.kv_lora_rank:
+        kv_elements = arch.num_attention_heads * (
+            arch.qk_head_dim + arch.qk_pos_emb_head_dim + arch.v_head_dim
+        )
+    else:
+        head_dim = arch.head_dim or h // arch.num_attention_heads
+        kv_elements = 2 * (arch.num_query_groups or arch.num_attention_heads)
+        kv_elements *= head_dim
+    # Sequence parallel all-gathers and reduce-scatters, 4 in the forward and
+    # 4 in the backward pass.
+    tp_time = 8 * BF16_BYTES * local_tokens * h * (tp - 1) / tp_bandwidth
+    # Ring exchange of the keys and values, their gradients in the backward.
+    cp_time = 3 * (cp - 1) * BF16_BYTES * local_tokens * kv_elements / cp_bandwidth
+    # Token dispatch and combine, in the forward and backward passes.
+    ep_time = 4 * BF16_BYTES * local_tokens * arch.moe_router_topk * h
+    ep_time *= (ep - 1) / ep / ep_bandwidth
+    pp_time = 2 * vp * BF16_BYTES * local_tokens * h / pp_bandwidth if pp > 1 else 0
+
+    peak_flops = cluster.peak_tflops * 1e12 * compute_efficiency
+    samples_per_gpu = global_batch_size / (dp * tp * cp)
+    stages = []
+    for rank, (dense, moe) in enumerate(
+        _pipeline_stages(arch.num_layers, _num_dense_layers(arch), pp, vp)
+    ):
+        first, last = rank == 0, rank == pp - 1
+        mtp = arch.mtp_num_layers if last else 0
+        moe_layers = moe + (mtp if is_moe else 0)
+        shared = dense * dense_params + moe * moe_params
+        shared += mtp * (mtp_params + 2 * h * h)
+        shared += (int(first) + int(last)) * h * arch.vocab_size
+        shared /= tp
+        experts = moe_layers * arch.num_moe_experts * expert_params / (ep * etp)
+        parameter_memory = (shared + experts) * (BF16_BYTES + grad_bytes)
+        optimizer_memory = optimizer_bytes * (shared / (dp * cp) + experts / expert_dp)
+
+        layer_bytes = dense * activation_bytes[False]
+        layer_bytes += (moe + mtp) * activation_bytes[is_moe]
+        in_flight = _in_flight_chunks(layout, rank, num_microbatches)
+        activation_memory = in_flight * layer_bytes / vp
+        if last:
+            logits = LOGITS_BYTES * local_tokens * arch.vocab_size
+            activation_memory += (1 + mtp) * logits
+
+        flops = dense * dense_flops + moe * moe_flops
+        if last:
+            flops += logits_flops + mtp * mtp_flops
+        compute_time = flops * samples_per_gpu / peak_flops
+        communication_time = num_microbatches * (
+            (dense + moe + mtp) * (tp_time + cp_time) + moe_layers * ep_time + pp_time
+        )
+        # Gradient reduce-scatter and parameter all-gather, overlapped with
+        # the compute of the step.
+        dp_bytes = (grad_bytes + BF16_BYTES) / dp_bandwidth
+        dp_time = shared * dp_bytes * (dp * cp - 1) / (dp * cp)
+        dp_time += experts * dp_bytes * (expert_dp - 1) / expert_dp
+        communication_time += max(0, dp_time - compute_time)
+        stages.append(
+            (
+                parameter_memory / GB,
+                optimizer_memory / GB,
+                activation_memory / GB,
+                compute_time,
+                communication_time,
+            )
+        )
+
+    parameter_gb, optimizer_gb, activation_gb, _, _ = max(
+        stages, key=lambda stage: sum(stage[:3])
+    )
+    _, _, _, compute_time, communication_time = max(
+        stages, key=lambda stage: sum(stage[3:])
+    )
+    bubble_time = (compute_time + communication_time) * (pp - 1)
+    bubble_time /= vp * num_microbatches
+    model_flops = compute_model_flops(arch, seq_length).total * global_batch_size
+    return PlanEstimate(
+        layout=layout,
+        parameter_memory_gb=parameter_gb,
+        optimizer_memory_gb=optimizer_gb,
+        activation_memory_gb=activation_gb,
+        available_memory_gb=cluster.memory_gb * memory_fraction,
+        compute_time=compute_time,
+        bubble_time=bubble_time,
+        communication_time=communication_time,
+        model_tflops=model_flops / 1e12,
+        peak_tflops=cluster.peak_tflops * num_gpus,
+    )
+
+
+def _powers_of_two(limit: int) -> List[int]:
+    return [2**i for i in range(limit.bit_length()) if 2**i <= limit]
+
+
+def _divisors(n: int) -> List[int]:
+    return [d for d in range(1, n + 1) if n % d == 0]
+
+
+def _is_power_of_two(n: int) -> bool:
+    return n > 0 and n & (n - 1) == 0
+
+
+def _layout_error(
+    arch: ModelArchitecture,
+    layout: ParallelLayout,
+    num_gpus: int,
+    global_batch_size: int,
+    seq_length: int,
+    nvlink_domain: int,
+) -> Optional[str]:
+    """Returns why a layout is invalid, None if it is valid."""
+    tp, pp, cp, ep, etp, vp = (
+        layout.tp,
+        layout.pp,
+        layout.cp,
+        layout.ep,
+        layout.etp,
+        layout.vp,
+    )
+    if min(tp, pp, cp, ep, etp, layout.micro_batch_size) < 1:
+        return "parallel sizes and the micro batch size must be positive"
+    heads = arch.num_attention_heads
+    query_groups = arch.num_query_groups or heads
+    if not _is_power_of_two(tp) or tp > min(MAX_TENSOR_PARALLEL_SIZE, nvlink_domain):
+        return (
+            f"TP{tp} must be a power of two of at most "
+            f"{min(MAX_TENSOR_PARALLEL_SIZE, nvlink_domain)}, within NVLink"
+        )
+    if heads % tp or query_groups % tp or seq_length % tp:
+        return f"TP{tp} must divide the heads, query groups and sequence length"
+    if not _is_power_of_two(cp) or cp > MAX_CONTEXT_PARALLEL_SIZE:
+        return f"CP{cp} must be a power of two of at most {MAX_CONTEXT_PARALLEL_SIZE}"
+    if cp > 1 and seq_length % (2 * cp * tp):
+        return f"the sequence length must be a multiple of 2 x CP{cp} x TP{tp}"
+    if num_gpus % (tp * cp * pp):
+        return f"TP{tp} x CP{cp} x PP{pp} must divide {num_gpus} GPUs"
+    if pp > arch.num_layers:
+        return f"PP{pp} is larger than the {arch.num_layers} layers"
+    if vp is not None and (pp == 1 or vp < 2 or pp * vp > arch.num_layers):
+        return (
+            f"VP{vp} needs PP > 1, at least 2 virtual stages and at most "
+            f"{arch.num_layers} layers over PP x VP"
+        )
+    dp = num_gpus // (tp * cp * pp)
+    if _is_moe(arch):
+        if arch.num_moe_experts % ep:
+            return f"EP{ep} must divide the {arch.num_moe_experts} experts"
+        if etp not in (1, tp):
+            return f"ETP{etp} must be 1 or TP{tp}"
+        if (tp * cp * dp) % (ep * etp):
+            return f"EP{ep} x ETP{etp} must divide the {tp * cp * dp} GPUs of a stage"
+    elif ep != 1 or etp != 1:
+        return "EP and ETP must be 1 without experts"
+    if global_batch_size % (dp * layout.micro_batch_size):
+        return (
+            f"the global batch size {global_batch_size} must be a multiple of "
+            f"DP{dp} x MBS{layout.micro_batch_size}"
+        )
+    # The interleaved schedule runs groups of pp microbatches.
+    if vp is not None and (global_batch_size // (dp * layout.micro_batch_size)) % pp:
+        return f"the number of microbatches must be a multiple of PP{pp} with VP"
+    unknown = set(layout.recompute_modules) - set(RECOMPUTE_MODULES)
+    if unknown:
+        return f"unknown recompute modules {sorted(unknown)}"
+    return None
+
+
+def validate_layout(
+    arch: ModelArchitecture,
+    layout: ParallelLayout,
+    num_gpus: int,
+    global_batch_size: int,
+    seq_length: int,
+    nvlink_domain: int,
+):
+    """Raises a ValueError if a layout is not one enumerate_layouts returns.
+
+    Recompute modules aside, the valid layouts are the ones enumerate_layouts
+    returns, for any micro batch size and number of virtual stages.
+    """
+    error = _layout_error(
+        arch, layout, num_gpus, global_batch_size, seq_length, nvlink_domain
+    )
+    if error is not None:
+        raise ValueError(f"Invalid layout {layout}: {error}")
+
+
+def enumerate_layouts(
+    arch: ModelArchitecture,
+    num_gpus: int,
+    global_batch_size: int,
+    seq_length: int,
+    nvlink_domain: int,
+    micro_batch_sizes: Sequence[int] = DEFAULT_MICRO_BATCH_SIZES,
+    max_virtual_stages: int = DEFAULT_MAX_VIRTUAL_STAGES,
+) -> List[ParallelLayout]:
+    """Enumerates the valid layouts of a model, without recomputation.
+
+    Tensor parallelism stays within an NVLink domain and divides the attention
+    heads and query groups. Every pipeline chunk holds at least one layer, the
+    experts are evenly split across the expert parallel ranks and the global
+    batch is a multiple of the micro batch times the data parallel size. The
+    rules are those of validate_layout.
+
+    Args:
+        arch (ModelArchitecture): model architecture
+        num_gpus (int): number of GPUs
+        global_batch_size (int): global batch size
+        seq_length (int): sequence length
+        nvlink_domain (int): number of GPUs connected by NVLink
+        micro_batch_sizes (Sequence[int]): micro batch sizes to consider
+        max_virtual_stages (int): maximum virtual pipeline stages per rank
+
+    Returns:
+        List[ParallelLayout]: the layouts
+    """
+    tensor_sizes = _powers_of_two(min(MAX_TENSOR_PARALLEL_SIZE, nvlink_domain))
+    expert_sizes = [1]
+    if _is_moe(arch):
+        expert_sizes = _divisors(arch.num_moe_experts)
+    layouts = []
+    for tp, cp, pp, mbs, vp, etp, ep in itertools.product(
+        tensor_sizes,
+        _powers_of_two(MAX_CONTEXT_PARALLEL_SIZE),
+        _divisors(num_gpus),
+        micro_batch_sizes,
+        [None] + list(range(2, max_virtual_stages + 1)),
+        tensor_sizes,
+        expert_sizes,
+    ):
+        if etp not in (1, tp) or (etp > 1 and not _is_moe(arch)):
+            continue
+        layout = ParallelLayout(
+            tp=tp, pp=pp, cp=cp, ep=ep, etp=etp, vp=vp, micro_batch_size=mbs
+        )
+        if (
+            _layout_error(
+                arch, layout, num_gpus, global_batch_size, seq_length, nvlink_domain
+            )
+            is None
+        ):
+            layouts.append(layout)
+    return layouts
+
+
+def plan_layouts(
+    arch: ModelArchitecture,
+    cluster: ClusterSpec,
+    global_batch_size: int,
+    seq_length: int,
+    micro_batch_sizes: Sequence[int] = DEFAULT_MICRO_BATCH_SIZES,
+    max_virtual_stages: int = DEFAULT_MAX_VIRTUAL_STAGES,
+    grad_bytes: int = DEFAULT_GRAD_BYTES,
+    optimizer_bytes: int = DEFAULT_OPTIMIZER_BYTES,
+    memory_fraction: float = DEFAULT_MEMORY_FRACTION,
+    compute_efficiency: float = DEFAULT_COMPUTE_EFFICIENCY,
+) -> List[PlanEstimate]:
+    """Ranks the layouts of a model fitting in memory by predicted step time.
+
+    Every layout uses the cheapest set of recompute modules fitting in memory.
+
+    Args:
+        arch (ModelArchitecture): model architecture
+        cluster (ClusterSpec): GPUs of the training
+        global_batch_size (int): global batch size
+        seq_length (int): sequence length
+        micro_batch_sizes (Sequence[int]): micro batch sizes to consider
+        max_virtual_stages (int): maximum virtual pipeline stages per rank
+        grad_bytes (int): bytes of a gradient
+        optimizer_bytes (int): bytes of the optimizer state of a parameter
+        memory_fraction (float): fraction of the GPU memory usable by the model
+        compute_efficiency (float): fraction of the peak TFLOPS reached
+
+    Returns:
+        List[PlanEstimate]: estimates of the layouts fitting in memory, fastest
+            first, ties broken by memory
+    """
+    estimate = functools.partial(
+        estimate_layout,
+        arch,
+        cluster=cluster,
+        global_batch_size=global_batch_size,
+        seq_length=seq_length,
+        grad_bytes=grad_bytes,
+        optimizer_bytes=optimizer_bytes,
+        memory_fraction=memory_fraction,
+        compute_efficiency=compute_efficiency,
+    )
+    candidates = recompute_candidates(arch)
+    # Union of the recompute modules, the set using the least memory.
+    all_modules = max(candidates, key=len)
+    plans = []
+    for layout in enumerate_layouts(
+        arch,
+        cluster.num_gpus,
+        global_batch_size,
+        seq_length,
+        cluster.network.nvlink_domain,
+        micro_batch_sizes=micro_batch_sizes,
+        max_virtual_stages=max_virtual_stages,
+    ):
+        if not estimate(
+            dataclasses.replace(layout, recompute_modules=all_modules)
+        ).fits:
+            continue
+        for modules in candidates:
+            plan = estimate(dataclasses.replace(layout, recompute_modules=modules))
+            if plan.fits:
+                plans.append(plan)
+                break
+    return sorted(plans, key=lambda plan: (plan.step_time, plan.memory_gb))
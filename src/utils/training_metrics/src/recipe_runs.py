@@ -0,0 +1,159 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Discovery of training runs laid out like the recipes in training/"""
+
+import dataclasses
+import os
+import re
+from typing import List, Optional
+
+from src.data_defs import MACHINE_FAMILIES, PRECISIONS, resolve_precision
+
+DLLOGGER_FILE_PATTERN = re.compile(r".*dllogger.*\.json$")
+
+# Recipe directories look like 64gpus-fp8mx-gbs256 or
+# 256gpus-bf16-seq4096-gbs2048. The precision, seq and gbs parts are optional.
+RECIPE_DIR_PATTERN = re.compile(r"^(?P<num_accelerators>\d+)gpus?(-|$)")
+SEQ_LENGTH_PATTERN = re.compile(r"^seq(\d+)$")
+GLOBAL_BATCH_SIZE_PATTERN = re.compile(r"^gbs(\d+)$")
+
+# Model directory names used in training/, normalized with _normalize_model,
+# mapped to the keys of MODEL_FLOPS_PER_SAMPLE.
+MODEL_ALIASES = {
+    "gpt3-175b": "gpt3-175b",
+    "llama3-70b": "llama3-70b",
+    "llama3-8b": "llama3.1-8b",
+    "llama3-1-8b": "llama3.1-8b",
+    "llama31-8b": "llama3.1-8b",
+    "llama3-1-70b": "llama3.1-70b",
+    "llama31-70b": "llama3.1-70b",
+    "llama3-1-405b": "llama3.1-405b",
+    "llama31-405b": "llama3.1-405b",
+    "mixtral-8x7b": "mixtral-8x7b",
+}
+
+
+@dataclasses.dataclass
+class RecipeRun:
+    """A single training run and the configuration inferred from its path.
+
+    Attributes:
+        file: path to the DLLogger file of the run
+        recipe: recipe key, the path of the run relative to the results root
+        machine_family: machine family, e.g. a4x
+        model: model name, a MODEL_FLOPS_PER_SAMPLE key when known
+        framework: framework directory following the model, e.g. nemo-gke
+        num_accelerators: number of GPUs used by the run
+        precision: numeric format, e.g. fp8mx
+        global_batch_size: global batch size
+        seq_length: sequence length, if encoded in the recipe name
+    """
+
+    file: str
+    recipe: str
+    machine_family: Optional[str] = None
+    model: Optional[str] = None
+    framework: Optional[str] = None
+    num_accelerators: Optional[int] = None
+    precision: Optional[str] = None
+    global_batch_size: Optional[int] = None
+    seq_length: Optional[int] = None
+
+
+def _normalize_model(name: str) -> str:
+    normalized = name.lower().replace("_", "-")
+    return MODEL_ALIASES.get(normalized, normalized)
+
+
+def parse_recipe_dir(name: str) -> dict:
+    """Parses a recipe directory name such as 256gpus-bf16-seq4096-gbs2048.
+
+    Args:
+        name (str): recipe directory name
+
+    Returns:
+        dict: num_accelerators, precision, seq_length and global_batch_size
+            found in the name. Missing parts are not included. Precision
+            aliases such as fp8ds are resolved to their canonical format.
+    """
+    match = RECIPE_DIR_PATTERN.match(name)
+    if not match:
+        return {}
+    result = {"num_accelerators": int(match.group("num_accelerators"))}
+    for part in name.split("-")[1:]:
+        if part in PRECISIONS:
+            result["precision"] = resolve_precision(part)
+        elif SEQ_LENGTH_PATTERN.match(part):
+            result["seq_length"] = int(SEQ_LENGTH_PATTERN.match(part).group(1))
+        elif GLOBAL_BATCH_SIZE_PATTERN.match(part):
+            result["global_batch_size"] = int(
+                GLOBAL_BATCH_SIZE_PATTERN.match(part).group(1)
+            )
+    return result
+
+
+def parse_recipe_path(file: str, root: str) -> RecipeRun:
+    """Infers the run configuration from the path of a DLLogger file.
+
+    The path is expected to follow the training/ layout, e.g.
+    <root>/a4x/llama3_70b/nemo-gke/nemo2602/64gpus-fp8mx-gbs256/dllogger.json.
+    The model is the directory following the machine family, the framework the
+    one following the model unless it is a recipe directory, and the recipe
+    directory is the deepest directory matching RECIPE_DIR_PATTERN.
+
+    Args:
+        file (str): path to the DLLogger file
+        root (str): root of the results tree
+
+    Returns:
+        RecipeRun: the run with every field that could be inferred
+    """
+    relative_dir = os.path.relpath(os.path.dirname(file), root)
+    parts = [] if relative_dir == os.curdir else relative_dir.split(os.sep)
+    run = RecipeRun(file=file, recipe=relative_dir)
+
+    for i, part in enumerate(parts):
+        if part in MACHINE_FAMILIES and run.machine_family is None:
+            run.machine_family = part
+            if i + 1 < len(parts):
+                run.model = _normalize_model(parts[i + 1])
+            if i + 2 < len(parts) and not parse_recipe_dir(parts[i + 2]):
+                run.framework = parts[i + 2]
+
+    for part in reversed(parts):
+        recipe_config = parse_recipe_dir(part)
+        if recipe_config:
+            for key, value in recipe_config.items():
+                setattr(run, key, value)
+            break
+
+    return run
+
+
+def find_recipe_runs(root: str) -> List[RecipeRun]:
+    """Walks a results tree and returns every run with a DLLogger file.
+
+    Args:
+        root (str): root of the results tree
+
+    Returns:
+        List[RecipeRun]: runs sorted by recipe key
+    """
+    runs = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if DLLOGGER_FILE_PATTERN.match(filename):
+                runs.append(parse_recipe_path(os.path.join(dirpath, filename), root))
+    return sorted(runs, key=lambda run: (run.recipe, run.file))
@@ -89,6 +89,29 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "h100",
+  "model_family_name": "deepseek",
+  "model_recipe_name": "deepseek_v3",
+  "gpus_per_node": 8,
+  "num_gpus": 256,
+  "compute_dtype": "bf16",
+  "seq_length": 4096,
+  "global_batch_size": 2048,
+  "micro_batch_size": 1,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 16,
+  "expert_model_parallel_size": 8,
+  "expert_tensor_parallel_size": 1,
+  "context_parallel_size": 1,
+  "virtual_pipeline_model_parallel_size": null,
+  "recompute_modules": "mla_up_proj",
+  "moe_a2a_overlap": "False",
+  "max_steps": 30
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -113,24 +136,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu h100 \
-    --model_family_name deepseek \
-    --model_recipe_name deepseek_v3 \
-    --gpus_per_node 8 \
-    --num_gpus 256 \
-    --compute_dtype bf16 \
-    --seq_length 4096 \
-    --global_batch_size 2048 \
-    --micro_batch_size 1 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 16 \
-    --expert_model_parallel_size 8 \
-    --expert_tensor_parallel_size 1 \
-    --context_parallel_size 1 \
-    --virtual_pipeline_model_parallel_size None \
-    --recompute_modules mla_up_proj \
-    --moe_a2a_overlap False \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
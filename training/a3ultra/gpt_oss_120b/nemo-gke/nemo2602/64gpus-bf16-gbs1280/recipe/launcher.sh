@@ -89,6 +89,27 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "model_family_name": "gpt_oss",
+  "model_recipe_name": "gpt_oss_120b",
+  "config_variant": "v2",
+  "gpu": "h100",
+  "num_gpus": 64,
+  "gpus_per_node": 8,
+  "compute_dtype": "bf16",
+  "seq_length": 4096,
+  "global_batch_size": 1280,
+  "micro_batch_size": 1,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 4,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 8,
+  "expert_tensor_parallel_size": 1,
+  "recompute_modules": "layernorm,moe_act"
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -113,22 +134,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --model_family_name gpt_oss \
-    --model_recipe_name gpt_oss_120b \
-    --config_variant v2 \
-    --gpu h100 \
-    --num_gpus 64 \
-    --gpus_per_node 8 \
-    --compute_dtype bf16 \
-    --seq_length 4096 \
-    --global_batch_size 1280 \
-    --micro_batch_size 1 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 4 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 8 \
-    --expert_tensor_parallel_size 1 \
-    --recompute_modules layernorm,moe_act
+    --recipe_config scripts/performance/recipe_config.json
     --max_steps 30
 
 EOM
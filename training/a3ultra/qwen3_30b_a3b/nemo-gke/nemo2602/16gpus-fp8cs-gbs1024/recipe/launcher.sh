@@ -89,6 +89,29 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "model_family_name": "qwen",
+  "model_recipe_name": "qwen3_30b_a3b",
+  "config_variant": "v1",
+  "gpu": "h100",
+  "num_gpus": 16,
+  "gpus_per_node": 8,
+  "compute_dtype": "fp8_cs",
+  "seq_length": 4096,
+  "global_batch_size": 1024,
+  "micro_batch_size": 4,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 2,
+  "virtual_pipeline_model_parallel_size": 12,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 8,
+  "expert_tensor_parallel_size": 1,
+  "moe_a2a_overlap": "True",
+  "max_steps": 30
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -113,24 +136,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --model_family_name qwen \
-    --model_recipe_name qwen3_30b_a3b \
-    --config_variant v1 \
-    --gpu h100 \
-    --num_gpus 16 \
-    --gpus_per_node 8 \
-    --compute_dtype fp8_cs \
-    --seq_length 4096 \
-    --global_batch_size 1024 \
-    --micro_batch_size 4 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 2 \
-    --virtual_pipeline_model_parallel_size 12 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 8 \
-    --expert_tensor_parallel_size 1 \
-    --moe_a2a_overlap True \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
@@ -83,6 +83,29 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "b200",
+  "model_family_name": "deepseek",
+  "model_recipe_name": "deepseek_v3",
+  "gpus_per_node": 8,
+  "num_gpus": 256,
+  "global_batch_size": 2048,
+  "micro_batch_size": 1,
+  "seq_length": 4096,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 16,
+  "context_parallel_size": 1,
+  "virtual_pipeline_model_parallel_size": null,
+  "expert_model_parallel_size": 8,
+  "compute_dtype": "bf16",
+  "max_steps": 30,
+  "launcher_options": {
+    "experiment_name": "{model_recipe_name}_{model_family_name}"
+  }
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -107,21 +130,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu b200 \
-    --model_family_name deepseek \
-    --model_recipe_name deepseek_v3 \
-    --gpus_per_node 8 \
-    --num_gpus 256 \
-    --global_batch_size 2048 \
-    --micro_batch_size 1 \
-    --seq_length 4096 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 16 \
-    --context_parallel_size 1 \
-    --virtual_pipeline_model_parallel_size None \
-    --expert_model_parallel_size 8 \
-    --compute_dtype bf16 \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 EOM
 )
 
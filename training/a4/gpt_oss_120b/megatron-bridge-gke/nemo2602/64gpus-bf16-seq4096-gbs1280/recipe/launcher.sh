@@ -84,6 +84,27 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "b200",
+  "model_family_name": "gpt_oss",
+  "model_recipe_name": "gpt_oss_120b",
+  "gpus_per_node": 8,
+  "num_gpus": 64,
+  "seq_length": 4096,
+  "compute_dtype": "bf16",
+  "global_batch_size": 1280,
+  "micro_batch_size": 4,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 1,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 64,
+  "cuda_graph_impl": "transformer_engine",
+  "cuda_graph_scope": "moe_router,moe_preprocess,attn",
+  "max_steps": 30
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -108,22 +129,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu b200 \
-    --model_family_name gpt_oss \
-    --model_recipe_name gpt_oss_120b \
-    --gpus_per_node 8 \
-    --num_gpus 64 \
-    --seq_length 4096 \
-    --compute_dtype bf16 \
-    --global_batch_size 1280 \
-    --micro_batch_size 4 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 1 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 64 \
-    --cuda_graph_impl transformer_engine \
-    --cuda_graph_scope moe_router,moe_preprocess,attn \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
@@ -84,6 +84,22 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "b200",
+  "model_family_name": "llama",
+  "model_recipe_name": "llama3_8b",
+  "gpus_per_node": 8,
+  "num_gpus": 8,
+  "micro_batch_size": 2,
+  "global_batch_size": 128,
+  "compute_dtype": "fp8_cs",
+  "cuda_graph_impl": "local",
+  "cuda_graph_scope": "full_iteration",
+  "max_steps": 30
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -108,17 +124,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu b200 \
-    --model_family_name llama \
-    --model_recipe_name llama3_8b \
-    --gpus_per_node 8 \
-    --num_gpus 8 \
-    --micro_batch_size 2 \
-    --global_batch_size 128 \
-    --compute_dtype fp8_cs \
-    --cuda_graph_impl local \
-    --cuda_graph_scope full_iteration \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
@@ -87,6 +87,27 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "b200",
+  "model_family_name": "llama",
+  "model_recipe_name": "llama31_405b",
+  "gpus_per_node": 8,
+  "num_gpus": 256,
+  "seq_length": 8192,
+  "tensor_model_parallel_size": 8,
+  "pipeline_model_parallel_size": 32,
+  "context_parallel_size": 1,
+  "virtual_pipeline_model_parallel_size": 2,
+  "expert_tensor_parallel_size": 1,
+  "global_batch_size": 256,
+  "micro_batch_size": 1,
+  "compute_dtype": "fp8_cs",
+  "cuda_graph_impl": "none",
+  "max_steps": 30
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -111,22 +132,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu b200 \
-    --model_family_name llama \
-    --model_recipe_name llama31_405b \
-    --gpus_per_node 8 \
-    --num_gpus 256 \
-    --seq_length 8192 \
-    --tensor_model_parallel_size 8 \
-    --pipeline_model_parallel_size 32 \
-    --context_parallel_size 1 \
-    --virtual_pipeline_model_parallel_size 2 \
-    --expert_tensor_parallel_size 1 \
-    --global_batch_size 256 \
-    --micro_batch_size 1 \
-    --compute_dtype fp8_cs \
-    --cuda_graph_impl none \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
@@ -51,6 +51,11 @@ export NVTE_UB_SOCKET_IFNAME="eth1"
 export NUM_TRAIN_EPOCHS=1
 export PER_DEVICE_TRAIN_BATCH_SIZE=8
 export GRADIENT_ACCUMULATION_STEPS=2
+# Opt-in optimizations, see README.md. The dataset cache must be on a mounted
+# volume, /tmp is lost with the pod and counts against its ephemeral storage.
+# export DATASET_CACHE_DIR=/job-logs/paligemma2_dataset_cache
+# export GROUP_BY_LENGTH=1
+# export IMAGE_TRANSFORM_ON_DEVICE=1
 
 chmod +x /app/train.sh
 
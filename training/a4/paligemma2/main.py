@@ -16,10 +16,29 @@
 # Reference: https://huggingface.co/blog/paligemma2.
 """Fine-tunes a PaliGemma model on a given dataset."""
 
+import concurrent.futures
+import dataclasses
+import datetime
+import glob
+import hashlib
+import inspect
+import json
+import math
 import os
+import shutil
+import time
+import zlib
 import datasets
+import datasets.distributed
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import safetensors.torch
 import torch
 import transformers
+from accelerate.utils import send_to_device
+from huggingface_hub import split_torch_state_dict_into_shards
+from typing import Optional
 
 load_dataset = datasets.load_dataset
 TrainingArguments = transformers.TrainingArguments
@@ -27,76 +46,1285 @@ Trainer = transformers.Trainer
 PaliGemmaProcessor = transformers.PaliGemmaProcessor
 PaliGemmaForConditionalGeneration = transformers.PaliGemmaForConditionalGeneration
 
-num_train_epochs = int(os.getenv("NUM_TRAIN_EPOCHS", "3"))
-per_device_train_batch_size = int(os.getenv("PER_DEVICE_TRAIN_BATCH_SIZE", "96"))
-gradient_accumulation_steps = int(os.getenv("GRADIENT_ACCUMULATION_STEPS", "4"))
-learning_rate = float(os.getenv("LEARNING_RATE", "2e-5"))
-warmup_steps = int(os.getenv("WARMUP_STEPS", "2"))
-weight_decay = float(os.getenv("WEIGHT_DECAY", "1e-6"))
-adam_beta2 = float(os.getenv("ADAM_BETA2", "0.999"))
-logging_steps = int(os.getenv("LOGGING_STEPS", "100"))
-save_steps = int(os.getenv("SAVE_STEPS", "1000"))
-save_total_limit = int(os.getenv("SAVE_TOTAL_LIMIT", "1"))
 
-dataset_path = os.getenv("DATASET_PATH", "merve/vqav2-small")
-dataloader_num_workers = int(os.getenv("DATALOADER_NUM_WORKERS", "16"))
+@dataclasses.dataclass
+class RecipeConfig:
+    """Configuration of the recipe.
 
-model_id = os.getenv("MODEL_ID", "google/paligemma2-3b-pt-224")
+    from_env reads every field from the environment variable of its upper
+    case name, e.g. NUM_TRAIN_EPOCHS, over the JSON file of field values
+    named by RECIPE_CONFIG, over the defaults below.
+    """
 
+    num_train_epochs: int = 3
+    per_device_train_batch_size: int = 96
+    gradient_accumulation_steps: int = 4
+    # Samples per optimizer step of all the processes. When positive, the
+    # gradient accumulation steps are derived from it and the micro batch.
+    global_batch_size: int = 0
+    # Pick the micro batch size of the highest throughput that fits in memory
+    # among the divisors of global_batch_size over the number of processes.
+    autotune: bool = False
+    autotune_steps: int = 3
+    max_micro_batch_size: int = 0
+    learning_rate: float = 2e-5
+    warmup_steps: int = 2
+    weight_decay: float = 1e-6
+    adam_beta2: float = 0.999
+    logging_steps: int = 100
+    # Checkpoints are not saved when not positive.
+    save_steps: int = 1000
+    save_total_limit: int = 1
+    # Save the model in a background thread instead of the Trainer save.
+    async_checkpoint: bool = False
+    max_shard_size: str = "5GB"
 
-print(f"[INFO] Loading {dataset_path} dataset")
-ds = load_dataset(dataset_path, split="validation")
-ds = ds.train_test_split(test_size=0.01)["train"]
+    # A Hugging Face Hub dataset, or a local Parquet file or directory such as
+    # the output directory of the Waymo data processor.
+    dataset_path: str = "merve/vqav2-small"
+    # Stream the dataset shards instead of loading the whole dataset first.
+    dataset_streaming: bool = False
+    shuffle_buffer_size: int = 1000
+    # Number of optimizer steps, computed from the dataset size when not
+    # positive.
+    max_steps: int = -1
+    dataloader_num_workers: int = 16
+    # Directory of the pre-processed dataset cache, disabled when empty.
+    dataset_cache_dir: str = ""
+    # Defaults to dataloader_num_workers.
+    preprocess_num_proc: Optional[int] = None
+    # Only build the dataset cache, without training.
+    preprocess_only: bool = False
+    # Resize and normalize the images on the accelerator instead of the host.
+    image_transform_on_device: bool = False
+    dataloader_pin_memory: bool = True
+    # Pack the examples of every batch into rows of up to this many tokens,
+    # disabled when 0.
+    packed_sequence_length: int = 0
+    # Draw batches from examples of similar token length to reduce padding.
+    group_by_length: bool = False
+    output_dir: str = "out_paligemma"
+    # DLLogger file of the per step metrics, read by
+    # src/utils/training_metrics. Defaults to dllogger.json in ARTIFACT_DIR, or
+    # in output_dir.
+    metrics_log_file: Optional[str] = None
 
-processor = PaliGemmaProcessor.from_pretrained(model_id)
+    model_id: str = "google/paligemma2-3b-pt-224"
 
+    def __post_init__(self):
+        if self.preprocess_num_proc is None:
+            self.preprocess_num_proc = self.dataloader_num_workers
+        if self.metrics_log_file is None:
+            self.metrics_log_file = os.path.join(
+                os.getenv("ARTIFACT_DIR") or self.output_dir, "dllogger.json"
+            )
 
-def collate_fn(examples):
-    """Collate function for the dataset."""
-    texts = ["<image>answer en " + example["question"] for example in examples]
-    labels = [example["multiple_choice_answer"] for example in examples]
-    images = [example["image"].convert("RGB") for example in examples]
+    @classmethod
+    def from_env(cls, environ=None):
+        """Returns the config of the environment, os.environ by default."""
+        environ = os.environ if environ is None else environ
+        values = {}
+        if environ.get("RECIPE_CONFIG"):
+            with open(environ["RECIPE_CONFIG"], "r", encoding="utf-8") as f:
+                values = json.load(f)
+            fields = {field.name: field for field in dataclasses.fields(cls)}
+            unknown = set(values) - set(fields)
+            if unknown:
+                raise ValueError(f"Unknown config fields: {sorted(unknown)}")
+            for name, value in values.items():
+                values[name] = _check_config_value(name, value, fields[name].type)
+        for field in dataclasses.fields(cls):
+            value = environ.get(field.name.upper())
+            if value is not None:
+                try:
+                    values[field.name] = _parse_env_value(value, field.type)
+                except ValueError as e:
+                    raise ValueError(f"{field.name.upper()}: {e}") from e
+        return cls(**values)
+
+    def resolve_batch_size(self, world_size, micro_batch_size=None):
+        """Sets the micro batch and the gradient accumulation steps matching
+        global_batch_size, when set, on world_size processes."""
+        if micro_batch_size:
+            self.per_device_train_batch_size = micro_batch_size
+        if self.global_batch_size <= 0:
+            return
+        samples_per_step = self.per_device_train_batch_size * world_size
+        if self.global_batch_size % samples_per_step:
+            raise ValueError(
+                f"The global batch size {self.global_batch_size} is not a "
+                f"multiple of {self.per_device_train_batch_size} samples on "
+                f"{world_size} processes"
+            )
+        self.gradient_accumulation_steps = self.global_batch_size // samples_per_step
+
+
+TRUE_VALUES = ("1", "true", "t", "yes", "y", "on")
+FALSE_VALUES = ("0", "false", "f", "no", "n", "off", "")
+# Python types of the config fields, str for the other fields.
+FIELD_TYPES = {
+    bool: bool,
+    "bool": bool,
+    int: int,
+    "int": int,
+    Optional[int]: int,
+    "Optional[int]": int,
+    float: float,
+    "float": float,
+}
+OPTIONAL_FIELD_TYPES = (Optional[int], "Optional[int]", Optional[str], "Optional[str]")
+
+
+def _parse_env_value(value, field_type):
+    if field_type in (bool, "bool"):
+        if value.strip().lower() in TRUE_VALUES:
+            return True
+        if value.strip().lower() in FALSE_VALUES:
+            return False
+        raise ValueError(
+            f"invalid boolean {value!r}, expected one of "
+            f"{', '.join(TRUE_VALUES)} or {', '.join(FALSE_VALUES[:-1])}"
+        )
+    if field_type in (int, "int", Optional[int], "Optional[int]"):
+        return int(value)
+    if field_type in (float, "float"):
+        return float(value)
+    return value
+
+
+def _check_config_value(name, value, field_type):
+    """Returns a value of the RECIPE_CONFIG file, raises ValueError when it
+    does not match the type of its field. Integers are accepted as floats."""
+    if value is None and field_type in OPTIONAL_FIELD_TYPES:
+        return value
+    expected = FIELD_TYPES.get(field_type, str)
+    if expected is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, bool) != (expected is bool) or not isinstance(value, expected):
+        raise ValueError(
+            f"Config field {name} must be a {expected.__name__}, got {value!r}"
+        )
+    return value
+
+
+PROMPT_PREFIX = "<image>answer en "
+IMAGE_TOKEN = "<image>"
+PREPROCESS_BATCH_SIZE = 64
+LENGTH_BATCH_SIZE = 1000
+# Bump when the layout of the cached examples changes.
+CACHE_VERSION = 1
+# Fraction of the examples held out of training.
+HOLDOUT_FRACTION = 0.01
+HOLDOUT_BUCKETS = 10000
+# Shard directory and index written by the Waymo data processor.
+SHARD_DIRNAME = "shards"
+SHARD_INDEX_FILENAME = "index.json"
+IMAGE_FEATURE = datasets.Image()
+# torch interpolation modes of the PIL resampling filters of image processors.
+INTERPOLATION_MODES = {0: "nearest", 2: "bilinear", 3: "bicubic"}
+# Checkpoint directories are named like the ones of the Trainer.
+CHECKPOINT_PREFIX = f"{transformers.trainer_utils.PREFIX_CHECKPOINT_DIR}-"
+# Leading arguments of the private PaliGemma _update_causal_mask overridden by
+# enable_packed_attention, with the transformers version pinned in
+# launcher.sh it was tested with.
+CAUSAL_MASK_PARAMETERS = ("attention_mask", "token_type_ids", "inputs_embeds")
+TESTED_TRANSFORMERS_VERSION = "4.46.3"
+# Names of the DLLogger step metrics in the Trainer logs.
+TRAINER_LOG_NAMES = {
+    "train_step_timing in s": "step_time_s",
+    "data_wait_timing in s": "data_wait_time_s",
+    "compute_timing in s": "compute_time_s",
+}
+
+
+def _prompts(questions):
+    return [PROMPT_PREFIX + question for question in questions]
+
+
+def _expanded_prompts(questions, processor):
+    """Returns the prompts with their image token expanded like the processor."""
+    return [
+        prompt.replace(IMAGE_TOKEN, IMAGE_TOKEN * processor.image_seq_length) + "\n"
+        for prompt in _prompts(questions)
+    ]
+
+
+def _rgb_image(image):
+    """Returns an RGB PIL image of a decoded or an undecoded, streamed, image."""
+    if isinstance(image, dict):
+        image = IMAGE_FEATURE.decode_example(image)
+    return image.convert("RGB")
+
+
+def local_parquet_files(path):
+    """Returns the Parquet files of a local dataset, None for a Hub dataset.
+
+    The path is a Parquet file, a directory of shards listed by the
+    index.json of the Waymo data processor, or a directory of Parquet files.
+    The shards of a Waymo data processor output directory are used when
+    present, its per segment files otherwise.
+    """
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        return None
+    for directory in [os.path.join(path, SHARD_DIRNAME), path]:
+        index_file = os.path.join(directory, SHARD_INDEX_FILENAME)
+        if os.path.exists(index_file):
+            with open(index_file, "r", encoding="utf-8") as f:
+                shards = json.load(f)["shards"]
+            return [os.path.join(directory, shard["file"]) for shard in shards]
+    files = sorted(glob.glob(os.path.join(path, "*.parquet")))
+    if not files:
+        raise ValueError(f"No Parquet files found in {path}")
+    return files
+
+
+def load_training_dataset(path, streaming=False):
+    """Loads the validation split of a Hub dataset or a local Parquet dataset.
+
+    Local Parquet files are converted to a memory-mapped Arrow dataset, or
+    read shard by shard as an IterableDataset when streaming.
+    """
+    files = local_parquet_files(path)
+    if files is None:
+        return load_dataset(path, split="validation", streaming=streaming)
+    print(f"[INFO] Loading {len(files)} Parquet files from {path}")
+    return load_dataset("parquet", data_files=files, split="train", streaming=streaming)
+
+
+def dataset_num_rows(path, ds):
+    """Returns the number of examples of a dataset, read from its metadata."""
+    files = local_parquet_files(path)
+    if files is not None:
+        return sum(pq.ParquetFile(file).metadata.num_rows for file in files)
+    if ds.info.splits and "validation" in ds.info.splits:
+        return ds.info.splits["validation"].num_examples
+    raise ValueError(f"Unknown number of examples of {path}, set MAX_STEPS")
+
+
+def is_holdout(example):
+    """Returns whether an example is held out, from a hash of its image.
+
+    Every question about an image lands on the same side of the split.
+    """
+    image = example["image"]
+    key = image["bytes"] or image["path"].encode()
+    return zlib.crc32(key) % HOLDOUT_BUCKETS < HOLDOUT_FRACTION * HOLDOUT_BUCKETS
+
+
+def prepare_streaming_dataset(ds, seed, buffer_size, rank=0, world_size=1):
+    """Holds out, shuffles and splits by process an IterableDataset.
+
+    Images are left undecoded, so the holdout hashes their encoded bytes and
+    the collators decode them in the data loader workers. The shard order is
+    shuffled every epoch and the examples through a buffer of buffer_size
+    examples. Every process reads its own shards when their number is a
+    multiple of world_size, every world_size-th example otherwise.
+    """
+    ds = ds.cast_column("image", datasets.Image(decode=False))
+    ds = ds.filter(lambda example: not is_holdout(example))
+    ds = ds.shuffle(seed=seed, buffer_size=buffer_size)
+    return datasets.distributed.split_dataset_by_node(
+        ds, rank=rank, world_size=world_size
+    )
+
+
+class ProcessorCollator:
+    """Runs the PaliGemma processor on the raw examples of every batch."""
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, examples):
+        texts = _prompts([example["question"] for example in examples])
+        labels = [example["multiple_choice_answer"] for example in examples]
+        images = [_rgb_image(example["image"]) for example in examples]
+        tokens = self.processor(
+            text=texts,
+            images=images,
+            suffix=labels,
+            return_tensors="pt",
+            padding="longest",
+        )
+
+        tokens = tokens.to(torch.bfloat16)
+        return tokens
+
+
+def processor_fingerprint(processor):
+    """Returns a hash of the processor configuration used by the cache."""
+    config = {
+        "image_processor": processor.image_processor.to_dict(),
+        "tokenizer": processor.tokenizer.name_or_path,
+        "vocab_size": len(processor.tokenizer),
+        "image_seq_length": processor.image_seq_length,
+        "prompt_prefix": PROMPT_PREFIX,
+        "cache_version": CACHE_VERSION,
+    }
+    encoded = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def preprocess_batch(batch, processor):
+    """Converts, resizes and tokenizes a batch of raw examples.
+
+    Images are stored resized but neither rescaled nor normalized, as uint8,
+    a quarter of the size of float32 pixel values. Token IDs are stored
+    without padding.
+    """
     tokens = processor(
-        text=texts,
-        images=images,
-        suffix=labels,
+        text=_prompts(batch["question"]),
+        images=[_rgb_image(image) for image in batch["image"]],
+        suffix=batch["multiple_choice_answer"],
         return_tensors="pt",
         padding="longest",
+        do_rescale=False,
+        do_normalize=False,
+    )
+    mask = tokens["attention_mask"].bool()
+    return {
+        "input_ids": [ids[m].tolist() for ids, m in zip(tokens["input_ids"], mask)],
+        "token_type_ids": [
+            types[m].tolist() for types, m in zip(tokens["token_type_ids"], mask)
+        ],
+        "pixel_values": tokens["pixel_values"].round().to(torch.uint8).numpy(),
+    }
+
+
+def build_dataset_cache(ds, processor, cache_dir, num_proc=None):
+    """Pre-processes a dataset once into a memory-mapped Arrow cache.
+
+    The cache is keyed by the dataset fingerprint and the processor
+    configuration, so it is reused by later epochs and runs, and rebuilt when
+    either changes. Returns the cached dataset, formatted as NumPy arrays.
+    """
+    cache_path = os.path.join(
+        cache_dir, f"{ds._fingerprint}-{processor_fingerprint(processor)}"
+    )
+    if not os.path.exists(cache_path):
+        print(f"[INFO] Pre-processing {len(ds)} examples into {cache_path}")
+        size = processor.image_processor.size
+        features = datasets.Features(
+            {
+                "input_ids": datasets.Sequence(datasets.Value("int32")),
+                "token_type_ids": datasets.Sequence(datasets.Value("int8")),
+                "pixel_values": datasets.Array3D(
+                    shape=(3, size["height"], size["width"]), dtype="uint8"
+                ),
+            }
+        )
+        cached = ds.map(
+            preprocess_batch,
+            fn_kwargs={"processor": processor},
+            batched=True,
+            batch_size=PREPROCESS_BATCH_SIZE,
+            remove_columns=ds.column_names,
+            features=features,
+            num_proc=num_proc or None,
+            desc="Pre-processing",
+        )
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        cached.save_to_disk(temp_path)
+        os.replace(temp_path, cache_path)
+    else:
+        print(f"[INFO] Using the pre-processed dataset cache {cache_path}")
+    return datasets.load_from_disk(cache_path).with_format("numpy")
+
+
+class CachedCollator:
+    """Collates examples of build_dataset_cache with padding and indexing only.
+
+    Pads the token IDs like the processor tokenizer and rescales and
+    normalizes the cached uint8 images like the processor image processor.
+    With normalize=False, the uint8 images are left to ImageTransform.
+    """
+
+    def __init__(self, processor, normalize=True):
+        self.normalize = normalize
+        image_processor = processor.image_processor
+        self.rescale_factor = image_processor.rescale_factor
+        self.image_mean = torch.tensor(image_processor.image_mean).view(1, -1, 1, 1)
+        self.image_std = torch.tensor(image_processor.image_std).view(1, -1, 1, 1)
+        self.pad_token_id = processor.tokenizer.pad_token_id
+        self.padding_side = processor.tokenizer.padding_side
+
+    def __call__(self, examples):
+        length = max(len(example["input_ids"]) for example in examples)
+        input_ids = torch.full((len(examples), length), self.pad_token_id)
+        token_type_ids = torch.zeros((len(examples), length), dtype=torch.long)
+        attention_mask = torch.zeros((len(examples), length), dtype=torch.long)
+        for i, example in enumerate(examples):
+            num_tokens = len(example["input_ids"])
+            start = length - num_tokens if self.padding_side == "left" else 0
+            span = slice(start, start + num_tokens)
+            input_ids[i, span] = torch.as_tensor(example["input_ids"])
+            token_type_ids[i, span] = torch.as_tensor(example["token_type_ids"])
+            attention_mask[i, span] = 1
+
+        # The NumPy format of datasets returns integers as int64.
+        pixel_values = torch.as_tensor(
+            np.stack([example["pixel_values"] for example in examples]),
+            dtype=torch.uint8,
+        )
+        if self.normalize:
+            pixel_values = (
+                pixel_values.float() * self.rescale_factor - self.image_mean
+            ) / self.image_std
+
+        tokens = transformers.BatchFeature(
+            {
+                "input_ids": input_ids,
+                "token_type_ids": token_type_ids,
+                "attention_mask": attention_mask,
+                "pixel_values": pixel_values,
+                "labels": input_ids.masked_fill(token_type_ids == 0, -100),
+            }
+        )
+        return tokens.to(torch.bfloat16)
+
+
+class RawImageCollator:
+    """Tokenizes the examples of every batch and leaves their images as uint8.
+
+    Tokens are the ones of the processor. Images are only converted to RGB:
+    the pixel values are a list of uint8 (3, height, width) tensors at the
+    native resolution of every image, resized and normalized on the device by
+    ImageTransform.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, examples):
+        tokens = self.processor.tokenizer(
+            _expanded_prompts(
+                [example["question"] for example in examples], self.processor
+            ),
+            text_pair=[example["multiple_choice_answer"] for example in examples],
+            return_token_type_ids=True,
+            return_tensors="pt",
+            padding="longest",
+        )
+        tokens["labels"] = tokens["input_ids"].masked_fill(
+            tokens["token_type_ids"] == 0, -100
+        )
+        tokens["pixel_values"] = [
+            torch.from_numpy(np.array(_rgb_image(example["image"]))).permute(2, 0, 1)
+            for example in examples
+        ]
+        return transformers.BatchFeature(dict(tokens))
+
+
+class ImageTransform:
+    """Resizes, rescales and normalizes uint8 images like an image processor.
+
+    Runs on the device of the images, a list of (3, height, width) tensors of
+    any resolution or a (batch, 3, height, width) tensor. Resized images are
+    rounded and clipped to uint8 values like the PIL resize of the processor.
+    """
+
+    def __init__(self, image_processor):
+        self.size = (image_processor.size["height"], image_processor.size["width"])
+        self.mode = INTERPOLATION_MODES[int(image_processor.resample)]
+        self.rescale_factor = image_processor.rescale_factor
+        self.image_mean = image_processor.image_mean
+        self.image_std = image_processor.image_std
+
+    def resize(self, images):
+        images = images.float()
+        if tuple(images.shape[-2:]) == self.size:
+            return images
+        images = torch.nn.functional.interpolate(
+            images,
+            size=self.size,
+            mode=self.mode,
+            antialias=self.mode != "nearest",
+        )
+        return images.round().clamp(0, 255)
+
+    def __call__(self, images, dtype=torch.bfloat16):
+        if isinstance(images, torch.Tensor):
+            pixel_values = self.resize(images)
+        else:
+            pixel_values = torch.cat([self.resize(image[None]) for image in images])
+        mean = pixel_values.new_tensor(self.image_mean).view(1, -1, 1, 1)
+        std = pixel_values.new_tensor(self.image_std).view(1, -1, 1, 1)
+        return ((pixel_values * self.rescale_factor - mean) / std).to(dtype)
+
+
+def add_image_transform_hook(model, image_processor):
+    """Transforms uint8 pixel values in a forward pre-hook of the model.
+
+    Float pixel values, already normalized by a collator, are left as is.
+    Returns the handle of the hook.
+    """
+    transform = ImageTransform(image_processor)
+
+    def hook(module, args, kwargs):
+        pixel_values = kwargs.get("pixel_values")
+        if pixel_values is None or (
+            isinstance(pixel_values, torch.Tensor) and pixel_values.is_floating_point()
+        ):
+            return None
+        kwargs["pixel_values"] = transform(pixel_values, dtype=module.dtype)
+        return args, kwargs
+
+    return model.register_forward_pre_hook(hook, with_kwargs=True)
+
+
+def pack_lengths(lengths, max_length):
+    """Bins sequences into rows of at most max_length tokens, first fit
+    decreasing. Returns the indices of the sequences of every row, a sequence
+    longer than max_length gets a row of its own."""
+    rows = []
+    row_lengths = []
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        for row, row_length in enumerate(row_lengths):
+            if row_length + lengths[i] <= max_length:
+                rows[row].append(i)
+                row_lengths[row] += lengths[i]
+                break
+        else:
+            rows.append([i])
+            row_lengths.append(lengths[i])
+    return rows
+
+
+class PackingCollator:
+    """Packs the examples collated by another collator into fewer rows.
+
+    The examples of every batch, without their padding, are concatenated
+    into rows of up to max_length tokens. The attention mask holds the index,
+    from 1, of the example of every token in its row and 0 for padding, the
+    position IDs restart at every example. Models need
+    enable_packed_attention to keep the examples of a row from attending to
+    each other. The images are reordered like the packed examples.
+    """
+
+    def __init__(self, collator, processor, max_length):
+        self.collator = collator
+        self.pad_token_id = processor.tokenizer.pad_token_id
+        self.max_length = max_length
+
+    def __call__(self, examples):
+        batch = self.collator(examples)
+        mask = batch["attention_mask"].bool()
+        lengths = mask.sum(dim=1).tolist()
+        rows = pack_lengths(lengths, self.max_length)
+        length = max(sum(lengths[i] for i in row) for row in rows)
+
+        shape = (len(rows), length)
+        packed = {
+            "input_ids": torch.full(shape, self.pad_token_id),
+            "token_type_ids": torch.zeros(shape, dtype=torch.long),
+            "attention_mask": torch.zeros(shape, dtype=torch.long),
+            "position_ids": torch.ones(shape, dtype=torch.long),
+            "labels": torch.full(shape, -100),
+        }
+        for r, row in enumerate(rows):
+            start = 0
+            for sequence, i in enumerate(row, start=1):
+                span = slice(start, start + lengths[i])
+                for key in ["input_ids", "token_type_ids", "labels"]:
+                    packed[key][r, span] = batch[key][i][mask[i]]
+                packed["attention_mask"][r, span] = sequence
+                # PaliGemma position IDs start at 1.
+                packed["position_ids"][r, span] = torch.arange(1, lengths[i] + 1)
+                start += lengths[i]
+
+        order = [i for row in rows for i in row]
+        pixel_values = batch["pixel_values"]
+        if isinstance(pixel_values, torch.Tensor):
+            packed["pixel_values"] = pixel_values[order]
+        else:
+            packed["pixel_values"] = [pixel_values[i] for i in order]
+        return transformers.BatchFeature(packed)
+
+
+def packed_attention_mask(sequence_ids, token_type_ids, dtype):
+    """Returns the 4D additive attention mask of rows of packed sequences.
+
+    Every token attends to the tokens of its own sequence only, to the whole
+    image and prompt prefix, token type 0, and causally to the suffix.
+    Padding, sequence ID 0, is never attended to.
+    """
+    length = sequence_ids.shape[1]
+    causal = torch.ones(
+        (length, length), dtype=torch.bool, device=sequence_ids.device
+    ).tril()
+    allowed = (
+        (sequence_ids[:, :, None] == sequence_ids[:, None, :])
+        & (sequence_ids != 0)[:, None, :]
+        & (causal | (token_type_ids == 0)[:, None, :])
+    )
+    mask = torch.zeros(allowed.shape, dtype=dtype, device=sequence_ids.device)
+    return mask.masked_fill(~allowed, torch.finfo(dtype).min)[:, None]
+
+
+def enable_packed_attention(model):
+    """Builds the attention mask of a PaliGemma model from packed sequence IDs.
+
+    The 2D attention mask of PackingCollator is still used as is by the loss,
+    only its 4D attention mask is replaced. This overrides the private
+    _update_causal_mask of the model, tested with the transformers version
+    pinned in launcher.sh, TESTED_TRANSFORMERS_VERSION. A ValueError is raised
+    if the installed version does not have it with the expected arguments.
+    """
+    if model.config.text_config._attn_implementation == "flash_attention_2":
+        raise ValueError("Packed sequences need the eager or sdpa attention")
+
+    update_causal_mask = getattr(model, "_update_causal_mask", None)
+    parameters = (
+        list(inspect.signature(update_causal_mask).parameters)
+        if callable(update_causal_mask)
+        else []
+    )
+    if parameters[: len(CAUSAL_MASK_PARAMETERS)] != list(CAUSAL_MASK_PARAMETERS):
+        raise ValueError(
+            f"Packed sequences need {type(model).__name__}._update_causal_mask"
+            f"{CAUSAL_MASK_PARAMETERS}, not found in transformers "
+            f"{transformers.__version__}, tested with {TESTED_TRANSFORMERS_VERSION}"
+        )
+    if transformers.__version__ != TESTED_TRANSFORMERS_VERSION:
+        print(
+            f"[WARNING] Packed sequences are tested with transformers "
+            f"{TESTED_TRANSFORMERS_VERSION}, not {transformers.__version__}"
+        )
+
+    def _update_causal_mask(
+        attention_mask, token_type_ids, inputs_embeds, *args, **kwargs
+    ):
+        if attention_mask is None or attention_mask.dim() != 2:
+            return update_causal_mask(
+                attention_mask, token_type_ids, inputs_embeds, *args, **kwargs
+            )
+        return packed_attention_mask(
+            attention_mask, token_type_ids, inputs_embeds.dtype
+        )
+
+    model._update_causal_mask = _update_causal_mask
+
+
+def example_lengths(ds, processor):
+    """Returns the number of tokens, image tokens included, of every example.
+
+    The lengths of pre-processed examples are read from the Arrow offsets of
+    their token IDs. Raw examples are tokenized like the processor does,
+    without loading their images.
+    """
+    if "input_ids" in ds.column_names:
+        return pc.list_value_length(ds.with_format("arrow")["input_ids"]).to_pylist()
+
+    lengths = []
+    texts = ds.select_columns(["question", "multiple_choice_answer"])
+    for batch in texts.iter(batch_size=LENGTH_BATCH_SIZE):
+        tokens = processor.tokenizer(
+            _expanded_prompts(batch["question"], processor),
+            text_pair=batch["multiple_choice_answer"],
+        )
+        lengths.extend(len(ids) for ids in tokens["input_ids"])
+    return lengths
+
+
+def _dllogger_line(step, data, start_time):
+    """Formats a DLLogger line like the NeMo recipes write them."""
+    now = time.time()
+    entry = {
+        "timestamp": str(now),
+        "datetime": str(datetime.datetime.fromtimestamp(now)),
+        "elapsedtime": str(now - start_time),
+        "type": "LOG",
+        "step": step,
+        "data": data,
+    }
+    return "DLLL " + json.dumps(entry) + "\n"
+
+
+class ThroughputCallback(transformers.TrainerCallback):
+    """Measures the time split, throughput and peak memory of every step.
+
+    The data wait time runs from the end of the previous step, or of the
+    logging and checkpointing that followed it, to the start of the step,
+    while the Trainer fetches and collates its batches. The compute time runs
+    from the start to the end of the step, after synchronizing the device,
+    including the host copy of the callbacks registered before it such as
+    AsyncCheckpointCallback. The step time runs from the end of the previous
+    step, so it also includes the Trainer checkpointing after it. Images and
+    tokens per second are of all the devices, estimated from the batches of
+    the local process.
+
+    The metrics of every step are written by the main process to a DLLogger
+    file, the averages since the last log are returned by pop_log_metrics.
+    """
+
+    def __init__(self, log_file=None):
+        self.log_file = log_file
+        self._file = None
+        self._start_time = None
+        self._step_end = None
+        self._ready = None
+        self._step_begin = None
+        self._data_wait = 0.0
+        self._images = 0
+        self._tokens = 0
+        self._padded_tokens = 0
+        self._totals = {}
+        self._num_steps = 0
+
+    def record_batch(self, inputs):
+        """Counts the images and tokens of a micro batch of the current step."""
+        pixel_values = inputs.get("pixel_values")
+        if pixel_values is not None:
+            self._images += len(pixel_values)
+        attention_mask = inputs.get("attention_mask")
+        if attention_mask is not None:
+            # Kept as a device tensor, the count is synchronized at the step end.
+            # Packed attention masks hold sequence IDs rather than ones.
+            self._tokens += attention_mask.count_nonzero()
+            self._padded_tokens += attention_mask.numel()
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._start_time = time.time()
+        self._step_end = self._ready = time.perf_counter()
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        if self.log_file and state.is_world_process_zero:
+            os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+            # Appended to, so resumed runs keep the steps of earlier attempts.
+            self._file = open(self.log_file, "a", encoding="utf-8")
+            parameters = {
+                "cfg/micro_batch_size": args.per_device_train_batch_size,
+                "cfg/global_batch_size": args.per_device_train_batch_size
+                * args.gradient_accumulation_steps
+                * args.world_size,
+                "cfg/gradient_accumulation_steps": args.gradient_accumulation_steps,
+                "cfg/data_parallel_size": args.world_size,
+            }
+            self._write("PARAMETER", parameters)
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self._ready = time.perf_counter()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._step_begin = time.perf_counter()
+        self._data_wait = self._step_begin - self._ready
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        step_time = now - self._step_end
+        metrics = {
+            "train_step_timing in s": step_time,
+            "data_wait_timing in s": self._data_wait,
+            "compute_timing in s": now - self._step_begin,
+            "images_per_s": self._images * args.world_size / step_time,
+            "tokens_per_s": float(self._tokens) * args.world_size / step_time,
+        }
+        if self._padded_tokens:
+            metrics["padding_efficiency"] = float(self._tokens) / self._padded_tokens
+        for key, value in metrics.items():
+            self._totals[key] = self._totals.get(key, 0.0) + value
+        if torch.cuda.is_available():
+            metrics["peak_memory_gib"] = torch.cuda.max_memory_allocated() / 2**30
+        # DLLogger steps start at 0 like the NeMo recipes.
+        self._write(state.global_step - 1, metrics)
+
+        self._num_steps += 1
+        self._images = self._tokens = self._padded_tokens = 0
+        self._step_end = self._ready = now
+
+    def on_log(self, args, state, control, **kwargs):
+        self._ready = time.perf_counter()
+
+    def on_save(self, args, state, control, **kwargs):
+        self._ready = time.perf_counter()
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        self._ready = time.perf_counter()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def pop_log_metrics(self):
+        """Returns the metrics averaged over the steps since the last call."""
+        if not self._num_steps:
+            return {}
+        averages = {
+            TRAINER_LOG_NAMES.get(key, key): round(total / self._num_steps, 4)
+            for key, total in self._totals.items()
+        }
+        # Peak memory is a maximum since the start of training, not averaged.
+        if torch.cuda.is_available():
+            averages["peak_memory_gib"] = round(
+                torch.cuda.max_memory_allocated() / 2**30, 4
+            )
+        self._totals = {}
+        self._num_steps = 0
+        return averages
+
+    def _write(self, step, data):
+        if self._file:
+            self._file.write(_dllogger_line(step, data, self._start_time))
+            self._file.flush()
+
+
+def _untied_state_dict(model):
+    """Returns the state dict of a model without its tied duplicate weights."""
+    tied = set(getattr(model, "_tied_weights_keys", None) or [])
+    state_dict = {}
+    storages = set()
+    # Tied keys come last, so the tensor is saved under its untied name.
+    for name, tensor in sorted(
+        model.state_dict().items(), key=lambda item: item[0] in tied
+    ):
+        storage = (tensor.device, tensor.data_ptr(), tensor.shape)
+        if storage not in storages:
+            storages.add(storage)
+            state_dict[name] = tensor
+    return state_dict
+
+
+class AsyncCheckpointCallback(transformers.TrainerCallback):
+    """Saves the model every save_steps steps in a background thread.
+
+    The main process copies the weights to pinned host memory, the only part
+    of the save on the training critical path, then a background thread
+    writes them as safetensors shards of up to max_shard_size with their
+    index, the model config and the trainer state to
+    checkpoint-<step>, and deletes the checkpoints beyond save_total_limit.
+    A save waits for the previous write, which reuses its host buffers.
+    Optimizer states are not saved, use the Trainer save to resume training.
+    Nothing is saved when save_steps is not positive.
+    """
+
+    def __init__(self, save_steps, save_total_limit=None, max_shard_size="5GB"):
+        self.save_steps = save_steps
+        self.save_total_limit = save_total_limit
+        self.max_shard_size = max_shard_size
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._buffers = {}
+
+    def on_step_end(self, args, state, control, model=None, **kwargs):
+        if (
+            self.save_steps <= 0
+            or state.global_step % self.save_steps
+            or not state.is_world_process_zero
+        ):
+            return
+        self.wait()
+        state_dict = self._snapshot(model)
+        checkpoint_dir = os.path.join(
+            args.output_dir, f"{CHECKPOINT_PREFIX}{state.global_step}"
+        )
+        self._pending = self._executor.submit(
+            self._write,
+            state_dict,
+            model.config,
+            dataclasses.asdict(state),
+            args.output_dir,
+            checkpoint_dir,
+        )
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.wait()
+
+    def wait(self):
+        """Waits for the pending write, raising its error if it failed."""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def _snapshot(self, model):
+        model = getattr(model, "module", model)
+        state_dict = _untied_state_dict(model)
+        for name, tensor in state_dict.items():
+            if name not in self._buffers:
+                self._buffers[name] = torch.empty(
+                    tensor.shape,
+                    dtype=tensor.dtype,
+                    pin_memory=torch.cuda.is_available(),
+                )
+            self._buffers[name].copy_(tensor.detach(), non_blocking=True)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return {name: self._buffers[name] for name in state_dict}
+
+    def _write(self, state_dict, config, trainer_state, output_dir, checkpoint_dir):
+        temp_dir = f"{checkpoint_dir}.tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        split = split_torch_state_dict_into_shards(
+            state_dict,
+            filename_pattern=transformers.utils.SAFE_WEIGHTS_NAME.replace(
+                ".safetensors", "{suffix}.safetensors"
+            ),
+            max_shard_size=self.max_shard_size,
+        )
+        for filename, names in split.filename_to_tensors.items():
+            safetensors.torch.save_file(
+                {name: state_dict[name] for name in names},
+                os.path.join(temp_dir, filename),
+                metadata={"format": "pt"},
+            )
+        if split.is_sharded:
+            index = {"metadata": split.metadata, "weight_map": split.tensor_to_filename}
+            with open(
+                os.path.join(temp_dir, transformers.utils.SAFE_WEIGHTS_INDEX_NAME),
+                "w",
+                encoding="utf-8",
+            ) as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+        config.to_json_file(os.path.join(temp_dir, transformers.utils.CONFIG_NAME))
+        with open(
+            os.path.join(temp_dir, transformers.trainer.TRAINER_STATE_NAME),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            json.dump(trainer_state, f, indent=2, sort_keys=True)
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        os.replace(temp_dir, checkpoint_dir)
+        print(f"[INFO] Saved {checkpoint_dir}")
+        self._prune(output_dir)
+
+    def _prune(self, output_dir):
+        if not self.save_total_limit:
+            return
+        steps = sorted(
+            int(name[len(CHECKPOINT_PREFIX) :])
+            for name in os.listdir(output_dir)
+            if name.startswith(CHECKPOINT_PREFIX)
+            and name[len(CHECKPOINT_PREFIX) :].isdigit()
+        )
+        for step in steps[: -self.save_total_limit]:
+            shutil.rmtree(os.path.join(output_dir, f"{CHECKPOINT_PREFIX}{step}"))
+
+
+class _EpochDataLoader(torch.utils.data.DataLoader):
+    """DataLoader reshuffling its IterableDataset at every epoch."""
+
+    def set_epoch(self, epoch):
+        self.dataset.set_epoch(epoch)
+
+
+class RecipeTrainer(Trainer):
+    """Trainer that also logs the throughput of the training steps.
+
+    The data wait, compute and step times, images and tokens per second, peak
+    memory and padding efficiency of ThroughputCallback are averaged over the
+    steps since the last log. The padding efficiency is the number of real
+    tokens over the number of padded tokens, 1.0 without padding.
+    """
+
+    def __init__(self, *args, metrics_log_file=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.throughput = ThroughputCallback(metrics_log_file)
+        self.add_callback(self.throughput)
+
+    def get_train_dataloader(self):
+        if not isinstance(self.train_dataset, datasets.IterableDataset):
+            return super().get_train_dataloader()
+        # The dataset is already split by process by prepare_streaming_dataset,
+        # accelerate would otherwise read the whole stream in every process.
+        return _EpochDataLoader(
+            self.train_dataset,
+            batch_size=self._train_batch_size,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+            persistent_workers=self.args.dataloader_persistent_workers,
+        )
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        self.throughput.record_batch(inputs)
+        return super().training_step(model, inputs, *args, **kwargs)
+
+    def log(self, logs, *args, **kwargs):
+        if "loss" in logs:
+            logs.update(self.throughput.pop_log_metrics())
+        super().log(logs, *args, **kwargs)
+
+
+def micro_batch_candidates(global_batch_size, world_size, max_micro_batch_size=0):
+    """Returns the micro batch sizes, up to max_micro_batch_size when set,
+    whose gradient accumulation reaches global_batch_size on world_size
+    processes."""
+    if global_batch_size % world_size:
+        raise ValueError(
+            f"The global batch size {global_batch_size} is not a multiple of "
+            f"{world_size} processes"
+        )
+    per_process = global_batch_size // world_size
+    return [
+        size
+        for size in range(1, per_process + 1)
+        if per_process % size == 0
+        and (max_micro_batch_size <= 0 or size <= max_micro_batch_size)
+    ]
+
+
+def _all_processes(value, op, device):
+    """Reduces a number over the processes, when distributed."""
+    if not (torch.distributed.is_available() and torch.distributed.is_initialized()):
+        return value
+    tensor = torch.tensor(float(value), dtype=torch.float64, device=device)
+    torch.distributed.all_reduce(tensor, op=op)
+    return tensor.item()
+
+
+def _reserve_gradient_buckets(model, device):
+    """Returns an uninitialized tensor of the size of the DDP gradient buckets
+    of model, a copy of its trainable parameters."""
+    num_bytes = sum(
+        p.numel() * p.element_size() for p in model.parameters() if p.requires_grad
     )
+    return torch.empty(num_bytes, dtype=torch.uint8, device=device)
+
+
+def autotune_micro_batch_size(model, ds, collate_fn, candidates, num_steps, device):
+    """Measures the training throughput of every micro batch size candidate.
+
+    Every candidate, in increasing order, runs a warmup step then num_steps
+    timed forward, backward and optimizer steps on the first examples of ds,
+    without data parallelism. The learning rate is 0, so the weights are left
+    unchanged while the optimizer states take their memory. The model is not
+    wrapped in DDP, so when distributed, the memory of the DDP gradient
+    buckets, a copy of the trainable parameters, is kept allocated while the
+    candidates run. The candidates from the first one out of memory on any
+    process are skipped and the throughputs are averaged over the processes.
+
+    Returns the micro batch size of the highest throughput and the samples
+    per second of every candidate tried, None when out of memory. Raises a
+    ValueError on every process when any process has fewer than num_steps + 1
+    full batches of a candidate.
+    """
+    model.to(device)
+    model.train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=0.0)
+    world_size = _all_processes(1, torch.distributed.ReduceOp.SUM, device)
+    gradient_buckets = None
+    if world_size > 1:
+        gradient_buckets = _reserve_gradient_buckets(model, device)
+    throughputs = {}
+    for size in sorted(candidates):
+        batches = iter(
+            torch.utils.data.DataLoader(
+                ds, batch_size=size, collate_fn=collate_fn, drop_last=True
+            )
+        )
+        elapsed = 0.0
+        fits = True
+        enough_examples = True
+        try:
+            for step in range(num_steps + 1):
+                batch = next(batches, None)
+                if batch is None:
+                    enough_examples = False
+                    break
+                batch = send_to_device(batch, device)
+                start = time.perf_counter()
+                model(**batch).loss.backward()
+                optimizer.step()
+                optimizer.zero_grad()
+                if torch.cuda.is_available():
+                    torch.cuda.synchronize()
+                if step:
+                    elapsed += time.perf_counter() - start
+        except torch.cuda.OutOfMemoryError:
+            fits = False
+        finally:
+            batch = None
+            optimizer.zero_grad(set_to_none=True)
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+        # Every process takes part in the reductions before any raises, so
+        # the others do not wait for it.
+        enough_examples = _all_processes(
+            enough_examples, torch.distributed.ReduceOp.MIN, device
+        )
+        if not enough_examples:
+            raise ValueError(
+                f"Autotuning needs {(num_steps + 1) * size} examples on every process"
+            )
+        fits = _all_processes(fits, torch.distributed.ReduceOp.MIN, device)
+        if not fits:
+            throughputs[size] = None
+            print(f"[INFO] Micro batch size {size}: out of memory")
+            break
+        throughput = _all_processes(
+            size * num_steps / elapsed, torch.distributed.ReduceOp.SUM, device
+        )
+        throughputs[size] = throughput / world_size
+        print(f"[INFO] Micro batch size {size}: {throughputs[size]:.2f} samples/s")
+
+    del optimizer, gradient_buckets
+    tried = {size: value for size, value in throughputs.items() if value}
+    if not tried:
+        raise RuntimeError(f"No micro batch size of {candidates} fits in memory")
+    return max(tried, key=tried.get), throughputs
+
+
+def main():
+    config = RecipeConfig.from_env()
+    use_cache = bool(config.dataset_cache_dir)
+    use_length_groups = config.group_by_length
+    if config.dataset_streaming and (use_cache or use_length_groups):
+        print(
+            "[WARNING] DATASET_CACHE_DIR and GROUP_BY_LENGTH need the whole "
+            "dataset and are ignored when streaming"
+        )
+        use_cache = use_length_groups = False
+
+    # Training Arguments from parsed arguments
+    training_args = TrainingArguments(
+        num_train_epochs=config.num_train_epochs,
+        max_steps=config.max_steps,
+        remove_unused_columns=False,
+        per_device_train_batch_size=config.per_device_train_batch_size,
+        gradient_accumulation_steps=config.gradient_accumulation_steps,
+        warmup_steps=config.warmup_steps,
+        learning_rate=config.learning_rate,
+        weight_decay=config.weight_decay,
+        adam_beta2=config.adam_beta2,
+        logging_steps=config.logging_steps,
+        optim="adamw_torch",
+        save_strategy=(
+            "no" if config.async_checkpoint or config.save_steps <= 0 else "steps"
+        ),
+        save_steps=config.save_steps,
+        save_total_limit=config.save_total_limit,
+        output_dir=config.output_dir,
+        bf16=True,
+        report_to=["tensorboard"],
+        dataloader_pin_memory=config.dataloader_pin_memory,
+        dataloader_num_workers=config.dataloader_num_workers,
+        group_by_length=use_length_groups,
+    )
+
+    print(f"[INFO] Loading {config.dataset_path} dataset")
+    ds = load_training_dataset(config.dataset_path, streaming=config.dataset_streaming)
+
+    processor = PaliGemmaProcessor.from_pretrained(config.model_id)
+
+    if use_cache:
+        # The local main process of every node builds the cache, the others
+        # wait and load it.
+        with training_args.main_process_first(local=True, desc="dataset cache"):
+            ds = build_dataset_cache(
+                ds,
+                processor,
+                config.dataset_cache_dir,
+                num_proc=config.preprocess_num_proc,
+            )
+        collate_fn = CachedCollator(
+            processor, normalize=not config.image_transform_on_device
+        )
+    elif config.image_transform_on_device:
+        collate_fn = RawImageCollator(processor)
+    else:
+        collate_fn = ProcessorCollator(processor)
+    if config.packed_sequence_length:
+        collate_fn = PackingCollator(
+            collate_fn, processor, config.packed_sequence_length
+        )
+    if config.preprocess_only:
+        return
+
+    if use_length_groups:
+        # The Trainer LengthGroupedSampler sorts each mega-batch of 50 global
+        # batches by this column, so batches are drawn from similar lengths.
+        ds = ds.add_column(
+            training_args.length_column_name, example_lengths(ds, processor)
+        )
+
+    if config.dataset_streaming:
+        num_rows = dataset_num_rows(config.dataset_path, ds)
+        ds = prepare_streaming_dataset(
+            ds,
+            seed=training_args.seed,
+            buffer_size=config.shuffle_buffer_size,
+            rank=training_args.process_index,
+            world_size=training_args.world_size,
+        )
+    else:
+        # Only an indices mapping is written, the examples are not copied.
+        ds = ds.train_test_split(test_size=HOLDOUT_FRACTION)["train"]
+
+    model = PaliGemmaForConditionalGeneration.from_pretrained(
+        config.model_id,
+        torch_dtype=torch.bfloat16,
+    )
+    if config.image_transform_on_device:
+        add_image_transform_hook(model, processor.image_processor)
+    if config.packed_sequence_length:
+        enable_packed_attention(model)
+
+    micro_batch_size = None
+    if config.autotune:
+        if config.global_batch_size <= 0:
+            config.global_batch_size = (
+                config.per_device_train_batch_size
+                * config.gradient_accumulation_steps
+                * training_args.world_size
+            )
+        candidates = micro_batch_candidates(
+            config.global_batch_size,
+            training_args.world_size,
+            config.max_micro_batch_size,
+        )
+        micro_batch_size, _ = autotune_micro_batch_size(
+            model,
+            ds,
+            collate_fn,
+            candidates,
+            num_steps=config.autotune_steps,
+            device=training_args.device,
+        )
+    config.resolve_batch_size(training_args.world_size, micro_batch_size)
+    training_args.per_device_train_batch_size = config.per_device_train_batch_size
+    training_args.gradient_accumulation_steps = config.gradient_accumulation_steps
+    print(
+        f"[INFO] Micro batch size {config.per_device_train_batch_size}, "
+        f"{config.gradient_accumulation_steps} gradient accumulation steps"
+    )
+
+    if config.dataset_streaming and training_args.max_steps <= 0:
+        # An IterableDataset has no length, the Trainer needs max_steps.
+        global_batch_size = (
+            training_args.per_device_train_batch_size
+            * training_args.gradient_accumulation_steps
+            * training_args.world_size
+        )
+        training_args.max_steps = config.num_train_epochs * math.ceil(
+            num_rows * (1 - HOLDOUT_FRACTION) / global_batch_size
+        )
+
+    callbacks = []
+    if config.async_checkpoint:
+        callbacks.append(
+            AsyncCheckpointCallback(
+                config.save_steps,
+                config.save_total_limit,
+                max_shard_size=config.max_shard_size,
+            )
+        )
+
+    trainer = RecipeTrainer(
+        model=model,
+        train_dataset=ds,
+        data_collator=collate_fn,
+        args=training_args,
+        callbacks=callbacks,
+        metrics_log_file=config.metrics_log_file,
+    )
+
+    trainer.train()
+
 
-    tokens = tokens.to(torch.bfloat16)
-    return tokens
-
-
-model = PaliGemmaForConditionalGeneration.from_pretrained(
-    model_id,
-    torch_dtype=torch.bfloat16,
-)
-
-# Training Arguments from parsed arguments
-training_args = TrainingArguments(
-    num_train_epochs=num_train_epochs,
-    remove_unused_columns=False,
-    per_device_train_batch_size=per_device_train_batch_size,
-    gradient_accumulation_steps=gradient_accumulation_steps,
-    warmup_steps=warmup_steps,
-    learning_rate=learning_rate,
-    weight_decay=weight_decay,
-    adam_beta2=adam_beta2,
-    logging_steps=logging_steps,
-    optim="adamw_torch",
-    save_strategy="steps",
-    save_steps=save_steps,
-    save_total_limit=save_total_limit,
-    output_dir="out_paligemma",
-    bf16=True,
-    report_to=["tensorboard"],
-    dataloader_pin_memory=False,
-    dataloader_num_workers=dataloader_num_workers,
-)
-
-trainer = Trainer(
-    model=model, train_dataset=ds, data_collator=collate_fn, args=training_args
-)
-
-trainer.train()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,684 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""CPU tests of the PaliGemma recipe with a tiny processor, no download."""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import datasets
+import numpy as np
+import torch
+import transformers
+from PIL import Image
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+# Add the recipe directory to sys.path so we can import main.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import main
+
+WORDS = ["<pad>", "<eos>", "<bos>", "<unk>", "<image>", "answer", "en"]
+WORDS += ["what", "is", "the", "color", "of", "a", "car", "red", "blue", "yes", "no"]
+
+
+def tiny_processor():
+    """Returns a PaliGemma processor with a word level tokenizer, 28x28 images."""
+    tokenizer = Tokenizer(
+        models.WordLevel({w: i for i, w in enumerate(WORDS)}, unk_token="<unk>")
+    )
+    tokenizer.pre_tokenizer = pre_tokenizers.Sequence(
+        [
+            pre_tokenizers.Split("<image>", behavior="isolated"),
+            pre_tokenizers.Whitespace(),
+        ]
+    )
+    image_processor = transformers.SiglipImageProcessor(
+        size={"height": 28, "width": 28}
+    )
+    image_processor.image_seq_length = 4
+    return transformers.PaliGemmaProcessor(
+        image_processor=image_processor,
+        tokenizer=transformers.GemmaTokenizerFast(
+            tokenizer_object=tokenizer,
+            pad_token="<pad>",
+            eos_token="<eos>",
+            bos_token="<bos>",
+            unk_token="<unk>",
+            additional_special_tokens=["<image>"],
+        ),
+    )
+
+
+def tiny_dataset(num_examples=8, seed=0):
+    """Returns a VQA dataset of random images and questions of varying length."""
+    rng = np.random.default_rng(seed)
+    questions = ["what is the color of a car", "is the car red", "what is a car"]
+    answers = ["red", "blue", "yes", "no blue"]
+    return datasets.Dataset.from_dict(
+        {
+            "image": [
+                Image.fromarray(
+                    rng.integers(0, 255, (36 + 4 * i, 48, 3), dtype=np.uint8)
+                )
+                for i in range(num_examples)
+            ],
+            "question": [questions[i % len(questions)] for i in range(num_examples)],
+            "multiple_choice_answer": [
+                answers[i % len(answers)] for i in range(num_examples)
+            ],
+        },
+        features=datasets.Features(
+            {
+                "image": datasets.Image(),
+                "question": datasets.Value("string"),
+                "multiple_choice_answer": datasets.Value("string"),
+            }
+        ),
+    )
+
+
+def tiny_model():
+    """Returns a randomly initialized bf16 PaliGemma model for tiny_processor."""
+    torch.manual_seed(0)
+    config = transformers.PaliGemmaConfig(
+        vision_config={
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_hidden_layers": 1,
+            "num_attention_heads": 2,
+            "image_size": 28,
+            "patch_size": 14,
+            "projection_dim": 32,
+        },
+        text_config={
+            "model_type": "gemma2",
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_hidden_layers": 1,
+            "num_attention_heads": 2,
+            "num_key_value_heads": 1,
+            "head_dim": 16,
+            "vocab_size": len(WORDS),
+        },
+        image_token_index=WORDS.index("<image>"),
+        vocab_size=len(WORDS),
+        projection_dim=32,
+        hidden_size=32,
+    )
+    return transformers.PaliGemmaForConditionalGeneration(config).to(torch.bfloat16)
+
+
+class TestRecipeConfig(unittest.TestCase):
+
+    def test_from_env(self):
+        config = main.RecipeConfig.from_env(
+            {
+                "NUM_TRAIN_EPOCHS": "1",
+                "LEARNING_RATE": "1e-4",
+                "GROUP_BY_LENGTH": "1",
+                "DATASET_CACHE_DIR": "/tmp/cache",
+                "DATALOADER_NUM_WORKERS": "4",
+            }
+        )
+        self.assertEqual(config.num_train_epochs, 1)
+        self.assertEqual(config.learning_rate, 1e-4)
+        self.assertTrue(config.group_by_length)
+        self.assertEqual(config.dataset_cache_dir, "/tmp/cache")
+        self.assertEqual(config.preprocess_num_proc, 4)
+        self.assertEqual(config.per_device_train_batch_size, 96)
+
+    def test_env_overrides_config_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump({"global_batch_size": 256, "autotune": True, "save_steps": 10}, f)
+            f.flush()
+            config = main.RecipeConfig.from_env(
+                {"RECIPE_CONFIG": f.name, "SAVE_STEPS": "20"}
+            )
+            self.assertEqual(config.global_batch_size, 256)
+            self.assertTrue(config.autotune)
+            self.assertEqual(config.save_steps, 20)
+
+            with open(f.name, "w") as unknown:
+                json.dump({"unknown": 1}, unknown)
+            with self.assertRaises(ValueError):
+                main.RecipeConfig.from_env({"RECIPE_CONFIG": f.name})
+
+    def test_boolean_env_values(self):
+        for value in ["1", "true", "True", "yes", "ON", "y", "t"]:
+            config = main.RecipeConfig.from_env({"AUTOTUNE": value})
+            self.assertTrue(config.autotune, value)
+        for value in ["0", "false", "FALSE", "no", "off", "n", "f", ""]:
+            config = main.RecipeConfig.from_env({"AUTOTUNE": value})
+            self.assertFalse(config.autotune, value)
+        for value in ["2", "enabled", "truee"]:
+            with self.assertRaisesRegex(ValueError, "AUTOTUNE"):
+                main.RecipeConfig.from_env({"AUTOTUNE": value})
+
+    def test_config_file_value_types(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump(
+                {
+                    "learning_rate": 1,
+                    "preprocess_num_proc": None,
+                    "metrics_log_file": None,
+                    "dataset_path": "/data",
+                },
+                f,
+            )
+            f.flush()
+            config = main.RecipeConfig.from_env({"RECIPE_CONFIG": f.name})
+            self.assertEqual(config.learning_rate, 1.0)
+            self.assertIsInstance(config.learning_rate, float)
+            self.assertEqual(config.dataset_path, "/data")
+
+            for field, value in [
+                ("autotune", "false"),
+                ("autotune", 1),
+                ("global_batch_size", "256"),
+                ("global_batch_size", 256.0),
+                ("global_batch_size", True),
+                ("learning_rate", "1e-4"),
+                ("dataset_path", 1),
+                ("save_steps", None),
+            ]:
+                with open(f.name, "w") as invalid:
+                    json.dump({field: value}, invalid)
+                with self.assertRaisesRegex(ValueError, field):
+                    main.RecipeConfig.from_env({"RECIPE_CONFIG": f.name})
+
+    def test_resolve_batch_size(self):
+        config = main.RecipeConfig(global_batch_size=256)
+        config.resolve_batch_size(world_size=8, micro_batch_size=16)
+        self.assertEqual(config.per_device_train_batch_size, 16)
+        self.assertEqual(config.gradient_accumulation_steps, 2)
+        with self.assertRaises(ValueError):
+            config.resolve_batch_size(world_size=8, micro_batch_size=24)
+
+    def test_micro_batch_candidates(self):
+        self.assertEqual(main.micro_batch_candidates(96, 8), [1, 2, 3, 4, 6, 12])
+        self.assertEqual(main.micro_batch_candidates(96, 8, 4), [1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            main.micro_batch_candidates(100, 8)
+
+    def test_autotune_leaves_weights_unchanged(self):
+        processor = tiny_processor()
+        model = tiny_model()
+        expected = {k: v.clone() for k, v in model.state_dict().items()}
+        best, throughputs = main.autotune_micro_batch_size(
+            model,
+            tiny_dataset(16),
+            main.ProcessorCollator(processor),
+            [1, 2, 4],
+            num_steps=1,
+            device=torch.device("cpu"),
+        )
+        self.assertIn(best, [1, 2, 4])
+        self.assertEqual(sorted(throughputs), [1, 2, 4])
+        self.assertEqual(best, max(throughputs, key=throughputs.get))
+        for name, tensor in model.state_dict().items():
+            self.assertTrue(torch.equal(tensor, expected[name]), name)
+        self.assertTrue(all(p.grad is None for p in model.parameters()))
+
+    def test_autotune_reserves_gradient_buckets(self):
+        model = tiny_model()
+        buckets = main._reserve_gradient_buckets(model, torch.device("cpu"))
+        self.assertEqual(
+            buckets.numel(), 2 * sum(p.numel() for p in model.parameters())
+        )
+
+        def run(world_size):
+            def all_processes(value, op, device):
+                if op == torch.distributed.ReduceOp.SUM:
+                    return value * world_size
+                return value
+
+            reserve = mock.Mock(wraps=main._reserve_gradient_buckets)
+            with mock.patch.object(main, "_all_processes", all_processes):
+                with mock.patch.object(main, "_reserve_gradient_buckets", reserve):
+                    main.autotune_micro_batch_size(
+                        model,
+                        tiny_dataset(8),
+                        main.ProcessorCollator(tiny_processor()),
+                        [1, 2],
+                        num_steps=1,
+                        device=torch.device("cpu"),
+                    )
+            return reserve
+
+        run(1).assert_not_called()
+        run(2).assert_called_once_with(model, torch.device("cpu"))
+
+    def test_autotune_needs_examples_on_every_process(self):
+        all_processes = mock.Mock(wraps=main._all_processes)
+        with mock.patch.object(main, "_all_processes", all_processes):
+            with self.assertRaisesRegex(ValueError, "8 examples"):
+                main.autotune_micro_batch_size(
+                    tiny_model(),
+                    tiny_dataset(6),
+                    main.ProcessorCollator(tiny_processor()),
+                    [1, 2, 4],
+                    num_steps=1,
+                    device=torch.device("cpu"),
+                )
+        # The shortage is reduced over the processes before raising.
+        all_processes.assert_called_with(
+            False, torch.distributed.ReduceOp.MIN, torch.device("cpu")
+        )
+
+
+class TestDatasetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = tiny_processor()
+        self.ds = tiny_dataset()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_cached_batches_match_processor(self):
+        cached = main.build_dataset_cache(self.ds, self.processor, self.cache_dir)
+        examples = [self.ds[i] for i in range(len(self.ds))]
+        expected = main.ProcessorCollator(self.processor)(examples)
+        actual = main.CachedCollator(self.processor)(
+            [cached[i] for i in range(len(cached))]
+        )
+        self.assertEqual(set(actual.keys()), set(expected.keys()))
+        for key in ["input_ids", "token_type_ids", "attention_mask", "labels"]:
+            self.assertTrue(torch.equal(actual[key], expected[key]), key)
+        self.assertEqual(actual["pixel_values"].dtype, torch.bfloat16)
+        torch.testing.assert_close(
+            actual["pixel_values"].float(),
+            expected["pixel_values"].float(),
+            atol=1e-2,
+            rtol=0,
+        )
+
+    def test_cache_is_reused(self):
+        main.build_dataset_cache(self.ds, self.processor, self.cache_dir)
+        main.build_dataset_cache(self.ds, self.processor, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_cache_key_changes_with_processor(self):
+        main.build_dataset_cache(self.ds, self.processor, self.cache_dir)
+        self.processor.image_processor.image_mean = [0.0, 0.0, 0.0]
+        main.build_dataset_cache(self.ds, self.processor, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+class TestLengthGrouping(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = tiny_processor()
+        self.ds = tiny_dataset(16)
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_example_lengths_match_processor(self):
+        tokens = main.ProcessorCollator(self.processor)(list(self.ds))
+        expected = tokens["attention_mask"].sum(dim=1).tolist()
+        self.assertEqual(main.example_lengths(self.ds, self.processor), expected)
+        cached = main.build_dataset_cache(self.ds, self.processor, self.output_dir)
+        self.assertEqual(main.example_lengths(cached, self.processor), expected)
+
+    def test_trainer_logs_padding_efficiency(self):
+        ds = self.ds.add_column("length", main.example_lengths(self.ds, self.processor))
+        args = transformers.TrainingArguments(
+            output_dir=self.output_dir,
+            per_device_train_batch_size=4,
+            max_steps=4,
+            logging_steps=2,
+            remove_unused_columns=False,
+            group_by_length=True,
+            report_to=[],
+            save_strategy="no",
+            use_cpu=True,
+        )
+        trainer = main.RecipeTrainer(
+            model=tiny_model(),
+            train_dataset=ds,
+            data_collator=main.ProcessorCollator(self.processor),
+            args=args,
+        )
+        trainer.train()
+        efficiencies = [
+            log["padding_efficiency"]
+            for log in trainer.state.log_history
+            if "padding_efficiency" in log
+        ]
+        self.assertEqual(len(efficiencies), 2)
+        for efficiency in efficiencies:
+            self.assertGreater(efficiency, 0.5)
+            self.assertLessEqual(efficiency, 1.0)
+
+
+class TestThroughput(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = tiny_processor()
+        self.ds = tiny_dataset(16)
+        self.output_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.output_dir, "dllogger.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def train(self):
+        args = transformers.TrainingArguments(
+            output_dir=self.output_dir,
+            per_device_train_batch_size=2,
+            gradient_accumulation_steps=2,
+            max_steps=4,
+            logging_steps=2,
+            remove_unused_columns=False,
+            report_to=[],
+            save_strategy="no",
+            use_cpu=True,
+        )
+        trainer = main.RecipeTrainer(
+            model=tiny_model(),
+            train_dataset=self.ds,
+            data_collator=main.ProcessorCollator(self.processor),
+            args=args,
+            metrics_log_file=self.log_file,
+        )
+        trainer.train()
+        return trainer
+
+    def test_dllogger_file(self):
+        self.train()
+        with open(self.log_file, "r", encoding="utf-8") as f:
+            lines = [json.loads(line[4:]) for line in f if line.strip()]
+        self.assertEqual(lines[0]["step"], "PARAMETER")
+        self.assertEqual(lines[0]["data"]["cfg/global_batch_size"], 4)
+        self.assertEqual([line["step"] for line in lines[1:]], [0, 1, 2, 3])
+        for line in lines[1:]:
+            data = line["data"]
+            self.assertGreater(data["train_step_timing in s"], 0)
+            self.assertLessEqual(
+                data["data_wait_timing in s"] + data["compute_timing in s"],
+                data["train_step_timing in s"],
+            )
+            step_time = data["train_step_timing in s"]
+            self.assertAlmostEqual(data["images_per_s"] * step_time, 4)
+
+    def test_trainer_logs_throughput(self):
+        trainer = self.train()
+        logs = [log for log in trainer.state.log_history if "loss" in log]
+        self.assertEqual(len(logs), 2)
+        for log in logs:
+            for key in ["step_time_s", "data_wait_time_s", "compute_time_s"]:
+                self.assertGreaterEqual(log[key], 0)
+            self.assertGreater(log["images_per_s"], 0)
+            self.assertGreater(log["tokens_per_s"], log["images_per_s"])
+
+
+class TestImageTransform(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = tiny_processor()
+        self.examples = list(tiny_dataset())
+        self.transform = main.ImageTransform(self.processor.image_processor)
+
+    def test_raw_images_match_processor(self):
+        expected = main.ProcessorCollator(self.processor)(self.examples)
+        actual = main.RawImageCollator(self.processor)(self.examples)
+        for key in ["input_ids", "token_type_ids", "attention_mask", "labels"]:
+            self.assertTrue(torch.equal(actual[key], expected[key]), key)
+        for image, example in zip(actual["pixel_values"], self.examples):
+            self.assertEqual(image.dtype, torch.uint8)
+            self.assertEqual(image.shape[1:], example["image"].size[::-1])
+
+        pixel_values = self.transform(actual["pixel_values"])
+        self.assertEqual(pixel_values.dtype, torch.bfloat16)
+        # The antialiased bicubic resize differs from the PIL one by a few
+        # levels on the random images.
+        difference = (pixel_values.float() - expected["pixel_values"].float()).abs()
+        self.assertLess(difference.mean().item(), 0.01)
+        self.assertLess(difference.max().item(), 0.1)
+
+    def test_cached_images_match_collator(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cached = main.build_dataset_cache(
+            datasets.Dataset.from_list(self.examples, features=tiny_dataset().features),
+            self.processor,
+            cache_dir,
+        )
+        examples = [cached[i] for i in range(len(cached))]
+        expected = main.CachedCollator(self.processor)(examples)
+        actual = main.CachedCollator(self.processor, normalize=False)(examples)
+        self.assertEqual(actual["pixel_values"].dtype, torch.uint8)
+        torch.testing.assert_close(
+            self.transform(actual["pixel_values"]), expected["pixel_values"]
+        )
+
+    def test_hook_gives_same_loss(self):
+        model = tiny_model()
+        with torch.no_grad():
+            expected = model(**main.ProcessorCollator(self.processor)(self.examples))
+            main.add_image_transform_hook(model, self.processor.image_processor)
+            actual = model(**main.RawImageCollator(self.processor)(self.examples))
+        torch.testing.assert_close(actual.loss, expected.loss, atol=2e-2, rtol=0)
+
+
+class TestPacking(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = tiny_processor()
+        self.examples = list(tiny_dataset())
+        self.collator = main.ProcessorCollator(self.processor)
+        self.model = tiny_model().float()
+
+    def loss(self, batch):
+        batch["pixel_values"] = batch["pixel_values"].float()
+        with torch.no_grad():
+            return self.model(**batch).loss
+
+    def test_pack_lengths(self):
+        rows = main.pack_lengths([5, 3, 7, 2, 12], max_length=10)
+        self.assertEqual(rows, [[4], [2, 1], [0, 3]])
+
+    def test_packed_batch_layout(self):
+        batch = self.collator(self.examples)
+        packed = main.PackingCollator(self.collator, self.processor, 40)(self.examples)
+        self.assertLess(len(packed["input_ids"]), len(self.examples))
+        self.assertEqual(
+            packed["attention_mask"].count_nonzero(), batch["attention_mask"].sum()
+        )
+        self.assertEqual(len(packed["pixel_values"]), len(self.examples))
+        self.assertEqual(
+            (packed["labels"] != -100).sum(), (batch["labels"] != -100).sum()
+        )
+
+    def test_packed_and_unpacked_losses_match(self):
+        # The loss of unpadded examples, one at a time, weighted by their
+        # number of predicted tokens, like the token mean of a batch.
+        losses = []
+        weights = []
+        for example in self.examples:
+            batch = self.collator([example])
+            losses.append(self.loss(batch))
+            weights.append((batch["labels"][:, 1:] != -100).sum())
+        expected = sum(l * w for l, w in zip(losses, weights)) / sum(weights)
+
+        packed = main.PackingCollator(self.collator, self.processor, 40)(self.examples)
+        main.enable_packed_attention(self.model)
+        torch.testing.assert_close(self.loss(packed), expected)
+        # Padding is not attended to either with the packed attention.
+        torch.testing.assert_close(self.loss(self.collator(self.examples)), expected)
+
+    def test_packed_attention_needs_causal_mask(self):
+        def _update_causal_mask(attention_mask, inputs_embeds):
+            pass
+
+        self.model._update_causal_mask = _update_causal_mask
+        with self.assertRaisesRegex(ValueError, "_update_causal_mask"):
+            main.enable_packed_attention(self.model)
+
+
+class TestAsyncCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = tiny_processor()
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_saves_sharded_checkpoints(self):
+        model = tiny_model()
+        args = transformers.TrainingArguments(
+            output_dir=self.output_dir,
+            per_device_train_batch_size=4,
+            max_steps=4,
+            remove_unused_columns=False,
+            report_to=[],
+            save_strategy="no",
+            use_cpu=True,
+        )
+        trainer = main.RecipeTrainer(
+            model=model,
+            train_dataset=tiny_dataset(16),
+            data_collator=main.ProcessorCollator(self.processor),
+            args=args,
+            callbacks=[
+                main.AsyncCheckpointCallback(
+                    save_steps=2, save_total_limit=1, max_shard_size="50KB"
+                )
+            ],
+        )
+        trainer.train()
+
+        # The older checkpoint is pruned.
+        self.assertEqual(os.listdir(self.output_dir), ["checkpoint-4"])
+        checkpoint_dir = os.path.join(self.output_dir, "checkpoint-4")
+        files = os.listdir(checkpoint_dir)
+        self.assertIn("model.safetensors.index.json", files)
+        self.assertGreater(len([f for f in files if f.endswith(".safetensors")]), 1)
+        with open(os.path.join(checkpoint_dir, "trainer_state.json")) as f:
+            self.assertEqual(json.load(f)["global_step"], 4)
+
+        loaded = transformers.PaliGemmaForConditionalGeneration.from_pretrained(
+            checkpoint_dir, torch_dtype=torch.bfloat16
+        )
+        expected = model.state_dict()
+        for name, tensor in loaded.state_dict().items():
+            self.assertTrue(torch.equal(tensor, expected[name]), name)
+
+    def test_save_steps_disabled(self):
+        callback = main.AsyncCheckpointCallback(save_steps=0)
+        args = transformers.TrainingArguments(
+            output_dir=self.output_dir, report_to=[], use_cpu=True
+        )
+        state = transformers.TrainerState(global_step=2)
+        callback.on_step_end(args, state, transformers.TrainerControl())
+        callback.on_train_end(args, state, transformers.TrainerControl())
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.processor = tiny_processor()
+        self.ds = tiny_dataset(16)
+        self.data_dir = tempfile.mkdtemp()
+        # Shards laid out like the output of the Waymo data processor.
+        shard_dir = os.path.join(self.data_dir, main.SHARD_DIRNAME)
+        os.makedirs(shard_dir)
+        shards = []
+        for i in range(4):
+            file = f"data-{i:05d}-of-00004.parquet"
+            self.ds.shard(4, i, contiguous=True).to_parquet(
+                os.path.join(shard_dir, file)
+            )
+            shards.append({"file": file, "num_rows": 4})
+        with open(os.path.join(shard_dir, main.SHARD_INDEX_FILENAME), "w") as f:
+            json.dump({"num_rows": 16, "shards": shards}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def image_keys(self, ds):
+        return sorted(
+            example["image"]["bytes"]
+            for example in ds.cast_column("image", datasets.Image(decode=False))
+        )
+
+    def test_local_parquet_files(self):
+        files = main.local_parquet_files(self.data_dir)
+        self.assertEqual(
+            [os.path.basename(file) for file in files],
+            [f"data-{i:05d}-of-00004.parquet" for i in range(4)],
+        )
+        self.assertIsNone(main.local_parquet_files("merve/vqav2-small"))
+        ds = main.load_training_dataset(self.data_dir)
+        self.assertEqual(len(ds), 16)
+        self.assertEqual(main.dataset_num_rows(self.data_dir, ds), 16)
+
+    def test_streaming_split_by_process(self):
+        ds = main.load_training_dataset(self.data_dir, streaming=True)
+        expected = [
+            key
+            for key in self.image_keys(ds)
+            if not main.is_holdout({"image": {"bytes": key}})
+        ]
+        keys = []
+        for rank in range(2):
+            shard = main.prepare_streaming_dataset(
+                ds, seed=0, buffer_size=4, rank=rank, world_size=2
+            )
+            keys.extend(example["image"]["bytes"] for example in shard)
+        self.assertEqual(sorted(keys), expected)
+
+    def test_streaming_shuffles_every_epoch(self):
+        ds = main.load_training_dataset(self.data_dir, streaming=True)
+        ds = main.prepare_streaming_dataset(ds, seed=0, buffer_size=4)
+        first = [example["image"]["bytes"] for example in ds]
+        ds.set_epoch(1)
+        second = [example["image"]["bytes"] for example in ds]
+        self.assertEqual(sorted(first), sorted(second))
+        self.assertNotEqual(first, second)
+
+    def test_trainer_trains_on_stream(self):
+        ds = main.load_training_dataset(self.data_dir, streaming=True)
+        ds = main.prepare_streaming_dataset(ds, seed=0, buffer_size=4)
+        args = transformers.TrainingArguments(
+            output_dir=self.data_dir,
+            per_device_train_batch_size=4,
+            max_steps=6,
+            remove_unused_columns=False,
+            report_to=[],
+            save_strategy="no",
+            use_cpu=True,
+        )
+        trainer = main.RecipeTrainer(
+            model=tiny_model(),
+            train_dataset=ds,
+            data_collator=main.ProcessorCollator(self.processor),
+            args=args,
+        )
+        trainer.train()
+        self.assertEqual(trainer.state.global_step, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -67,6 +67,29 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "b200",
+  "model_family_name": "qwen",
+  "model_recipe_name": "qwen3_235b_a22b",
+  "gpus_per_node": 8,
+  "num_gpus": 256,
+  "seq_length": 4096,
+  "compute_dtype": "bf16",
+  "global_batch_size": 4096,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 8,
+  "virtual_pipeline_model_parallel_size": 4,
+  "expert_model_parallel_size": 8,
+  "expert_tensor_parallel_size": 1,
+  "moe_a2a_overlap": "True",
+  "max_steps": 30,
+  "launcher_options": {
+    "experiment_name": "{model_recipe_name}_{model_family_name}"
+  }
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -91,21 +114,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu b200 \
-    --model_family_name qwen \
-    --model_recipe_name qwen3_235b_a22b \
-    --gpus_per_node 8 \
-    --num_gpus 256 \
-    --seq_length 4096 \
-    --compute_dtype bf16 \
-    --global_batch_size 4096 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 8 \
-    --virtual_pipeline_model_parallel_size 4 \
-    --expert_model_parallel_size 8 \
-    --expert_tensor_parallel_size 1 \
-    --moe_a2a_overlap True \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
@@ -84,6 +84,29 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "b200",
+  "model_family_name": "qwen",
+  "model_recipe_name": "qwen3_30b_a3b",
+  "gpus_per_node": 8,
+  "num_gpus": 8,
+  "seq_length": 4096,
+  "tensor_model_parallel_size": 4,
+  "pipeline_model_parallel_size": 1,
+  "virtual_pipeline_model_parallel_size": null,
+  "context_parallel_size": 1,
+  "expert_tensor_parallel_size": 1,
+  "use_megatron_fsdp": "false",
+  "global_batch_size": 512,
+  "micro_batch_size": 8,
+  "compute_dtype": "fp8_mx",
+  "cuda_graph_impl": "transformer_engine",
+  "cuda_graph_scope": "moe_router,moe_preprocess,attn",
+  "max_steps": 30
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -108,24 +131,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-   --gpu b200 \
-   --model_family_name qwen \
-   --model_recipe_name qwen3_30b_a3b \
-   --gpus_per_node 8 \
-   --num_gpus 8 \
-   --seq_length 4096 \
-   --tensor_model_parallel_size 4 \
-   --pipeline_model_parallel_size 1 \
-   --virtual_pipeline_model_parallel_size None \
-   --context_parallel_size 1 \
-   --expert_tensor_parallel_size 1 \
-   --use_megatron_fsdp false \
-   --global_batch_size 512 \
-   --micro_batch_size 8 \
-   --compute_dtype fp8_mx \
-   --cuda_graph_impl transformer_engine \
-   --cuda_graph_scope moe_router,moe_preprocess,attn \
-   --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
@@ -86,6 +86,32 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "account": "ninggu",
+  "partition": "a4x_max",
+  "model_name": "gpt_oss",
+  "model_size": "120b",
+  "gpu": "gb300",
+  "num_gpus": 256,
+  "gpus_per_node": 4,
+  "compute_dtype": "bf16",
+  "global_batch_size": 1024,
+  "micro_batch_size": 4,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 1,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 64,
+  "expert_tensor_parallel_size": 1,
+  "cuda_graph_impl": "transformer_engine",
+  "cuda_graph_scope": "attn,moe_router,moe_preprocess",
+  "max_step": 50,
+  "launcher_options": {
+    "experiment_name": "{model_name}_{model_size}_{domain}_{task}_{compute_dtype}"
+  }
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -110,25 +136,8 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --account ninggu \
-    --partition a4x_max \
-    --model_name gpt_oss \
-    --model_size 120b \
-    --gpu gb300 \
-    --num_gpus 256 \
-    --gpus_per_node 4 \
-    --compute_dtype bf16 \
-    --global_batch_size 1024 \
-    --micro_batch_size 4 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 1 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 64 \
-    --expert_tensor_parallel_size 1 \
-    --cuda_graph_impl transformer_engine \
-    --cuda_graph_scope attn,moe_router,moe_preprocess \
-    --hf_token "$HF_TOKEN" \
-    --max_step 50
+    --recipe_config scripts/performance/recipe_config.json \
+    --hf_token "$HF_TOKEN"
 EOM
 )
 
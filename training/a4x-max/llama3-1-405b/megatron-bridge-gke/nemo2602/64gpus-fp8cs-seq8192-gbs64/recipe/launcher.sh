@@ -87,6 +87,26 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "gb300",
+  "model_family_name": "llama",
+  "model_recipe_name": "llama31_405b",
+  "config_variant": "v1",
+  "gpus_per_node": 4,
+  "compute_dtype": "fp8_cs",
+  "global_batch_size": 64,
+  "seq_length": 8192,
+  "num_gpus": 64,
+  "use_megatron_fsdp": "true",
+  "tensor_model_parallel_size": 4,
+  "pipeline_model_parallel_size": 1,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 1,
+  "micro_batch_size": 1
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -111,22 +131,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-      --gpu gb300 \
-      --model_family_name llama \
-      --model_recipe_name llama31_405b \
-      --config_variant v1 \
-      --gpu gb300 \
-      --gpus_per_node 4 \
-      --compute_dtype fp8_cs \
-      --global_batch_size 64 \
-      --seq_length 8192 \
-      --num_gpus 64 \
-      --use_megatron_fsdp true \
-      --tensor_model_parallel_size 4 \
-      --pipeline_model_parallel_size 1 \
-      --context_parallel_size 1 \
-      --expert_model_parallel_size 1 \
-      --micro_batch_size 1
+    --recipe_config scripts/performance/recipe_config.json
 EOM
 )
 
@@ -86,6 +86,27 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "model_family_name": "qwen",
+  "model_recipe_name": "qwen3_235b_a22b",
+  "gpu": "gb300",
+  "num_gpus": 128,
+  "gpus_per_node": 4,
+  "compute_dtype": "fp8_mx",
+  "seq_length": 4096,
+  "global_batch_size": 1024,
+  "micro_batch_size": 2,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 1,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 64,
+  "expert_tensor_parallel_size": 1,
+  "cuda_graph_impl": "transformer_engine",
+  "cuda_graph_scope": "moe_router,moe_preprocess"
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -110,22 +131,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --model_family_name qwen \
-    --model_recipe_name qwen3_235b_a22b \
-    --gpu gb300 \
-    --num_gpus 128 \
-    --gpus_per_node 4 \
-    --compute_dtype fp8_mx \
-    --seq_length 4096 \
-    --global_batch_size 1024 \
-    --micro_batch_size 2 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 1 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 64 \
-    --expert_tensor_parallel_size 1 \
-    --cuda_graph_impl transformer_engine \
-    --cuda_graph_scope moe_router,moe_preprocess
+    --recipe_config scripts/performance/recipe_config.json
 EOM
 )
 
@@ -67,6 +67,33 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "gb200",
+  "model_family_name": "deepseek",
+  "model_recipe_name": "deepseek_v3",
+  "gpus_per_node": 4,
+  "num_gpus": 256,
+  "seq_length": 4096,
+  "compute_dtype": "bf16",
+  "global_batch_size": 4096,
+  "pipeline_model_parallel_size": 4,
+  "tensor_model_parallel_size": 1,
+  "virtual_pipeline_model_parallel_size": 4,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 64,
+  "expert_tensor_parallel_size": 1,
+  "moe_a2a_overlap": "False",
+  "recompute_modules": "mla_up_proj",
+  "cuda_graph_impl": "transformer_engine",
+  "cuda_graph_scope": "moe_router,moe_preprocess",
+  "max_steps": 30,
+  "launcher_options": {
+    "experiment_name": "{model_recipe_name}_{model_family_name}"
+  }
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -91,25 +118,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu gb200 \
-    --model_family_name deepseek \
-    --model_recipe_name deepseek_v3 \
-    --gpus_per_node 4 \
-    --num_gpus 256 \
-    --seq_length 4096 \
-    --compute_dtype bf16 \
-    --global_batch_size 4096 \
-    --pipeline_model_parallel_size 4 \
-    --tensor_model_parallel_size 1 \
-    --virtual_pipeline_model_parallel_size 4 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 64 \
-    --expert_tensor_parallel_size 1 \
-    --moe_a2a_overlap False \
-    --recompute_modules mla_up_proj \
-    --cuda_graph_impl transformer_engine \
-    --cuda_graph_scope moe_router,moe_preprocess \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
@@ -99,6 +99,28 @@ ls
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "model_family_name": "llama",
+  "model_recipe_name": "llama3_70b",
+  "config_variant": "v2",
+  "gpu": "gb200",
+  "num_gpus": 64,
+  "gpus_per_node": 4,
+  "compute_dtype": "fp8_cs",
+  "seq_length": 8192,
+  "global_batch_size": 256,
+  "micro_batch_size": 2,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 1,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 1,
+  "expert_tensor_parallel_size": 1,
+  "use_megatron_fsdp": "true",
+  "activation_offload_layers": 40
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -123,23 +145,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --model_family_name llama \
-    --model_recipe_name llama3_70b \
-    --config_variant v2 \
-    --gpu gb200 \
-    --num_gpus 64 \
-    --gpus_per_node 4 \
-    --compute_dtype fp8_cs \
-    --seq_length 8192 \
-    --global_batch_size 256 \
-    --micro_batch_size 2 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 1 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 1 \
-    --expert_tensor_parallel_size 1 \
-    --use_megatron_fsdp true \
-    --activation_offload_layers 40
+    --recipe_config scripts/performance/recipe_config.json
 EOM
 )
 
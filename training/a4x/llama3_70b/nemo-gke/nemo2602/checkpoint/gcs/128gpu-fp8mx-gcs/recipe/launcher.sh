@@ -87,6 +87,26 @@ git clone -b core_r0.16.0 https://github.com/NVIDIA/Megatron-LM.git /opt/Megatro
 export HF_TOKEN=${HF_TOKEN}
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
+
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "gb200",
+  "account": "asq_google_com",
+  "partition": "a4xpartition",
+  "model_family_name": "llama",
+  "model_recipe_name": "llama3_70b",
+  "list_config_variants": true,
+  "gpus_per_node": 4,
+  "use_megatron_fsdp": 0,
+  "compute_dtype": "fp8_mx",
+  "tensor_model_parallel_size": 2,
+  "pipeline_model_parallel_size": 4,
+  "virtual_pipeline_model_parallel_size": 5,
+  "global_batch_size": 128,
+  "max_steps": 30
+}
+EOF
+
 cp $CUSTOM_RUN_SCRIPT_PATH scripts/performance/run_script.py
 
 worker_command=$(cat <<- EOM
@@ -114,23 +134,11 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu gb200 \
-    --account asq_google_com --partition a4xpartition \
-    --model_family_name llama \
-    --model_recipe_name llama3_70b \
-    --list_config_variants \
-    --gpus_per_node 4 \
+    --recipe_config scripts/performance/recipe_config.json \
     --num_gpus ${WORLD_SIZE} \
-    --use_megatron_fsdp 0 \
-    --compute_dtype fp8_mx \
-    --tensor_model_parallel_size 2 \
-    --pipeline_model_parallel_size 4 \
-    --virtual_pipeline_model_parallel_size 5 \
-    --global_batch_size 128 \
     ${dataload_args} \
     ${ckpt_load_args} \
     ${ckpt_save_args} \
-    --max_steps 30 \
     -hf $HF_TOKEN
 
 EOM
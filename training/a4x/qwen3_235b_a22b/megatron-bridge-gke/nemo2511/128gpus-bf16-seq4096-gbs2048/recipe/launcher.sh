@@ -66,6 +66,31 @@ git checkout 7695d4acbfac19353d20e456509117efe4733d6b
 
 cp $CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH scripts/performance/
 
+cat > scripts/performance/recipe_config.json << 'EOF'
+{
+  "gpu": "gb200",
+  "model_family_name": "qwen",
+  "model_recipe_name": "qwen3_235b_a22b",
+  "gpus_per_node": 4,
+  "num_gpus": 128,
+  "seq_length": 4096,
+  "compute_dtype": "bf16",
+  "global_batch_size": 2048,
+  "tensor_model_parallel_size": 1,
+  "pipeline_model_parallel_size": 8,
+  "context_parallel_size": 1,
+  "expert_model_parallel_size": 16,
+  "virtual_pipeline_model_parallel_size": 3,
+  "micro_batch_size": 1,
+  "cuda_graph_impl": "transformer_engine",
+  "cuda_graph_scope": "moe_router,moe_preprocess,attn",
+  "max_steps": 30,
+  "launcher_options": {
+    "experiment_name": "{model_recipe_name}_{model_family_name}"
+  }
+}
+EOF
+
 worker_command=$(cat <<- EOM
   if [ "\$RANK" -eq "0" ]; then
     echo "Worker 0 is stalling for a few seconds.." ;
@@ -90,23 +115,7 @@ worker_command=$(cat <<- EOM
     --session-new "nsys-\$RANDOM-\$RANK" \
   nice -10 \
   python scripts/performance/custom_setup_experiment.py \
-    --gpu gb200 \
-    --model_family_name qwen \
-    --model_recipe_name qwen3_235b_a22b \
-    --gpus_per_node 4 \
-    --num_gpus 128 \
-    --seq_length 4096 \
-    --compute_dtype bf16 \
-    --global_batch_size 2048 \
-    --tensor_model_parallel_size 1 \
-    --pipeline_model_parallel_size 8 \
-    --context_parallel_size 1 \
-    --expert_model_parallel_size 16 \
-    --virtual_pipeline_model_parallel_size 3 \
-    --micro_batch_size 1 \
-    --cuda_graph_impl transformer_engine \
-    --cuda_graph_scope moe_router,moe_preprocess,attn \
-    --max_steps 30
+    --recipe_config scripts/performance/recipe_config.json
 
 EOM
 )
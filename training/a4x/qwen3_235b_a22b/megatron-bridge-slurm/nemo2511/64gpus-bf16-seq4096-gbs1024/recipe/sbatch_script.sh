@@ -12,10 +12,18 @@ set -e
 # Recipe is expected to be in "recipe" folder inside current working directory
 RECIPE_DIR="$(pwd)/recipe"
 LAUNCH_SCRIPT="${RECIPE_DIR}/launch_script.sh"
+# The experiment launcher shared by the recipes of the repository. sbatch runs
+# a copy of this script, so it is resolved from the recipe folder, not from $0.
+# Set LAUNCHER_DIR to use a launcher outside of the repository.
+LAUNCHER_DIR="${LAUNCHER_DIR:-${RECIPE_DIR}/../../../../../../../src/utils/experiment_launcher}"
 if [[ ! -f "${LAUNCH_SCRIPT}" ]]; then
     echo "Error: Recipe is not located correctly. The recipe is expected to be in "recipe" folder inside current working directory. We could not find the launch script there." >&2
     exit 1
 fi
+if [[ ! -f "${LAUNCHER_DIR}/custom_setup_experiment.py" ]]; then
+    echo "Error: Could not find the experiment launcher in ${LAUNCHER_DIR}. Set LAUNCHER_DIR to the src/utils/experiment_launcher folder of the repository." >&2
+    exit 1
+fi
 chmod +x "${LAUNCH_SCRIPT}"
 
 # Enroot the image if it is not already enrooted.
@@ -41,14 +49,14 @@ export MASTER_PORT=$master_port
 export ARTIFACT_DIR=/artifacts
 export JOB_NAME=megatron-pretrain-qwen3-235b-a22b
 export JOB_IDENTIFIER=megatron-pretrain-qwen3-235b-a22b
-export CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH=/recipe/custom_setup_experiment.py 
+export CUSTOM_SETUP_EXPERIMENT_SCRIPT_PATH=/experiment_launcher/custom_setup_experiment.py
 
 
 export PMIX_MCA_gds="^ds12"
 export GLOO_SOCKET_IFNAME=enp0s3
 
 srun --container-image="$SQSH_IMAGE_PATH" \
-  --container-mounts="${RECIPE_DIR}:/recipe:mkdir,${ARTIFACT_DIR_HOME}:${ARTIFACT_DIR}:mkdir,/usr/local/gib:/usr/local/gib" \
+  --container-mounts="${RECIPE_DIR}:/recipe:mkdir,${LAUNCHER_DIR}:/experiment_launcher,${ARTIFACT_DIR_HOME}:${ARTIFACT_DIR}:mkdir,/usr/local/gib:/usr/local/gib" \
   --container-workdir=/recipe \
   --container-writable \
   bash -c 'export JOB_COMPLETION_INDEX=$SLURM_NODEID; ./launch_script.sh'